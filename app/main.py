@@ -1,5 +1,8 @@
 import os
-from fastapi import FastAPI, Request
+import time
+import asyncio
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
@@ -10,10 +13,34 @@ import logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
 # Importar routers
-from app.routers import llm, tts, stt, vision
+from app.routers import llm, tts, stt, vision, voice, rag
 
 # Importar funções para inicialização dos modelos TTS
-from app.services.tts import ensure_directories, download_piper_models
+from app.services.tts import ensure_directories
+from app.services.audio_janitor import run_audio_janitor, mark_audio_served
+from app.services.model_registry import run_idle_unloader, MODEL_IDLE_UNLOAD_SECONDS
+from app.services.warmup import create_readiness_tracker, run_warmup
+from app.services.executors import ExecutorSaturated, get_executor_stats, shutdown_executors
+from app.services.metrics import (
+    HTTP_IN_FLIGHT,
+    HTTP_REQUESTS,
+    HTTP_REQUEST_BYTES,
+    HTTP_REQUEST_SECONDS,
+    route_modality,
+    route_template
+)
+from app.services import worker_state
+from app.services.uploads import UploadRejected, UploadLimitMiddleware
+from app.services.tracing import TRACING_ENABLED, start_trace, end_trace
+from app.services.deadlines import RequestCancelled, RequestDeadlineMiddleware
+from app.services.profiling import (
+    finish_profile,
+    is_authorized,
+    list_profiles,
+    new_profile_id,
+    profile_path,
+    try_start_profile
+)
 
 # Criar aplicação FastAPI
 app = FastAPI(
@@ -31,6 +58,105 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Registrar o último acesso aos áudios gerados (usado pelo janitor para remoção LRU)
+@app.middleware("http")
+async def track_audio_access(request: Request, call_next):
+    response = await call_next(request)
+    if request.url.path.startswith("/static/audio/") and response.status_code in (200, 206, 304):
+        mark_audio_served(request.url.path.rsplit("/", 1)[-1])
+    return response
+
+# Uploads acima do limite da rota são recusados durante a recepção do corpo
+app.add_middleware(UploadLimitMiddleware)
+
+# Contagem, latência e requisições em andamento por rota (exportadas em /metrics)
+@app.middleware("http")
+async def collect_http_metrics(request: Request, call_next):
+    if request.url.path == "/metrics":
+        return await call_next(request)
+
+    modality = route_modality(request.url.path)
+    HTTP_IN_FLIGHT.inc(modality=modality)
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        HTTP_IN_FLIGHT.dec(modality=modality)
+        route_path = route_template(request.scope)
+        HTTP_REQUESTS.inc(method=request.method, route=route_path, status=str(status_code))
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method=request.method, route=route_path)
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and request.method in ("POST", "PUT"):
+            HTTP_REQUEST_BYTES.observe(int(content_length), route=route_path)
+
+# Etapas da requisição no cabeçalho Server-Timing e, com X-Profile: <PROFILE_TOKEN>,
+# um perfil por amostragem da requisição salvo para download em /api/profiles
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    profiler = None
+    profile_requested = "x-profile" in request.headers
+    if profile_requested and is_authorized(request.headers["x-profile"]):
+        profiler = try_start_profile()
+    if not TRACING_ENABLED and profiler is None:
+        return await call_next(request)
+
+    trace, token = start_trace()
+    try:
+        response = await call_next(request)
+    except Exception:
+        if profiler is not None:
+            await asyncio.to_thread(finish_profile, profiler, new_profile_id(), request.method, request.url.path)
+        raise
+    finally:
+        end_trace(token)
+
+    # Em respostas em streaming, cobre o trabalho feito até o envio dos cabeçalhos
+    if TRACING_ENABLED:
+        response.headers["Server-Timing"] = trace.server_timing()
+
+    if profiler is not None:
+        # O perfil cobre também o envio do corpo (ex.: NDJSON e SSE)
+        profile_id = new_profile_id()
+        response.headers["X-Profile-Id"] = profile_id
+        body = response.body_iterator
+
+        async def _profiled_body():
+            try:
+                async for chunk in body:
+                    yield chunk
+            finally:
+                await asyncio.to_thread(
+                    finish_profile, profiler, profile_id, request.method, request.url.path, trace.server_timing()
+                )
+
+        response.body_iterator = _profiled_body()
+    elif profile_requested:
+        response.headers["X-Profile-Status"] = "busy" if is_authorized(request.headers["x-profile"]) else "unauthorized"
+    return response
+
+# Prazo da requisição (X-Request-Timeout ou padrão da rota) e detecção de cliente desconectado;
+# registrado por último para envolver todos os outros middlewares
+app.add_middleware(RequestDeadlineMiddleware)
+
+# Fila de inferência cheia: recusar em vez de acumular latência
+@app.exception_handler(ExecutorSaturated)
+async def executor_saturated_handler(request: Request, exc: ExecutorSaturated):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+# Upload recusado pela camada de ingestão (tamanho ou tipo de conteúdo)
+@app.exception_handler(UploadRejected)
+async def upload_rejected_handler(request: Request, exc: UploadRejected):
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
+
+# Requisição abandonada: 504 se o prazo acabou, 499 se o cliente desconectou (ninguém recebe a resposta)
+@app.exception_handler(RequestCancelled)
+async def request_cancelled_handler(request: Request, exc: RequestCancelled):
+    status_code = 499 if exc.reason == "disconnected" else 504
+    return JSONResponse(status_code=status_code, content={"detail": str(exc)})
+
 # Montar arquivos estáticos e configurar templates
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 templates = Jinja2Templates(directory="app/templates")
@@ -40,6 +166,8 @@ app.include_router(llm.router, prefix="/api/llm", tags=["LLM"])
 app.include_router(tts.router, prefix="/api/tts", tags=["TTS"])
 app.include_router(stt.router, prefix="/api/stt", tags=["STT"])
 app.include_router(vision.router, prefix="/api/vision", tags=["Vision"])
+app.include_router(voice.router, prefix="/api/voice", tags=["Voice"])
+app.include_router(rag.router, prefix="/api/rag", tags=["RAG"])
 
 @app.on_event("startup")
 async def startup_event():
@@ -49,11 +177,35 @@ async def startup_event():
     # Garantir que os diretórios necessários existam
     ensure_directories()
     
-    # Baixar modelos TTS se não existirem
-    download_piper_models()
+    # Downloads e aquecimento dos modelos em segundo plano (acompanhados em /ready)
+    app.state.readiness = create_readiness_tracker()
+    app.state.background_tasks = [asyncio.create_task(run_warmup(app.state.readiness))]
+    
+    # Iniciar o janitor de áudio (a primeira varredura recupera sobras de execuções anteriores)
+    app.state.background_tasks.append(asyncio.create_task(run_audio_janitor()))
+    
+    # Descarregar modelos ociosos, se configurado
+    if MODEL_IDLE_UNLOAD_SECONDS > 0:
+        app.state.background_tasks.append(asyncio.create_task(run_idle_unloader()))
+    
+    # Prontidão e executores deste worker, combinados com os dos demais em /ready e /api/executors
+    worker_state.register_section("readiness", app.state.readiness.report)
+    worker_state.register_section("executors", get_executor_stats)
+    if worker_state.is_enabled():
+        app.state.background_tasks.append(asyncio.create_task(worker_state.run_state_publisher()))
     
     logging.info("Aplicação inicializada com sucesso")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Executado no encerramento do aplicativo"""
+    for task in getattr(app.state, "background_tasks", []):
+        task.cancel()
+    shutdown_executors()
+    if worker_state.is_enabled():
+        # Estado final, somado pelo mestre aos totais dos workers encerrados
+        worker_state.publish()
+
 @app.get("/")
 async def root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
@@ -62,6 +214,42 @@ async def root(request: Request):
 async def health():
     return {"status": "ok"}
 
+@app.get("/ready")
+async def ready():
+    """Prontidão por componente (de todos os workers); 503 enquanto o aquecimento não termina"""
+    report = await asyncio.to_thread(worker_state.readiness_report)
+    return JSONResponse(status_code=200 if report["ready"] else 503, content=report)
+
+@app.get("/metrics")
+async def metrics():
+    """Métricas (somadas entre os workers) no formato de exposição de texto do Prometheus"""
+    return PlainTextResponse(await asyncio.to_thread(worker_state.render_metrics), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/executors")
+async def executors_stats():
+    """Fila, jobs em execução e tempos de espera dos executores de inferência (de todos os workers)"""
+    return await asyncio.to_thread(worker_state.executor_stats)
+
+def _require_profile_token(request: Request):
+    token = request.headers.get("x-profile") or request.query_params.get("token")
+    if not is_authorized(token):
+        raise HTTPException(status_code=404, detail="Não encontrado")
+
+@app.get("/api/profiles")
+async def profiles(request: Request):
+    """Perfis salvos (requer o PROFILE_TOKEN no cabeçalho X-Profile ou em ?token=)"""
+    _require_profile_token(request)
+    return {"profiles": list_profiles()}
+
+@app.get("/api/profiles/{profile_id}")
+async def download_profile(profile_id: str, request: Request):
+    """Baixa um perfil no formato folded (flamegraph.pl, speedscope)"""
+    _require_profile_token(request)
+    path = profile_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado")
+    return FileResponse(path, media_type="text/plain", filename=f"{profile_id}.folded")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
@@ -1,11 +1,18 @@
 from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
 import httpx
 import os
 import json
 import asyncio
 
+from app.services.llm import OllamaError, stream_generate
+from app.services.tracing import span
+from app.services.executors import ExecutorSaturated
+from app.services.deadlines import RequestCancelled, guard
+from app.services.rag import build_rag_prompt, retrieve, RAG_TOP_K
+
 router = APIRouter()
 
 class PromptRequest(BaseModel):
@@ -14,10 +21,27 @@ class PromptRequest(BaseModel):
     system_prompt: str = "Você é um assistente útil e amigável."
     max_tokens: int = 1000
     temperature: float = 0.7
+    use_rag: bool = False  # Inserir no prompt os trechos de documentos mais relevantes (ver /api/rag)
+    rag_top_k: int = RAG_TOP_K
 
 class PromptResponse(BaseModel):
     text: str
     model: str
+    sources: Optional[List[Dict[str, Any]]] = None  # Trechos usados, com use_rag
+
+async def _augment_prompt(request: PromptRequest):
+    """Retorna (prompt, trechos usados), com os trechos recuperados se use_rag estiver ativo"""
+    if not request.use_rag:
+        return request.prompt, None
+    try:
+        chunks = await retrieve(request.prompt, top_k=request.rag_top_k)
+    except OllamaError as e:
+        raise HTTPException(status_code=502, detail=f"Erro ao buscar documentos: {str(e)}")
+    sources = [
+        {key: chunk[key] for key in ("document_id", "source", "chunk", "similarity", "text")}
+        for chunk in chunks
+    ]
+    return build_rag_prompt(request.prompt, chunks), sources
 
 @router.post("/generate", response_model=PromptResponse)
 async def generate_text(request: PromptRequest):
@@ -25,21 +49,24 @@ async def generate_text(request: PromptRequest):
     Gera texto usando modelos LLM via Ollama
     """
     try:
+        prompt, sources = await _augment_prompt(request)
         ollama_host = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
         async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                f"{ollama_host}/api/generate",
-                json={
-                    "model": request.model,
-                    "prompt": request.prompt,
-                    "system": request.system_prompt,
-                    "options": {
-                        "temperature": request.temperature,
-                        "num_predict": request.max_tokens
-                    }
-                },
-                headers={"Accept": "application/json"}
-            )
+            # Cancelada (fechando a conexão com o Ollama) se a requisição for abandonada
+            with span("ollama"):
+                response = await guard(client.post(
+                    f"{ollama_host}/api/generate",
+                    json={
+                        "model": request.model,
+                        "prompt": prompt,
+                        "system": request.system_prompt,
+                        "options": {
+                            "temperature": request.temperature,
+                            "num_predict": request.max_tokens
+                        }
+                    },
+                    headers={"Accept": "application/json"}
+                ), "ollama")
             
             if response.status_code != 200:
                 raise HTTPException(status_code=response.status_code, detail="Erro ao chamar o Ollama API")
@@ -64,9 +91,11 @@ async def generate_text(request: PromptRequest):
                             break
             except json.JSONDecodeError as e:
                 # Em caso de erro no parsing JSON, retornar a resposta bruta
-                return PromptResponse(text=f"Erro no parsing JSON: {str(e)}\nResposta bruta: {response.text[:100]}...", model=request.model)
+                return PromptResponse(text=f"Erro no parsing JSON: {str(e)}\nResposta bruta: {response.text[:100]}...", model=request.model, sources=sources)
             
-            return PromptResponse(text=full_response, model=request.model)
+            return PromptResponse(text=full_response, model=request.model, sources=sources)
+    except (HTTPException, ExecutorSaturated, RequestCancelled):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro: {str(e)}")
 
@@ -75,62 +104,32 @@ async def stream_text(request: PromptRequest):
     """
     Gera texto usando modelos LLM via Ollama com streaming
     """
+    # Recuperação antes do streaming: erros ainda podem ser respondidos com o status adequado
+    prompt, sources = await _augment_prompt(request)
+
     async def generate_stream():
         try:
-            ollama_host = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+            if sources is not None:
+                yield f"data: {json.dumps({'sources': sources}, ensure_ascii=False)}\n\n"
+
+            # Enviar apenas a parte da resposta de cada objeto, no formato SSE (Server-Sent Events)
+            async for data in stream_generate(
+                prompt=prompt,
+                model=request.model,
+                system_prompt=request.system_prompt,
+                temperature=request.temperature,
+                max_tokens=request.max_tokens
+            ):
+                if "response" in data:
+                    yield f"data: {json.dumps({'text': data['response'], 'done': data.get('done', False)})}\n\n"
             
-            # Criar um cliente com um timeout maior para streaming
-            async with httpx.AsyncClient(timeout=300.0) as client:
-                # Iniciar a requisição de streaming
-                async with client.stream(
-                    "POST",
-                    f"{ollama_host}/api/generate",
-                    json={
-                        "model": request.model,
-                        "prompt": request.prompt,
-                        "system": request.system_prompt,
-                        "stream": True,  # Ativar streaming
-                        "options": {
-                            "temperature": request.temperature,
-                            "num_predict": request.max_tokens
-                        }
-                    },
-                    headers={"Accept": "application/json"}
-                ) as response:
-                    if response.status_code != 200:
-                        error_detail = await response.text()
-                        error_msg = json.dumps({"error": f"Erro na API Ollama: {error_detail}"})
-                        yield f"data: {error_msg}\n\n"
-                        return
-                    
-                    # Processar cada chunk da resposta
-                    async for chunk in response.aiter_text():
-                        if not chunk.strip():
-                            continue
-                        
-                        try:
-                            # Cada linha é um objeto JSON separado
-                            for line in chunk.strip().split("\n"):
-                                if not line:
-                                    continue
-                                    
-                                data = json.loads(line)
-                                # Enviar apenas a parte da resposta
-                                if "response" in data:
-                                    # Formato SSE (Server-Sent Events)
-                                    # Enviar apenas a parte da resposta atual
-                                    yield f"data: {json.dumps({'text': data['response'], 'done': data.get('done', False)})}\n\n"
-                                    
-                                    # Se a geração foi concluída, finalizar o stream
-                                    if data.get("done", False):
-                                        break
-                                        
-                        except json.JSONDecodeError as e:
-                            yield f"data: {json.dumps({'error': f'Erro no parsing JSON: {str(e)}'})}\n\n"
-                    
-                    # Sinalizar o fim do streaming
-                    yield f"data: {json.dumps({'done': True})}\n\n"
-                    
+            # Sinalizar o fim do streaming
+            yield f"data: {json.dumps({'done': True})}\n\n"
+        except OllamaError as e:
+            yield f"data: {json.dumps({'error': f'Erro na API Ollama: {e.detail}'})}\n\n"
+        except json.JSONDecodeError as e:
+            yield f"data: {json.dumps({'error': f'Erro no parsing JSON: {str(e)}'})}\n\n"
+            yield f"data: {json.dumps({'done': True})}\n\n"
         except Exception as e:
             yield f"data: {json.dumps({'error': f'Erro: {str(e)}'})}\n\n"
             yield f"data: {json.dumps({'done': True})}\n\n"
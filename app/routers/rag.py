@@ -0,0 +1,89 @@
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+import json
+
+from app.services.rag import ingest_documents, retrieve, get_rag_stats, RAG_TOP_K
+from app.services.llm import OllamaError
+from app.services.executors import ExecutorSaturated
+from app.services.deadlines import RequestCancelled
+from app.services.uploads import ingest_upload, TEXT_TYPES, UPLOAD_MAX_TEXT_BYTES
+
+router = APIRouter()
+
+class DocumentIn(BaseModel):
+    text: str
+    source: Optional[str] = None  # Nome exibido nas citações (ex.: nome do arquivo)
+    metadata: Dict[str, Any] = {}
+
+class IngestRequest(BaseModel):
+    documents: List[DocumentIn]
+
+class SearchRequest(BaseModel):
+    query: str
+    top_k: int = RAG_TOP_K
+
+async def _ingest(documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+    try:
+        return await ingest_documents(documents)
+    except (ExecutorSaturated, RequestCancelled):
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OllamaError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro: {str(e)}")
+
+@router.post("/documents")
+async def add_documents(request: IngestRequest):
+    """
+    Indexa documentos de texto: divisão em trechos, embeddings em lote no Ollama e armazenamento
+    """
+    if not request.documents:
+        raise HTTPException(status_code=400, detail="Nenhum documento enviado")
+    return await _ingest([document.model_dump() for document in request.documents])
+
+@router.post("/documents/upload")
+async def upload_document(
+    file: UploadFile = File(...),
+    source: Optional[str] = Form(None),  # Padrão: nome do arquivo
+    metadata: Optional[str] = Form(None)  # Objeto JSON
+):
+    """
+    Indexa um arquivo de texto (.txt ou .md, UTF-8)
+    """
+    try:
+        parsed_metadata = json.loads(metadata) if metadata else {}
+    except json.JSONDecodeError:
+        parsed_metadata = None
+    if not isinstance(parsed_metadata, dict):
+        raise HTTPException(status_code=400, detail="metadata deve ser um objeto JSON")
+
+    stored = await ingest_upload(file, "rag", TEXT_TYPES, UPLOAD_MAX_TEXT_BYTES, spool_bytes=None)
+    try:
+        text = (await stored.read()).decode("utf-8", errors="replace")
+    finally:
+        stored.close()
+    return await _ingest([{"text": text, "source": source or file.filename, "metadata": parsed_metadata}])
+
+@router.post("/search")
+async def search_documents(request: SearchRequest):
+    """
+    Busca os trechos de documentos mais relevantes para a consulta
+    """
+    try:
+        return {"results": await retrieve(request.query, top_k=request.top_k)}
+    except (HTTPException, ExecutorSaturated, RequestCancelled):
+        raise
+    except OllamaError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro: {str(e)}")
+
+@router.get("/stats")
+async def rag_stats():
+    """
+    Trechos indexados, embeddings em cache e estado do índice aproximado
+    """
+    return get_rag_stats()
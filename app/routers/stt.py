@@ -1,13 +1,12 @@
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form
 from pydantic import BaseModel
-import os
-import tempfile
-import shutil
-from pathlib import Path
-import uuid
 
 # Serviço Whisper
 from app.services.stt import transcribe_audio
+from app.services.executors import ExecutorSaturated
+from app.services.deadlines import RequestCancelled
+from app.services.uploads import ingest_upload, AUDIO_TYPES, UPLOAD_MAX_AUDIO_BYTES
+from app.services.tracing import span
 
 router = APIRouter()
 
@@ -25,34 +24,17 @@ async def transcribe_speech(
     """
     Transcreve áudio para texto usando Whisper
     """
+    # Ler o áudio em blocos: tipo pelos bytes iniciais, limite de tamanho e,
+    # se grande, gravação direta em arquivo temporário
+    audio = await ingest_upload(file, "stt", AUDIO_TYPES, UPLOAD_MAX_AUDIO_BYTES)
     try:
-        # Verificar extensão do arquivo
-        allowed_extensions = [".mp3", ".wav", ".ogg", ".flac", ".m4a"]
-        file_extension = os.path.splitext(file.filename)[1].lower()
-        
-        if file_extension not in allowed_extensions:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Tipo de arquivo não suportado. Use: {', '.join(allowed_extensions)}"
-            )
-        
-        # Salvar arquivo temporariamente
-        temp_dir = tempfile.mkdtemp()
-        temp_file_path = os.path.join(temp_dir, f"audio{file_extension}")
-        
-        with open(temp_file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Transcrever áudio
+        # Transcrever áudio (o Whisper lê o arquivo pelo ffmpeg)
         result = await transcribe_audio(
-            audio_path=temp_file_path,
+            audio_path=await audio.as_path(),
             model_name=model,
             language=language
         )
         
-        # Limpar arquivos temporários
-        shutil.rmtree(temp_dir)
-        
         if not result:
             raise HTTPException(status_code=500, detail="Falha na transcrição")
         
@@ -61,11 +43,14 @@ async def transcribe_speech(
             language=result["language"],
             model=model
         )
+    except (HTTPException, ExecutorSaturated, RequestCancelled):
+        raise
     except Exception as e:
-        # Garantir limpeza em caso de erro
-        if 'temp_dir' in locals():
-            shutil.rmtree(temp_dir)
         raise HTTPException(status_code=500, detail=f"Erro: {str(e)}")
+    finally:
+        # Remover o arquivo temporário
+        with span("cleanup"):
+            audio.close()
 
 @router.get("/models")
 async def list_models():
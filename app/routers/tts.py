@@ -1,13 +1,16 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import Response
 from pydantic import BaseModel
 import os
-import tempfile
 import uuid
-from pathlib import Path
+import aiofiles
 
 # Serviços TTS
-from app.services.tts import generate_tts_coqui, generate_tts_piper
+from app.services.tts import synthesize_speech, normalize_audio_format, AUDIO_FORMATS
+from app.services.audio_janitor import AUDIO_DIR, get_audio_storage_stats
+from app.services.executors import ExecutorSaturated
+from app.services.deadlines import RequestCancelled
+from app.services.tracing import span
 
 router = APIRouter()
 
@@ -16,50 +19,59 @@ class TTSRequest(BaseModel):
     voice: str = "pt_br_female"  # Voz padrão
     engine: str = "coqui"  # Engine: coqui ou piper
     speed: float = 1.0
+    format: str = "wav"  # Formato: wav, ogg (Opus), mp3 ou pcm
+    inline: bool = False  # Retornar os bytes do áudio na resposta em vez de uma URL
 
 @router.post("/generate")
-async def generate_speech(request: TTSRequest, background_tasks: BackgroundTasks):
+async def generate_speech(request: TTSRequest):
     """
     Gera áudio a partir de texto usando TTS
     """
     try:
-        # Criar diretório temporário para armazenar áudios
-        os.makedirs("app/static/audio", exist_ok=True)
-        
-        # Gerar nome de arquivo único
-        file_id = str(uuid.uuid4())
-        output_path = f"app/static/audio/{file_id}.wav"
+        # Validar engine e formato
+        if request.engine.lower() not in ("coqui", "piper"):
+            raise HTTPException(status_code=400, detail=f"Engine TTS não suportada: {request.engine}")
         
-        # Selecionar engine apropriada
-        if request.engine.lower() == "coqui":
-            success = await generate_tts_coqui(
-                text=request.text,
-                voice=request.voice,
-                output_path=output_path,
-                speed=request.speed
+        audio_format = normalize_audio_format(request.format)
+        if audio_format is None:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Formato não suportado: {request.format}. Use: {', '.join(AUDIO_FORMATS)}"
             )
-        elif request.engine.lower() == "piper":
-            success = await generate_tts_piper(
-                text=request.text,
-                voice=request.voice,
-                output_path=output_path,
-                speed=request.speed
-            )
-        else:
-            raise HTTPException(status_code=400, detail=f"Engine TTS não suportada: {request.engine}")
         
-        if not success:
+        # Sintetizar e codificar o áudio em memória
+        audio = await synthesize_speech(
+            text=request.text,
+            voice=request.voice,
+            engine=request.engine,
+            speed=request.speed,
+            audio_format=audio_format
+        )
+        
+        if not audio:
             raise HTTPException(status_code=500, detail="Falha ao gerar áudio")
         
-        # Configurar limpeza automática do arquivo após 1 hora
-        background_tasks.add_task(cleanup_file, output_path, delay=3600)
+        # Retornar os bytes diretamente, sem passar pelo disco
+        if request.inline:
+            return Response(content=audio, media_type=AUDIO_FORMATS[audio_format]["media_type"])
+        
+        # Salvar o áudio em um arquivo servido em /static/audio
+        os.makedirs(AUDIO_DIR, exist_ok=True)
+        file_name = f"{uuid.uuid4()}.{AUDIO_FORMATS[audio_format]['extension']}"
+        with span("write"):
+            async with aiofiles.open(os.path.join(AUDIO_DIR, file_name), "wb") as f:
+                await f.write(audio)
         
+        # A remoção do arquivo fica a cargo do janitor de áudio (idade máxima e cota de disco)
         return {
             "success": True,
-            "file_url": f"/static/audio/{file_id}.wav",
+            "file_url": f"/static/audio/{file_name}",
+            "format": audio_format,
             "engine": request.engine,
             "voice": request.voice
         }
+    except (HTTPException, ExecutorSaturated, RequestCancelled):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro: {str(e)}")
 
@@ -83,14 +95,9 @@ async def list_voices():
     
     return voices
 
-async def cleanup_file(file_path: str, delay: int = 3600):
+@router.get("/storage")
+async def audio_storage():
     """
-    Remove um arquivo após um determinado tempo
+    Retorna o uso de disco dos áudios gerados e os contadores de remoção
     """
-    import asyncio
-    await asyncio.sleep(delay)
-    try:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-    except:
-        pass 
\ No newline at end of file
+    return get_audio_storage_stats()
@@ -1,18 +1,41 @@
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import os
-import tempfile
-import shutil
-from pathlib import Path
-import uuid
-from typing import List, Optional
+import json
+import tarfile
+import zipfile
+import itertools
+from typing import List, Optional, Iterator, AsyncIterator, Tuple, Dict, Any, BinaryIO, Union
 
 # Serviços de visão computacional
 from app.services.vision import (
     generate_image_caption,
     extract_image_features,
     classify_image,
-    search_similar_images
+    search_similar_images,
+    search_images_by_text,
+    register_label_set,
+    load_label_sets,
+    caption_images_batch,
+    classify_images_batch,
+    extract_features_batch,
+    get_batching_stats,
+    analyze_image,
+    ANALYSES,
+    VISION_BATCH_SIZE,
+    VISION_MAX_BATCH_SIZE
+)
+from app.services.executors import ExecutorSaturated
+from app.services.deadlines import RequestCancelled
+from app.services.uploads import (
+    ingest_upload,
+    StoredUpload,
+    UploadRejected,
+    ARCHIVE_TYPES,
+    IMAGE_TYPES,
+    UPLOAD_MAX_ARCHIVE_BYTES,
+    UPLOAD_MAX_IMAGE_BYTES
 )
 
 router = APIRouter()
@@ -25,6 +48,122 @@ class ClassificationResponse(BaseModel):
     categories: List[dict]
     model: str
 
+# Extensões das imagens dentro dos arquivos compactados
+IMAGE_EXTENSIONS = [".jpg", ".jpeg", ".png", ".webp"]
+
+def _is_image_name(name: str) -> bool:
+    return os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+def _read_member(stream: BinaryIO, name: str, declared_size: int) -> Union[bytes, Exception]:
+    """
+    Lê um membro do arquivo compactado limitado a UPLOAD_MAX_IMAGE_BYTES
+
+    O tamanho declarado no cabeçalho é checado antes, mas a leitura também para
+    ao passar do limite, pois o cabeçalho pode mentir.
+
+    Returns:
+        Bytes da imagem, ou o erro a reportar para esse item
+    """
+    if declared_size > UPLOAD_MAX_IMAGE_BYTES:
+        return UploadRejected(413, f"Arquivo maior que o limite de {UPLOAD_MAX_IMAGE_BYTES} bytes: {name}")
+    try:
+        data = stream.read(UPLOAD_MAX_IMAGE_BYTES + 1)
+    except (zipfile.BadZipFile, tarfile.TarError, OSError, EOFError) as e:
+        return ValueError(f"Membro corrompido: {name} ({str(e)})")
+    if len(data) > UPLOAD_MAX_IMAGE_BYTES:
+        return UploadRejected(413, f"Arquivo maior que o limite de {UPLOAD_MAX_IMAGE_BYTES} bytes: {name}")
+    return data
+
+def _iter_archive(archive: StoredUpload) -> Iterator[Tuple[str, Union[bytes, Exception]]]:
+    """
+    Percorre as imagens de um arquivo zip ou tar, uma de cada vez, sem extraí-lo
+
+    Membros acima de UPLOAD_MAX_IMAGE_BYTES (ou corrompidos) não são lidos por
+    inteiro: no lugar dos bytes vem o erro, reportado no resultado daquele item.
+    """
+    with archive.open() as f:
+        if archive.kind == "zip":
+            with zipfile.ZipFile(f) as zip_archive:
+                for info in zip_archive.infolist():
+                    if not info.is_dir() and _is_image_name(info.filename):
+                        with zip_archive.open(info) as member:
+                            yield info.filename, _read_member(member, info.filename, info.file_size)
+        else:
+            with tarfile.open(fileobj=f, mode="r:*") as tar_archive:
+                for member in tar_archive:
+                    if member.isfile() and _is_image_name(member.name):
+                        stream = tar_archive.extractfile(member)
+                        yield member.name, _read_member(stream, member.name, member.size)
+
+async def _collect_batch_items(
+    files: Optional[List[UploadFile]],
+    archive: Optional[UploadFile]
+) -> Tuple[Iterator[Tuple[str, Union[bytes, Exception]]], Optional[StoredUpload]]:
+    """
+    Prepara as imagens de uma requisição em lote (multipart e/ou arquivo compactado)
+
+    Returns:
+        (iterador de (nome, bytes ou erro do item), arquivo compactado a fechar ao final ou None)
+    """
+    items = []
+    for upload in files or []:
+        items.append((upload.filename, await _read_image_upload(upload)))
+
+    stored_archive = None
+    archive_items: Iterator[Tuple[str, Union[bytes, Exception]]] = iter(())
+    if archive is not None and archive.filename:
+        # O arquivo compactado é lido durante o streaming da resposta, depois do fim da requisição
+        stored_archive = await ingest_upload(archive, "vision", ARCHIVE_TYPES, UPLOAD_MAX_ARCHIVE_BYTES)
+        archive_items = _iter_archive(stored_archive)
+
+    if not items and stored_archive is None:
+        raise HTTPException(status_code=400, detail="Envie imagens em 'files' ou um arquivo em 'archive'")
+
+    return itertools.chain(items, archive_items), stored_archive
+
+async def _read_image_upload(file: UploadFile) -> bytes:
+    """Lê a imagem enviada para a memória, validando o tipo (pelos bytes iniciais) e o tamanho"""
+    upload = await ingest_upload(file, "vision", IMAGE_TYPES, UPLOAD_MAX_IMAGE_BYTES, spool_bytes=None)
+    return await upload.read()
+
+def _ndjson_response(results: AsyncIterator[Dict[str, Any]], archive: Optional[StoredUpload]) -> StreamingResponse:
+    """Transmite os resultados como NDJSON, removendo o arquivo compactado temporário ao final"""
+    async def _stream():
+        try:
+            async for result in results:
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": f"Erro: {str(e)}"}) + "\n"
+        finally:
+            if archive is not None:
+                archive.close()
+
+    return StreamingResponse(_stream(), media_type="application/x-ndjson")
+
+class TextSearchRequest(BaseModel):
+    query: str
+    model: str = "clip"
+    top_k: int = 5
+    nprobe: Optional[int] = None  # Listas visitadas pelo índice aproximado
+    exact: bool = False  # Forçar busca exata
+    filters: Optional[Dict[str, Any]] = None  # Igualdade sobre os metadados
+
+def _parse_filters(filters: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Converte o campo de formulário `filters` (objeto JSON) em dicionário"""
+    if not filters:
+        return None
+    try:
+        parsed = json.loads(filters)
+    except json.JSONDecodeError:
+        parsed = None
+    if not isinstance(parsed, dict):
+        raise HTTPException(status_code=400, detail="filters deve ser um objeto JSON")
+    return parsed
+
+class LabelSetRequest(BaseModel):
+    name: str
+    labels: List[str]
+
 class FeatureResponse(BaseModel):
     success: bool
     feature_id: str
@@ -38,33 +177,16 @@ async def get_image_caption(
     """
     Gera uma descrição para a imagem usando BLIP-2
     """
+    # Ler a imagem em memória (decodificada sem passar pelo disco)
+    image_data = await _read_image_upload(file)
+    
     try:
-        # Verificar extensão do arquivo
-        allowed_extensions = [".jpg", ".jpeg", ".png", ".webp"]
-        file_extension = os.path.splitext(file.filename)[1].lower()
-        
-        if file_extension not in allowed_extensions:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Tipo de arquivo não suportado. Use: {', '.join(allowed_extensions)}"
-            )
-        
-        # Salvar arquivo temporariamente
-        temp_dir = tempfile.mkdtemp()
-        temp_file_path = os.path.join(temp_dir, f"image{file_extension}")
-        
-        with open(temp_file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
         # Gerar legenda para a imagem
         caption = await generate_image_caption(
-            image_path=temp_file_path,
+            image=image_data,
             model_name=model
         )
         
-        # Limpar arquivos temporários
-        shutil.rmtree(temp_dir)
-        
         if not caption:
             raise HTTPException(status_code=500, detail="Falha ao gerar legenda")
         
@@ -72,49 +194,50 @@ async def get_image_caption(
             caption=caption,
             model=model
         )
+    except (HTTPException, ExecutorSaturated, RequestCancelled):
+        raise
     except Exception as e:
-        # Garantir limpeza em caso de erro
-        if 'temp_dir' in locals():
-            shutil.rmtree(temp_dir)
         raise HTTPException(status_code=500, detail=f"Erro: {str(e)}")
 
+@router.post("/caption/batch")
+async def caption_batch(
+    files: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+    batch_size: int = Form(VISION_BATCH_SIZE, ge=1, le=VISION_MAX_BATCH_SIZE)
+):
+    """
+    Gera descrições para várias imagens (multipart ou zip/tar), transmitindo um resultado NDJSON por imagem
+    """
+    items, stored_archive = await _collect_batch_items(files, archive)
+    return _ndjson_response(caption_images_batch(items, batch_size=batch_size), stored_archive)
+
 @router.post("/classify", response_model=ClassificationResponse)
 async def classify_image_endpoint(
     file: UploadFile = File(...),
     model: str = Form("clip"),
-    num_categories: int = Form(5)
+    num_categories: int = Form(5),
+    categories: Optional[str] = Form(None),  # Categorias separadas por vírgula
+    label_set: Optional[str] = Form(None)  # Nome de um conjunto de rótulos registrado
 ):
     """
     Classifica uma imagem em categorias usando CLIP
     """
+    if label_set and label_set not in load_label_sets():
+        raise HTTPException(status_code=404, detail=f"Conjunto de rótulos não encontrado: {label_set}")
+    
+    # Ler a imagem em memória (decodificada sem passar pelo disco)
+    image_data = await _read_image_upload(file)
+    
     try:
-        # Verificar extensão do arquivo
-        allowed_extensions = [".jpg", ".jpeg", ".png", ".webp"]
-        file_extension = os.path.splitext(file.filename)[1].lower()
-        
-        if file_extension not in allowed_extensions:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Tipo de arquivo não suportado. Use: {', '.join(allowed_extensions)}"
-            )
-        
-        # Salvar arquivo temporariamente
-        temp_dir = tempfile.mkdtemp()
-        temp_file_path = os.path.join(temp_dir, f"image{file_extension}")
-        
-        with open(temp_file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
         # Classificar a imagem
         categories = await classify_image(
-            image_path=temp_file_path,
+            image=image_data,
             model_name=model,
-            top_k=num_categories
+            top_k=num_categories,
+            categories=[c.strip() for c in categories.split(",") if c.strip()] if categories else None,
+            label_set=label_set
         )
         
-        # Limpar arquivos temporários
-        shutil.rmtree(temp_dir)
-        
         if not categories:
             raise HTTPException(status_code=500, detail="Falha ao classificar imagem")
         
@@ -122,12 +245,113 @@ async def classify_image_endpoint(
             categories=categories,
             model=model
         )
+    except (HTTPException, ExecutorSaturated, RequestCancelled):
+        raise
     except Exception as e:
-        # Garantir limpeza em caso de erro
-        if 'temp_dir' in locals():
-            shutil.rmtree(temp_dir)
         raise HTTPException(status_code=500, detail=f"Erro: {str(e)}")
 
+@router.post("/classify/batch")
+async def classify_batch(
+    files: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+    batch_size: int = Form(VISION_BATCH_SIZE, ge=1, le=VISION_MAX_BATCH_SIZE),
+    num_categories: int = Form(5),
+    categories: Optional[str] = Form(None),  # Categorias separadas por vírgula
+    label_set: Optional[str] = Form(None)  # Nome de um conjunto de rótulos registrado
+):
+    """
+    Classifica várias imagens (multipart ou zip/tar), transmitindo um resultado NDJSON por imagem
+    """
+    if label_set and label_set not in load_label_sets():
+        raise HTTPException(status_code=404, detail=f"Conjunto de rótulos não encontrado: {label_set}")
+    
+    items, stored_archive = await _collect_batch_items(files, archive)
+    results = classify_images_batch(
+        items,
+        batch_size=batch_size,
+        top_k=num_categories,
+        categories=[c.strip() for c in categories.split(",") if c.strip()] if categories else None,
+        label_set=label_set
+    )
+    return _ndjson_response(results, stored_archive)
+
+@router.post("/analyze")
+async def analyze_image_endpoint(
+    image: Optional[UploadFile] = File(None),
+    file: Optional[UploadFile] = File(None),  # Alias de "image", como nos demais endpoints
+    prompt: Optional[str] = Form(None),  # Texto inicial da descrição
+    analyses: str = Form("caption,classify"),  # Análises separadas por vírgula
+    top_k: int = Form(5),
+    categories: Optional[str] = Form(None),  # Categorias separadas por vírgula
+    label_set: Optional[str] = Form(None),  # Nome de um conjunto de rótulos registrado
+    model: str = Form("clip")
+):
+    """
+    Executa várias análises (caption, classify, features, similar) sobre uma única imagem,
+    decodificando-a uma vez e reutilizando o embedding CLIP
+    """
+    upload = image or file
+    if upload is None:
+        raise HTTPException(status_code=400, detail="Envie a imagem no campo 'image'")
+    
+    requested = [name.strip() for name in analyses.split(",") if name.strip()]
+    unknown = [name for name in requested if name not in ANALYSES]
+    if not requested or unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Análises inválidas: {', '.join(unknown) or analyses}. Use: {', '.join(ANALYSES)}"
+        )
+    if label_set and label_set not in load_label_sets():
+        raise HTTPException(status_code=404, detail=f"Conjunto de rótulos não encontrado: {label_set}")
+    
+    # Ler a imagem em memória (decodificada sem passar pelo disco)
+    image_data = await _read_image_upload(upload)
+    
+    try:
+        result = await analyze_image(
+            image=image_data,
+            analyses=requested,
+            prompt=prompt.strip() if prompt and prompt.strip() else None,
+            top_k=top_k,
+            categories=[c.strip() for c in categories.split(",") if c.strip()] if categories else None,
+            label_set=label_set,
+            filename=upload.filename,
+            model_name=model
+        )
+        
+        if result is None:
+            raise HTTPException(status_code=500, detail="Falha ao analisar imagem")
+        
+        result["analyses"] = requested
+        result["model"] = model
+        return result
+    except (HTTPException, ExecutorSaturated, RequestCancelled):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro: {str(e)}")
+
+@router.post("/label-sets")
+async def create_label_set(request: LabelSetRequest):
+    """
+    Registra um conjunto nomeado de rótulos para classificação, persistindo seus embeddings
+    """
+    labels = [label.strip() for label in request.labels if label.strip()]
+    if not request.name.strip() or not labels:
+        raise HTTPException(status_code=400, detail="Informe um nome e ao menos um rótulo")
+    
+    success = await register_label_set(request.name.strip(), labels)
+    if not success:
+        raise HTTPException(status_code=500, detail="Falha ao registrar conjunto de rótulos")
+    
+    return {"success": True, "name": request.name.strip(), "labels": len(labels)}
+
+@router.get("/label-sets")
+async def list_label_sets():
+    """
+    Lista os conjuntos de rótulos registrados
+    """
+    return {name: len(labels) for name, labels in load_label_sets().items()}
+
 @router.post("/extract-features", response_model=FeatureResponse)
 async def extract_features(
     file: UploadFile = File(...),
@@ -136,33 +360,17 @@ async def extract_features(
     """
     Extrai características de uma imagem usando CLIP e armazena para uso posterior
     """
+    # Ler a imagem em memória (decodificada sem passar pelo disco)
+    image_data = await _read_image_upload(file)
+    
     try:
-        # Verificar extensão do arquivo
-        allowed_extensions = [".jpg", ".jpeg", ".png", ".webp"]
-        file_extension = os.path.splitext(file.filename)[1].lower()
-        
-        if file_extension not in allowed_extensions:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Tipo de arquivo não suportado. Use: {', '.join(allowed_extensions)}"
-            )
-        
-        # Salvar arquivo temporariamente
-        temp_dir = tempfile.mkdtemp()
-        temp_file_path = os.path.join(temp_dir, f"image{file_extension}")
-        
-        with open(temp_file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
         # Extrair características da imagem
         feature_id = await extract_image_features(
-            image_path=temp_file_path,
-            model_name=model
+            image=image_data,
+            model_name=model,
+            filename=file.filename
         )
         
-        # Limpar arquivos temporários
-        shutil.rmtree(temp_dir)
-        
         if not feature_id:
             raise HTTPException(status_code=500, detail="Falha ao extrair características")
         
@@ -171,49 +379,52 @@ async def extract_features(
             feature_id=feature_id,
             model=model
         )
+    except (HTTPException, ExecutorSaturated, RequestCancelled):
+        raise
     except Exception as e:
-        # Garantir limpeza em caso de erro
-        if 'temp_dir' in locals():
-            shutil.rmtree(temp_dir)
         raise HTTPException(status_code=500, detail=f"Erro: {str(e)}")
 
+@router.post("/extract-features/batch")
+async def extract_features_batch_endpoint(
+    files: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+    batch_size: int = Form(VISION_BATCH_SIZE, ge=1, le=VISION_MAX_BATCH_SIZE),
+    model: str = Form("clip")
+):
+    """
+    Extrai e armazena características de várias imagens (multipart ou zip/tar), transmitindo um resultado NDJSON por imagem
+    """
+    items, stored_archive = await _collect_batch_items(files, archive)
+    return _ndjson_response(extract_features_batch(items, batch_size=batch_size, model_name=model), stored_archive)
+
 @router.post("/search-similar")
 async def search_similar(
     file: UploadFile = File(...),
     model: str = Form("clip"),
-    top_k: int = Form(5)
+    top_k: int = Form(5),
+    nprobe: Optional[int] = Form(None),  # Listas visitadas pelo índice aproximado
+    exact: bool = Form(False),  # Forçar busca exata
+    filters: Optional[str] = Form(None)  # Objeto JSON com filtros de metadados
 ):
     """
     Busca imagens similares a partir de uma imagem de consulta
     """
+    metadata_filters = _parse_filters(filters)
+    
+    # Ler a imagem em memória (decodificada sem passar pelo disco)
+    image_data = await _read_image_upload(file)
+    
     try:
-        # Verificar extensão do arquivo
-        allowed_extensions = [".jpg", ".jpeg", ".png", ".webp"]
-        file_extension = os.path.splitext(file.filename)[1].lower()
-        
-        if file_extension not in allowed_extensions:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Tipo de arquivo não suportado. Use: {', '.join(allowed_extensions)}"
-            )
-        
-        # Salvar arquivo temporariamente
-        temp_dir = tempfile.mkdtemp()
-        temp_file_path = os.path.join(temp_dir, f"image{file_extension}")
-        
-        with open(temp_file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
         # Buscar imagens similares
         results = await search_similar_images(
-            query_image_path=temp_file_path,
+            query_image=image_data,
             model_name=model,
-            top_k=top_k
+            top_k=top_k,
+            nprobe=nprobe,
+            exact=exact,
+            filters=metadata_filters
         )
         
-        # Limpar arquivos temporários
-        shutil.rmtree(temp_dir)
-        
         if results is None:
             raise HTTPException(status_code=500, detail="Falha ao buscar imagens similares")
         
@@ -221,12 +432,43 @@ async def search_similar(
             "results": results,
             "model": model
         }
+    except (HTTPException, ExecutorSaturated, RequestCancelled):
+        raise
     except Exception as e:
-        # Garantir limpeza em caso de erro
-        if 'temp_dir' in locals():
-            shutil.rmtree(temp_dir)
         raise HTTPException(status_code=500, detail=f"Erro: {str(e)}")
 
+@router.post("/search-text")
+async def search_text(request: TextSearchRequest):
+    """
+    Busca imagens armazenadas a partir de uma descrição em texto
+    """
+    if not request.query.strip():
+        raise HTTPException(status_code=400, detail="Informe um texto de consulta")
+    
+    results = await search_images_by_text(
+        query=request.query,
+        model_name=request.model,
+        top_k=request.top_k,
+        nprobe=request.nprobe,
+        exact=request.exact,
+        filters=request.filters
+    )
+    
+    if results is None:
+        raise HTTPException(status_code=500, detail="Falha ao buscar imagens por texto")
+    
+    return {
+        "results": results,
+        "model": request.model
+    }
+
+@router.get("/stats")
+async def vision_stats():
+    """
+    Métricas do micro-batching do CLIP (tamanhos de lote e espera na fila)
+    """
+    return get_batching_stats()
+
 @router.get("/models")
 async def list_models():
     """
@@ -0,0 +1,281 @@
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from pydantic import BaseModel, ValidationError
+from typing import Any, Dict, Optional
+import os
+import json
+import time
+import asyncio
+import logging
+
+from app.services.stt import transcribe_audio
+from app.services.tts import normalize_audio_format, AUDIO_FORMATS
+from app.services.llm import OllamaError
+from app.services.voice import speak_response, VOICE_FIRST_AUDIO_SECONDS, VOICE_STAGE_SECONDS
+from app.services.executors import ExecutorSaturated
+from app.services.deadlines import Deadline, RequestCancelled, end_deadline, guard, request_timeout, start_deadline
+from app.services.uploads import StoredUpload
+
+router = APIRouter()
+
+# Tamanho máximo do áudio de uma fala
+VOICE_MAX_AUDIO_BYTES = int(os.environ.get("VOICE_MAX_AUDIO_BYTES", str(25 * 1024 * 1024)))
+
+# Contêineres de áudio aceitos na entrada (MediaRecorder grava webm ou ogg)
+INPUT_FORMATS = ["webm", "ogg", "wav", "mp3", "flac", "m4a"]
+
+class VoiceConfig(BaseModel):
+    stt_model: str = "base"  # tiny, base, small, medium, large
+    language: Optional[str] = None  # Código do idioma ou None para auto-detecção
+    input_format: str = "webm"  # Contêiner do áudio enviado
+    model: str = "tinyllama"
+    system_prompt: str = "Você é um assistente de voz útil e amigável. Responda de forma breve."
+    max_tokens: int = 300
+    temperature: float = 0.7
+    voice: str = "pt_BR-16000"
+    engine: str = "piper"  # Piper tem a menor latência por frase
+    speed: float = 1.0
+    format: str = "wav"  # Formato de cada trecho de áudio: wav, ogg, mp3 ou pcm
+
+def _update_config(config: VoiceConfig, fields: Dict[str, Any]) -> VoiceConfig:
+    """Aplica os campos recebidos sobre a configuração da sessão, validando-os"""
+    fields = {key: value for key, value in fields.items() if key != "type"}
+    updated = VoiceConfig(**{**config.model_dump(), **fields})
+    if updated.engine.lower() not in ("coqui", "piper"):
+        raise ValueError(f"Engine TTS não suportada: {updated.engine}")
+    audio_format = normalize_audio_format(updated.format)
+    if audio_format is None:
+        raise ValueError(f"Formato não suportado: {updated.format}. Use: {', '.join(AUDIO_FORMATS)}")
+    if updated.input_format.lower() not in INPUT_FORMATS:
+        raise ValueError(f"Formato de entrada não suportado. Use: {', '.join(INPUT_FORMATS)}")
+    return updated.model_copy(update={"format": audio_format, "input_format": updated.input_format.lower()})
+
+class _Utterance:
+    """Áudio de uma fala recebido em frames binários, acumulado na memória até VOICE_MAX_AUDIO_BYTES"""
+
+    def __init__(self, extension: str):
+        self.extension = extension
+        self.buffer = bytearray()
+
+    def write(self, data: bytes):
+        if len(self.buffer) + len(data) > VOICE_MAX_AUDIO_BYTES:
+            raise ValueError(f"Áudio maior que o limite de {VOICE_MAX_AUDIO_BYTES} bytes")
+        self.buffer += data
+
+    def to_upload(self) -> StoredUpload:
+        """Fala completa; o arquivo para o Whisper só é gravado no turno (as_path)"""
+        return StoredUpload(f"fala.{self.extension}", self.extension, "voice", len(self.buffer), data=bytes(self.buffer))
+
+async def _run_turn(send, config: VoiceConfig, ended_at: float,
+                    audio: Optional[StoredUpload] = None, text: Optional[str] = None):
+    """Transcreve a fala (se houver), gera a resposta e envia o áudio frase a frase"""
+    timings: Dict[str, float] = {}
+    if audio is not None:
+        result = await transcribe_audio(await audio.as_path(), model_name=config.stt_model, language=config.language)
+        timings["stt_ms"] = (time.perf_counter() - ended_at) * 1000
+        VOICE_STAGE_SECONDS.observe(timings["stt_ms"] / 1000, stage="stt")
+        if not result:
+            await send({"type": "error", "detail": "Falha na transcrição"})
+            return
+        text = result["text"].strip()
+        await send({"type": "transcript", "text": text, "language": result["language"]})
+        if not text:
+            await send({"type": "done", "text": "", "timings": timings})
+            return
+
+    first_audio = []
+
+    async def _emit(event: Dict[str, Any], audio: Optional[bytes]):
+        if audio is not None and not first_audio:
+            first_audio.append(time.perf_counter() - ended_at)
+            timings["first_audio_ms"] = first_audio[0] * 1000
+            VOICE_FIRST_AUDIO_SECONDS.observe(first_audio[0])
+        await send(event, audio)
+
+    llm_started = time.perf_counter()
+    response_text = await speak_response(
+        text,
+        _emit,
+        model=config.model,
+        system_prompt=config.system_prompt,
+        temperature=config.temperature,
+        max_tokens=config.max_tokens,
+        voice=config.voice,
+        engine=config.engine.lower(),
+        speed=config.speed,
+        audio_format=config.format
+    )
+    VOICE_STAGE_SECONDS.observe(time.perf_counter() - llm_started, stage="respond")
+    timings["total_ms"] = (time.perf_counter() - ended_at) * 1000
+    await send({"type": "done", "text": response_text, "timings": timings})
+
+async def _turn_task(send, config: VoiceConfig, ended_at: float,
+                     audio: Optional[StoredUpload] = None, text: Optional[str] = None):
+    """
+    Executa um turno em segundo plano, enquanto a sessão continua lendo o socket
+
+    Erros viram eventos "error"; o turno interrompido (nova fala, "cancel" ou
+    desconexão) termina em silêncio, pois a sessão já avisou o cliente.
+    """
+    try:
+        await guard(_run_turn(send, config, ended_at, audio=audio, text=text), "voice_turn")
+    except RequestCancelled as e:
+        if e.reason == "deadline":
+            await _send_error(send, str(e))
+    except (ValueError, ExecutorSaturated, OllamaError) as e:
+        await _send_error(send, str(e))
+    except WebSocketDisconnect:
+        pass  # A sessão cancela o turno ao receber a desconexão
+    except Exception as e:
+        logging.exception("Erro no turno de voz")
+        await _send_error(send, f"Erro: {str(e)}")
+    finally:
+        if audio is not None:
+            audio.close()
+
+async def _send_error(send, detail: str):
+    try:
+        await send({"type": "error", "detail": detail})
+    except Exception:
+        pass  # Cliente já desconectado
+
+class _Turn:
+    """Turno em andamento: a tarefa e o prazo que a cancela"""
+
+    def __init__(self, task: asyncio.Task, deadline: Deadline):
+        self.task = task
+        self.deadline = deadline
+
+    async def cancel(self, reason: str) -> bool:
+        """
+        Cancela o turno e aguarda o seu término
+
+        O prazo cancelado descarta os jobs ainda na fila dos executores.
+
+        Returns:
+            True se o turno ainda estava em andamento
+        """
+        if self.task.done():
+            return False
+        self.deadline.cancel(reason)
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        return True
+
+@router.websocket("/ws")
+async def voice_session(websocket: WebSocket):
+    """
+    Assistente de voz: fala → transcrição → resposta do LLM em streaming → áudio frase a frase
+
+    Cada turno roda em uma tarefa própria, com o prazo de VOICE_REQUEST_TIMEOUT,
+    e a sessão continua lendo o socket: uma nova fala (barge-in), {"type": "cancel"}
+    ou a desconexão cancelam o turno em andamento.
+
+    Mensagens do cliente:
+        {"type": "config", ...}: altera a configuração da sessão (campos de VoiceConfig)
+        frames binários: áudio da fala atual, no contêiner de input_format
+        {"type": "end"}: fim da fala; inicia o turno
+        {"type": "text", "text": "..."}: turno a partir de texto, sem transcrição
+        {"type": "cancel"}: interrompe o turno em andamento
+
+    Mensagens do servidor:
+        {"type": "transcript", "text", "language"}
+        {"type": "token", "text"}: cada trecho gerado pelo LLM
+        {"type": "audio", "index", "text", "format"}, seguida de um frame binário com o áudio da frase
+        {"type": "done", "text", "timings"}: fim do turno (stt_ms, first_audio_ms, total_ms)
+        {"type": "cancelled", "reason"}: turno interrompido ("interrupted" por nova fala, ou "cancelled")
+        {"type": "error", "detail"}
+    """
+    await websocket.accept()
+    config = VoiceConfig()
+    utterance: Optional[_Utterance] = None
+    turn: Optional[_Turn] = None
+    turn_timeout = request_timeout(websocket.scope)
+    send_lock = asyncio.Lock()
+
+    async def send(event: Dict[str, Any], audio: Optional[bytes] = None):
+        # O evento e os bytes do áudio saem juntos, sem intercalar com os tokens
+        async with send_lock:
+            await websocket.send_json(event)
+            if audio is not None:
+                await websocket.send_bytes(audio)
+
+    async def cancel_turn(reason: str):
+        if turn is not None and await turn.cancel(reason):
+            await send({"type": "cancelled", "reason": reason})
+
+    async def start_turn(**kwargs):
+        nonlocal turn
+        await cancel_turn("interrupted")
+        # A tarefa copia o contexto atual, com o prazo do turno
+        deadline, token = start_deadline(turn_timeout)
+        try:
+            task = asyncio.create_task(_turn_task(send, config, time.perf_counter(), **kwargs))
+        finally:
+            end_deadline(token)
+        turn = _Turn(task, deadline)
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+
+            if message.get("bytes") is not None:
+                if utterance is None:
+                    # Nova fala: o usuário interrompe a resposta em andamento
+                    await cancel_turn("interrupted")
+                    utterance = _Utterance(config.input_format)
+                try:
+                    utterance.write(message["bytes"])
+                except ValueError as e:
+                    utterance = None
+                    await send({"type": "error", "detail": str(e)})
+                continue
+
+            try:
+                data = json.loads(message.get("text") or "")
+                if not isinstance(data, dict):
+                    raise ValueError("A mensagem deve ser um objeto JSON")
+            except ValueError as e:
+                await send({"type": "error", "detail": f"Mensagem inválida: {str(e)}"})
+                continue
+
+            kind = data.get("type")
+            try:
+                if kind == "config":
+                    config = _update_config(config, data)
+                    await send({"type": "config", **config.model_dump()})
+                elif kind == "end":
+                    if utterance is None:
+                        await send({"type": "error", "detail": "Nenhum áudio recebido"})
+                        continue
+                    current, utterance = utterance, None
+                    await start_turn(audio=current.to_upload())
+                elif kind == "text":
+                    text = str(data.get("text") or "").strip()
+                    if not text:
+                        await send({"type": "error", "detail": "Texto vazio"})
+                        continue
+                    await start_turn(text=text)
+                elif kind == "cancel":
+                    utterance = None
+                    await cancel_turn("cancelled")
+                else:
+                    await send({"type": "error", "detail": f"Tipo de mensagem desconhecido: {kind}"})
+            except (ValueError, ValidationError) as e:
+                await send({"type": "error", "detail": str(e)})
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        try:
+            await send({"type": "error", "detail": f"Erro: {str(e)}"})
+            await websocket.close(code=1011)
+        except Exception:
+            pass
+    finally:
+        # Desconexão: o turno é abandonado e os jobs na fila dos executores descartados
+        if turn is not None:
+            await turn.cancel("disconnected")
@@ -0,0 +1,310 @@
+"""
+Servidor de produção: pré-carrega os modelos e cria os workers por fork
+
+O processo mestre importa a aplicação, carrega os modelos PyTorch (Whisper,
+CLIP, BLIP) no registro de modelos, congela os objetos no coletor de lixo e
+só então cria os workers com os.fork(). Os pesos ficam em páginas
+compartilhadas (copy-on-write) entre todos os workers: como os modelos estão
+em modo de inferência (eval, sem gradientes) nenhum worker escreve nos
+tensores, e o gc.freeze() evita que a coleta de lixo suje as páginas dos
+objetos carregados.
+
+Sessões do ONNX Runtime (Piper e VISION_BACKEND=onnx) criam pools de threads
+que não sobrevivem ao fork: o mestre apenas baixa e verifica esses artefatos,
+e cada worker os carrega no próprio aquecimento.
+
+Cada worker é um servidor uvicorn sobre o mesmo socket. Com
+SERVE_MAX_REQUESTS, o worker encerra (drenando as requisições em andamento)
+após esse número de requisições e o mestre cria outro no lugar. SIGTERM ou
+SIGINT no mestre encerram os workers com drenagem de até
+SERVE_GRACEFUL_TIMEOUT segundos.
+
+Métricas, prontidão e executores de todos os workers são combinados por
+app.services.worker_state: qualquer worker responde /metrics, /ready e
+/api/executors pela aplicação inteira.
+
+Uso (a partir da raiz do projeto):
+    python -m app.serve --workers 4 --port 8000
+"""
+import os
+import gc
+import sys
+import time
+import random
+import shutil
+import signal
+import socket
+import logging
+import argparse
+import tempfile
+from typing import Dict, List, Optional
+
+from app.services import worker_state
+
+# Número de workers; 0 usa o número de CPUs
+SERVE_WORKERS = int(os.environ.get("SERVE_WORKERS", "0"))
+
+SERVE_HOST = os.environ.get("SERVE_HOST", "0.0.0.0")
+SERVE_PORT = int(os.environ.get("SERVE_PORT", "8000"))
+
+# Componentes carregados no mestre; vazio usa WARMUP_COMPONENTS e VISION_PRELOAD
+SERVE_PRELOAD = os.environ.get("SERVE_PRELOAD", "")
+
+# Reciclagem: requisições por worker (0 desativa) e variação aleatória somada ao limite,
+# para que os workers não reiniciem todos ao mesmo tempo
+SERVE_MAX_REQUESTS = int(os.environ.get("SERVE_MAX_REQUESTS", "0"))
+SERVE_MAX_REQUESTS_JITTER = int(os.environ.get("SERVE_MAX_REQUESTS_JITTER", "0"))
+
+# Tempo máximo (segundos) para drenar as requisições em andamento ao encerrar um worker
+SERVE_GRACEFUL_TIMEOUT = float(os.environ.get("SERVE_GRACEFUL_TIMEOUT", "30"))
+
+# Threads do PyTorch por worker; 0 divide as CPUs entre os workers
+SERVE_TORCH_THREADS = int(os.environ.get("SERVE_TORCH_THREADS", "0"))
+
+def _split(value: str) -> List[str]:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+def _set_torch_threads(threads: int):
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+def preload_models(components: List[str]):
+    """
+    Carrega no processo mestre os modelos que podem ser compartilhados com os workers
+
+    Falhas são apenas registradas: o aquecimento de cada worker tenta de novo
+    e a prontidão (/ready) reflete o resultado.
+    """
+    from app.services import stt, vision
+    from app.services.artifacts import ensure_artifacts_sync
+    from app.services.tts import ensure_directories
+    from app.services.warmup import WHISPER_PRELOAD_MODEL
+
+    # Sem pool de threads do OpenMP antes do fork (as threads não existiriam nos filhos)
+    _set_torch_threads(1)
+
+    for name in components:
+        started = time.monotonic()
+        try:
+            if name == "whisper":
+                stt.get_whisper(WHISPER_PRELOAD_MODEL)
+            elif name in ("clip", "blip"):
+                if vision.VISION_BACKEND == "onnx":
+                    logging.info(f"{name}: backend ONNX, carregado em cada worker")
+                    continue
+                vision.preload_vision_models([name])
+            elif name == "piper":
+                ensure_directories()
+                ensure_artifacts_sync(group="piper")
+                logging.info("piper: artefatos verificados, vozes carregadas em cada worker")
+                continue
+            else:
+                continue
+            logging.info(f"{name} pré-carregado no mestre em {time.monotonic() - started:.2f}s")
+        except Exception as e:
+            logging.error(f"Falha ao pré-carregar {name}: {str(e)}")
+
+def _freeze_for_fork():
+    """Move os objetos já criados para a geração permanente do coletor de lixo"""
+    gc.collect()
+    gc.freeze()
+
+def _bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    """Socket de escuta criado no mestre e herdado por todos os workers"""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+def _run_worker(app, sock: socket.socket, max_requests: Optional[int], graceful_timeout: float,
+                torch_threads: int, log_level: str):
+    """Executa um servidor uvicorn no processo filho até o encerramento ou a reciclagem"""
+    import uvicorn
+
+    # Os tratadores do mestre não valem no worker (o uvicorn instala os seus)
+    for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(signum, signal.SIG_DFL)
+    random.seed()
+    _set_torch_threads(torch_threads)
+
+    config = uvicorn.Config(
+        app,
+        limit_max_requests=max_requests,
+        timeout_graceful_shutdown=graceful_timeout,
+        log_level=log_level,
+    )
+    uvicorn.Server(config).run(sockets=[sock])
+
+class WorkerSupervisor:
+    """
+    Cria os workers por fork, substitui os que terminam e encerra todos com drenagem
+
+    O laço do mestre apenas recolhe os filhos encerrados; os sinais só
+    marcam o pedido de parada.
+    """
+
+    def __init__(self, app, sock: socket.socket, workers: int, max_requests: int = 0,
+                 max_requests_jitter: int = 0, graceful_timeout: float = 30.0,
+                 torch_threads: int = 1, log_level: str = "info"):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.torch_threads = torch_threads
+        self.log_level = log_level
+        self.children: Dict[int, float] = {}
+        self.stopping = False
+
+    def _worker_limit(self) -> Optional[int]:
+        if self.max_requests <= 0:
+            return None
+        return self.max_requests + random.randint(0, max(self.max_requests_jitter, 0))
+
+    def spawn(self):
+        limit = self._worker_limit()
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(self.app, self.sock, limit, self.graceful_timeout, self.torch_threads, self.log_level)
+            except BaseException:
+                logging.exception("Worker encerrado com erro")
+                code = 1
+            finally:
+                # Sem os tratadores de saída herdados do mestre
+                os._exit(code)
+        self.children[pid] = time.monotonic()
+        logging.info(f"Worker {pid} iniciado" + (f" (recicla após {limit} requisições)" if limit else ""))
+
+    def _reap(self) -> List[float]:
+        """Recolhe os workers encerrados, sem bloquear; retorna quanto tempo cada um viveu"""
+        exited = []
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            started = self.children.pop(pid, None)
+            if started is None:
+                continue
+            worker_state.retire_worker(pid)
+            lifetime = time.monotonic() - started
+            exited.append(lifetime)
+            if not self.stopping:
+                logging.info(f"Worker {pid} encerrado (status {os.waitstatus_to_exitcode(status)}) após {lifetime:.0f}s")
+        return exited
+
+    def _request_stop(self, signum, frame):
+        self.stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+
+        for _ in range(self.workers):
+            self.spawn()
+
+        while not self.stopping:
+            for lifetime in self._reap():
+                if self.stopping:
+                    break
+                # Evita um laço de criação se os workers falharem logo ao iniciar
+                if lifetime < 5.0:
+                    time.sleep(1.0)
+                self.spawn()
+            time.sleep(0.5)
+
+        self.shutdown()
+
+    def shutdown(self):
+        """Pede a drenagem a todos os workers e força o encerramento após o prazo"""
+        logging.info(f"Encerrando {len(self.children)} workers (drenagem de até {self.graceful_timeout:.0f}s)...")
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+        # Prazo do uvicorn para drenar, mais o encerramento da aplicação
+        deadline = time.monotonic() + self.graceful_timeout + 10.0
+        while self.children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+
+        for pid in list(self.children):
+            logging.warning(f"Worker {pid} não encerrou no prazo; forçando")
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        self.children.clear()
+        self.sock.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor com modelos pré-carregados e workers por fork")
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS, help="0 usa o número de CPUs")
+    parser.add_argument("--preload", default=SERVE_PRELOAD, help="Componentes carregados no mestre (separados por vírgula)")
+    parser.add_argument("--max-requests", type=int, default=SERVE_MAX_REQUESTS)
+    parser.add_argument("--max-requests-jitter", type=int, default=SERVE_MAX_REQUESTS_JITTER)
+    parser.add_argument("--graceful-timeout", type=float, default=SERVE_GRACEFUL_TIMEOUT)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        sys.exit("app.serve requer os.fork(); use o uvicorn diretamente nesta plataforma")
+
+    cpus = os.cpu_count() or 1
+    workers = args.workers if args.workers > 0 else cpus
+    torch_threads = SERVE_TORCH_THREADS if SERVE_TORCH_THREADS > 0 else max(1, cpus // workers)
+
+    # A importação configura o logging e registra rotas, métricas e executores (criados sob demanda)
+    from app.main import app
+    from app.services.model_registry import MODEL_IDLE_UNLOAD_SECONDS
+    from app.services.vision import VISION_PRELOAD
+    from app.services.warmup import WARMUP_COMPONENTS
+
+    if MODEL_IDLE_UNLOAD_SECONDS > 0:
+        logging.warning(
+            "MODEL_IDLE_UNLOAD_SECONDS > 0: um modelo descarregado e recarregado em um worker "
+            "deixa de ser compartilhado com os demais"
+        )
+
+    # Diretório do estado compartilhado pelos workers (removido no encerramento)
+    state_directory = tempfile.mkdtemp(prefix="ai-agent-workers-")
+    worker_state.enable(state_directory, workers)
+
+    components = _split(args.preload) or _split(WARMUP_COMPONENTS) + _split(VISION_PRELOAD)
+    preload_models(list(dict.fromkeys(components)))
+    _freeze_for_fork()
+
+    sock = _bind_socket(args.host, args.port)
+    logging.info(f"Servindo em {args.host}:{args.port} com {workers} workers ({torch_threads} threads do PyTorch cada)")
+    try:
+        WorkerSupervisor(
+            app,
+            sock,
+            workers,
+            max_requests=args.max_requests,
+            max_requests_jitter=args.max_requests_jitter,
+            graceful_timeout=args.graceful_timeout,
+            torch_threads=torch_threads,
+            log_level=args.log_level,
+        ).run()
+    finally:
+        shutil.rmtree(state_directory, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
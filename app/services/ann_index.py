@@ -0,0 +1,386 @@
+import os
+import json
+import math
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+
+from app.services.file_lock import FileLock
+from app.services.vector_store import VectorStore, top_k_rows
+
+# Configuração do índice aproximado (sobrescrevível por variáveis de ambiente)
+ANN_ENABLED = os.environ.get("ANN_ENABLED", "0") == "1"
+ANN_MIN_TRAIN_SIZE = int(os.environ.get("ANN_MIN_TRAIN_SIZE", "50000"))
+ANN_NLIST = int(os.environ.get("ANN_NLIST", "0"))  # 0 = automático (~4·√N)
+ANN_PQ_M = int(os.environ.get("ANN_PQ_M", "64"))
+ANN_NPROBE = int(os.environ.get("ANN_NPROBE", "16"))
+ANN_RERANK = int(os.environ.get("ANN_RERANK", "200"))
+ANN_TRAIN_SAMPLE = int(os.environ.get("ANN_TRAIN_SAMPLE", "100000"))
+
+# Número de centróides por sub-quantizador (códigos de 8 bits)
+PQ_CENTROIDS = 256
+
+# Linhas processadas por bloco na atribuição e codificação
+_ENCODE_BLOCK_ROWS = 16384
+
+def _nearest_centroids(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Índice do centróide mais próximo (L2) de cada linha de x"""
+    centroid_norms = (centroids * centroids).sum(axis=1)
+    assignments = np.empty(x.shape[0], dtype=np.int64)
+    for start in range(0, x.shape[0], _ENCODE_BLOCK_ROWS):
+        block = x[start:start + _ENCODE_BLOCK_ROWS]
+        # ||x - c||² = ||x||² - 2·x·c + ||c||²; ||x||² não altera o argmin
+        distances = centroid_norms[None, :] - 2.0 * (block @ centroids.T)
+        assignments[start:start + block.shape[0]] = distances.argmin(axis=1)
+    return assignments
+
+def kmeans(x: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """
+    K-means (L2) vetorizado em NumPy
+
+    Args:
+        x: Dados (n, d) em float32
+        k: Número de centróides
+        iterations: Iterações de Lloyd
+        seed: Semente para a inicialização
+
+    Returns:
+        Centróides (k, d) em float32
+    """
+    rng = np.random.default_rng(seed)
+    k = min(k, x.shape[0])
+    centroids = x[rng.choice(x.shape[0], k, replace=False)].astype(np.float32)
+
+    for _ in range(iterations):
+        assignments = _nearest_centroids(x, centroids)
+        counts = np.bincount(assignments, minlength=k).astype(np.float32)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, x)
+
+        # Centróides vazios são reinicializados em pontos aleatórios
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = x[rng.choice(x.shape[0], int(empty.sum()), replace=False)]
+
+    return centroids
+
+def _pq_subspaces(dim: int, m: int) -> int:
+    """Maior número de subespaços ≤ m que divide a dimensão"""
+    m = max(1, min(m, dim))
+    while dim % m:
+        m -= 1
+    return m
+
+class IVFPQIndex:
+    """
+    Índice IVF-PQ em NumPy alinhado às linhas de um VectorStore
+
+    Cada vetor é atribuído a uma lista invertida (k-means grosso) e o resíduo em
+    relação ao centróide é comprimido com product quantization (m bytes por
+    vetor). A busca visita `nprobe` listas, estima o produto interno pelas
+    tabelas de distância (ADC) e reordena os `rerank` melhores candidatos com
+    os vetores exatos do armazenamento.
+
+    Arquivos no diretório:
+        ann.json               parâmetros, geração do treino e número de linhas indexadas
+        ann_quantizer.npz      centróides grossos e codebooks PQ
+        ann_lists.bin          lista (int32) de cada linha, na ordem do VectorStore
+        ann_codes.bin          códigos PQ (uint8 × m) de cada linha
+        ann.lock               trava de escrita entre processos
+
+    Como no VectorStore, vários processos podem usar o mesmo diretório: treino
+    e indexação são serializados pela trava e `refresh` carrega o que os
+    demais processos gravaram.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._file_lock = FileLock(os.path.join(directory, "ann.lock"))
+        self._info_path = os.path.join(directory, "ann.json")
+        self._quantizer_path = os.path.join(directory, "ann_quantizer.npz")
+        self._lists_path = os.path.join(directory, "ann_lists.bin")
+        self._codes_path = os.path.join(directory, "ann_codes.bin")
+
+        self.count = 0
+        self.centroids: Optional[np.ndarray] = None
+        self.codebooks: Optional[np.ndarray] = None
+        self._generation: Optional[str] = None
+        self._list_rows: List[List[np.ndarray]] = []
+        self._list_codes: List[List[np.ndarray]] = []
+
+        self.refresh()
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    @property
+    def nlist(self) -> int:
+        return 0 if self.centroids is None else self.centroids.shape[0]
+
+    @property
+    def m(self) -> int:
+        return 0 if self.codebooks is None else self.codebooks.shape[0]
+
+    def _read_info(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self._info_path) or not os.path.exists(self._quantizer_path):
+            return None
+        with open(self._info_path, "r") as f:
+            return json.load(f)
+
+    def _load(self, info: Dict[str, Any]):
+        """Carrega quantizador e listas de um treino (de outro processo ou de uma execução anterior)"""
+        quantizer = np.load(self._quantizer_path)
+        centroids = quantizer["centroids"]
+        codebooks = quantizer["codebooks"]
+        count, m = info["count"], codebooks.shape[0]
+        lists = np.fromfile(self._lists_path, dtype=np.int32, count=count) if count else np.zeros(0, np.int32)
+        codes = np.fromfile(self._codes_path, dtype=np.uint8, count=count * m) if count else np.zeros(0, np.uint8)
+        if lists.shape[0] < count or codes.shape[0] < count * m:
+            return  # Treino em andamento em outro processo; a próxima leitura tenta de novo
+
+        with self._lock:
+            self.centroids = centroids
+            self.codebooks = codebooks
+            self.count = count
+            self._generation = info.get("generation")
+            self._reset_lists()
+            self._append_to_lists(np.arange(count, dtype=np.int64), lists, codes.reshape(count, m))
+
+    def refresh(self):
+        """Carrega o treino e as linhas indexadas por outros processos desde a última leitura"""
+        info = self._read_info()
+        if info is None:
+            return
+        if not self.trained or info.get("generation") != self._generation:
+            self._load(info)
+            return
+
+        new_rows = info["count"] - self.count
+        if new_rows <= 0:
+            return
+        lists = np.fromfile(self._lists_path, dtype=np.int32, count=new_rows, offset=self.count * 4)
+        codes = np.fromfile(self._codes_path, dtype=np.uint8, count=new_rows * self.m, offset=self.count * self.m)
+        if lists.shape[0] < new_rows or codes.shape[0] < new_rows * self.m:
+            return
+        with self._lock:
+            if self.count + new_rows != info["count"]:
+                return
+            rows = np.arange(self.count, info["count"], dtype=np.int64)
+            self._append_to_lists(rows, lists, codes.reshape(new_rows, self.m))
+            self.count = info["count"]
+
+    @contextmanager
+    def locked(self) -> Iterator["IVFPQIndex"]:
+        """Trava de escrita (entre threads e processos), com o índice recarregado do disco"""
+        with self._file_lock:
+            self.refresh()
+            # Descartar entradas além do contador confirmado (escrita interrompida)
+            for path, row_bytes in ((self._lists_path, 4), (self._codes_path, self.m)):
+                if os.path.exists(path) and os.path.getsize(path) > self.count * row_bytes:
+                    os.truncate(path, self.count * row_bytes)
+            yield self
+
+    def _write_info(self):
+        tmp_path = self._info_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"count": self.count, "nlist": self.nlist, "m": self.m, "generation": self._generation}, f)
+        os.replace(tmp_path, self._info_path)
+
+    def _reset_lists(self):
+        self._list_rows = [[] for _ in range(self.nlist)]
+        self._list_codes = [[] for _ in range(self.nlist)]
+
+    def _append_to_lists(self, rows: np.ndarray, lists: np.ndarray, codes: np.ndarray):
+        order = np.argsort(lists, kind="stable")
+        sorted_lists = lists[order]
+        bounds = np.searchsorted(sorted_lists, np.arange(self.nlist + 1))
+        for list_id in np.unique(sorted_lists):
+            selection = order[bounds[list_id]:bounds[list_id + 1]]
+            self._list_rows[list_id].append(rows[selection])
+            self._list_codes[list_id].append(codes[selection])
+
+            # Compactar listas que acumulam muitos pedaços pequenos
+            if len(self._list_rows[list_id]) > 16:
+                self._list_rows[list_id] = [np.concatenate(self._list_rows[list_id])]
+                self._list_codes[list_id] = [np.concatenate(self._list_codes[list_id])]
+
+    def _encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Retorna (lista, códigos PQ do resíduo) de cada vetor"""
+        lists = _nearest_centroids(vectors, self.centroids)
+        residuals = vectors - self.centroids[lists]
+        dsub = residuals.shape[1] // self.m
+        codes = np.empty((vectors.shape[0], self.m), dtype=np.uint8)
+        for j in range(self.m):
+            codes[:, j] = _nearest_centroids(residuals[:, j * dsub:(j + 1) * dsub], self.codebooks[j])
+        return lists.astype(np.int32), codes
+
+    def train(self, vectors: np.ndarray, nlist: int = ANN_NLIST, m: int = ANN_PQ_M, iterations: int = 10):
+        """
+        Treina o quantizador grosso e os codebooks PQ, descartando listas anteriores
+
+        Args:
+            vectors: Amostra de treino (n, d)
+            nlist: Número de listas invertidas (0 = ~4·√n)
+            m: Número de subespaços PQ (ajustado para dividir a dimensão)
+            iterations: Iterações de k-means
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        n, dim = vectors.shape
+        if nlist <= 0:
+            nlist = int(4 * math.sqrt(n))
+        nlist = max(1, min(nlist, n))
+        m = _pq_subspaces(dim, m)
+        dsub = dim // m
+
+        logging.info(f"Treinando índice IVF-PQ: {n} vetores, nlist={nlist}, m={m}")
+        centroids = kmeans(vectors, nlist, iterations)
+        residuals = vectors - centroids[_nearest_centroids(vectors, centroids)]
+        codebooks = np.stack([
+            kmeans(residuals[:, j * dsub:(j + 1) * dsub], PQ_CENTROIDS, iterations, seed=j + 1)
+            for j in range(m)
+        ])
+        if codebooks.shape[1] < PQ_CENTROIDS:
+            # Amostras pequenas: completar o codebook para manter códigos de 8 bits
+            pad = np.repeat(codebooks[:, :1], PQ_CENTROIDS - codebooks.shape[1], axis=1)
+            codebooks = np.concatenate([codebooks, pad], axis=1)
+
+        with self._file_lock:
+            with self._lock:
+                self.centroids = centroids
+                self.codebooks = codebooks.astype(np.float32)
+                self.count = 0
+                self._generation = uuid.uuid4().hex
+                self._reset_lists()
+            tmp_path = self._quantizer_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(f, centroids=self.centroids, codebooks=self.codebooks)
+            os.replace(tmp_path, self._quantizer_path)
+            open(self._lists_path, "wb").close()
+            open(self._codes_path, "wb").close()
+            self._write_info()
+
+    def add(self, vectors: np.ndarray):
+        """
+        Indexa vetores que correspondem às próximas linhas do VectorStore
+
+        Com vários processos, chame dentro de `locked()` (como faz `sync`), para
+        que as linhas não sejam indexadas por outro processo no meio do caminho.
+        """
+        if not self.trained:
+            raise RuntimeError("Índice ANN não treinado")
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.shape[0] == 0:
+            return
+
+        lists, codes = self._encode(vectors)
+        with self._file_lock:
+            with open(self._lists_path, "ab") as f:
+                f.write(lists.tobytes())
+            with open(self._codes_path, "ab") as f:
+                f.write(codes.tobytes())
+            with self._lock:
+                rows = np.arange(self.count, self.count + vectors.shape[0], dtype=np.int64)
+                self._append_to_lists(rows, lists, codes)
+                self.count += vectors.shape[0]
+            self._write_info()
+
+    def sync(self, store: VectorStore, batch_size: int = _ENCODE_BLOCK_ROWS):
+        """Indexa as linhas do armazenamento que ainda não estão no índice (de qualquer processo)"""
+        with self.locked():
+            total = len(store)
+            while self.count < total:
+                rows = np.arange(self.count, min(self.count + batch_size, total))
+                self.add(store.get_vectors(rows))
+
+    def search(
+        self,
+        query: np.ndarray,
+        top_k: int,
+        store: VectorStore,
+        nprobe: int = ANN_NPROBE,
+        rerank: int = ANN_RERANK
+    ) -> List[Tuple[int, float]]:
+        """
+        Busca aproximada com reordenação exata dos melhores candidatos
+
+        Linhas do armazenamento ainda não indexadas são comparadas por força bruta,
+        então vetores recém-adicionados sempre participam da busca. Chame
+        `refresh` antes para incluir o que outros processos indexaram.
+
+        Returns:
+            Lista de (linha, similaridade) em ordem decrescente
+        """
+        query = np.asarray(query, dtype=np.float32)
+
+        with self._lock:
+            # Escolher as listas mais próximas (menor distância L2 ao centróide)
+            centroid_scores = self.centroids @ query - 0.5 * (self.centroids * self.centroids).sum(axis=1)
+            nprobe = max(1, min(nprobe, self.nlist))
+            probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+
+            row_chunks = []
+            code_chunks = []
+            base_chunks = []
+            for list_id in probes:
+                base = float(self.centroids[list_id] @ query)
+                for rows, codes in zip(self._list_rows[list_id], self._list_codes[list_id]):
+                    row_chunks.append(rows)
+                    code_chunks.append(codes)
+                    base_chunks.append(np.full(rows.shape[0], base, dtype=np.float32))
+            indexed = self.count
+
+        candidates: List[Tuple[int, float]] = []
+        if row_chunks:
+            rows = np.concatenate(row_chunks)
+            codes = np.concatenate(code_chunks)
+
+            # Tabela ADC: produto interno da consulta com cada centróide de cada subespaço
+            dsub = query.shape[0] // self.m
+            lut = np.einsum("jd,jkd->jk", query.reshape(self.m, dsub), self.codebooks)
+            approx = np.concatenate(base_chunks) + lut[np.arange(self.m)[None, :], codes].sum(axis=1)
+            candidates = top_k_rows(approx, max(rerank, top_k), rows)
+
+        # Linhas ainda não indexadas entram por força bruta
+        total = len(store)
+        tail_rows = np.arange(indexed, total, dtype=np.int64)
+        candidate_rows = np.concatenate([
+            np.asarray([row for row, _ in candidates], dtype=np.int64),
+            tail_rows
+        ])
+        if candidate_rows.shape[0] == 0:
+            return []
+
+        exact = store.get_vectors(candidate_rows) @ query
+        return top_k_rows(exact, top_k, candidate_rows)
+
+def ensure_trained(index: IVFPQIndex, store: VectorStore, min_size: int = ANN_MIN_TRAIN_SIZE) -> bool:
+    """
+    Treina o índice com uma amostra do armazenamento quando ele atinge `min_size`
+    linhas e indexa as linhas pendentes
+
+    Função síncrona e potencialmente longa: deve ser executada fora do event loop.
+
+    Returns:
+        True se o índice está treinado ao final
+    """
+    # Com vários processos, apenas um treina; os demais esperam e carregam o resultado
+    with index.locked():
+        total = len(store)
+        if not index.trained:
+            if total < min_size:
+                return False
+            rng = np.random.default_rng(0)
+            sample_rows = np.sort(rng.choice(total, min(total, ANN_TRAIN_SAMPLE), replace=False))
+            index.train(store.get_vectors(sample_rows))
+        index.sync(store)
+    return True
+
+def index_stats(index: IVFPQIndex) -> Dict[str, Any]:
+    index.refresh()
+    return {"trained": index.trained, "indexed": index.count, "nlist": index.nlist, "m": index.m}
@@ -0,0 +1,254 @@
+import os
+import json
+import shutil
+import asyncio
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+# Diretório base dos modelos (independe do diretório de trabalho)
+MODELS_DIR = os.environ.get(
+    "MODELS_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models")
+)
+
+# Manifesto com URL, tamanho, sha256 e diretório de destino de cada artefato
+MODEL_MANIFEST_PATH = os.environ.get("MODEL_MANIFEST_PATH", os.path.join(MODELS_DIR, "manifest.json"))
+
+# Diretório local pré-populado consultado antes da rede (builds offline)
+MODEL_MIRROR_DIR = os.environ.get("MODEL_MIRROR_DIR", "")
+
+# Downloads simultâneos e tamanho dos blocos lidos/gravados
+ARTIFACT_DOWNLOAD_CONCURRENCY = int(os.environ.get("ARTIFACT_DOWNLOAD_CONCURRENCY", "4"))
+ARTIFACT_CHUNK_SIZE = 1024 * 1024
+
+@dataclass
+class Artifact:
+    name: str
+    url: str
+    target_dir: str
+    group: str = ""
+    size: Optional[int] = None
+    sha256: Optional[str] = None
+
+    @property
+    def path(self) -> str:
+        return os.path.join(MODELS_DIR, self.target_dir, self.name)
+
+class ArtifactError(Exception):
+    """Falha ao obter ou verificar um artefato"""
+
+def load_manifest(path: str = MODEL_MANIFEST_PATH) -> List[Artifact]:
+    """Lê os artefatos do manifesto"""
+    with open(path, "r") as f:
+        return [Artifact(**entry) for entry in json.load(f)["artifacts"]]
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(ARTIFACT_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _checksum_record_path(artifact: Artifact) -> str:
+    return artifact.path + ".sha256"
+
+def _expected_checksum(artifact: Artifact) -> Tuple[Optional[int], Optional[str]]:
+    """
+    Tamanho e sha256 esperados: os do manifesto ou, se ele não declara o sha256,
+    os registrados quando o artefato foi obtido (arquivo <destino>.sha256)
+    """
+    if artifact.sha256:
+        return artifact.size, artifact.sha256.lower()
+    try:
+        with open(_checksum_record_path(artifact), "r") as f:
+            digest, size = f.read().split()
+        return int(size), digest
+    except (OSError, ValueError):
+        return artifact.size, None
+
+def verify_artifact(artifact: Artifact, path: Optional[str] = None) -> bool:
+    """
+    Confere tamanho e sha256 do artefato no destino
+
+    Sem sha256 no manifesto nem registro local, o arquivo não pode ser
+    verificado e é considerado inválido (obtido novamente).
+    """
+    path = path or artifact.path
+    if not os.path.isfile(path):
+        return False
+    size, digest = _expected_checksum(artifact)
+    if digest is None:
+        logging.warning(f"Artefato {artifact.name} sem sha256 no manifesto nem registro local")
+        return False
+    if size is not None and os.path.getsize(path) != size:
+        return False
+    return _file_sha256(path) == digest
+
+def _finalize(artifact: Artifact, part_path: str, expected_size: Optional[int] = None):
+    """
+    Verifica o arquivo temporário e o move atomicamente para o destino
+
+    Sem sha256 no manifesto, confere o tamanho informado pelo servidor
+    (`expected_size`) e registra o sha256 obtido, usado nas verificações seguintes.
+    """
+    size = os.path.getsize(part_path)
+    expected_size = artifact.size if artifact.size is not None else expected_size
+    digest = _file_sha256(part_path)
+    if (expected_size is not None and size != expected_size) or (
+        artifact.sha256 and digest != artifact.sha256.lower()
+    ):
+        os.remove(part_path)
+        raise ArtifactError(f"Checksum ou tamanho inválido para {artifact.name}")
+    with open(part_path, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(part_path, artifact.path)
+
+    if not artifact.sha256:
+        logging.warning(
+            f"Manifesto sem sha256 para {artifact.name}; registrado {digest} "
+            f"(preencha com scripts.fetch_models --update-manifest)"
+        )
+        record_path = _checksum_record_path(artifact)
+        with open(record_path + ".tmp", "w") as f:
+            f.write(f"{digest} {size}\n")
+        os.replace(record_path + ".tmp", record_path)
+
+def _copy_from_mirror(artifact: Artifact, mirror_dir: str) -> bool:
+    """Copia o artefato do espelho local, se presente (em <espelho>/<target_dir>/ ou na raiz)"""
+    for candidate in (
+        os.path.join(mirror_dir, artifact.target_dir, artifact.name),
+        os.path.join(mirror_dir, artifact.name),
+    ):
+        if os.path.isfile(candidate):
+            part_path = artifact.path + ".part"
+            shutil.copyfile(candidate, part_path)
+            _finalize(artifact, part_path)
+            logging.info(f"Artefato {artifact.name} copiado do espelho {mirror_dir}")
+            return True
+    return False
+
+async def _download(client: httpx.AsyncClient, artifact: Artifact):
+    """
+    Baixa para <destino>.part, retomando com Range se já houver bytes parciais
+
+    O destino final só aparece após a verificação, por rename atômico.
+    """
+    loop = asyncio.get_event_loop()
+    part_path = artifact.path + ".part"
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if artifact.size is not None and offset > artifact.size:
+        offset = 0
+
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    expected_size = None
+    async with client.stream("GET", artifact.url, headers=headers) as response:
+        if response.status_code == 416:
+            # Parcial já completo (ou inválido): verificar/recomeçar em _finalize
+            offset = os.path.getsize(part_path)
+        else:
+            response.raise_for_status()
+            if offset and response.status_code != 206:
+                logging.info(f"Servidor ignorou Range para {artifact.name}; recomeçando")
+                offset = 0
+            if offset:
+                logging.info(f"Retomando {artifact.name} a partir de {offset} bytes")
+            else:
+                logging.info(f"Baixando {artifact.name}...")
+
+            # Tamanho total informado pelo servidor (detecta downloads truncados sem size no manifesto)
+            content_range = response.headers.get("content-range", "")
+            content_length = response.headers.get("content-length", "")
+            if response.status_code == 206 and content_range.rpartition("/")[2].isdigit():
+                expected_size = int(content_range.rpartition("/")[2])
+            elif response.status_code == 200 and content_length.isdigit() and not response.headers.get("content-encoding"):
+                expected_size = int(content_length)
+
+            with open(part_path, "ab" if offset else "wb") as f:
+                async for chunk in response.aiter_bytes(ARTIFACT_CHUNK_SIZE):
+                    await loop.run_in_executor(None, f.write, chunk)
+
+    await loop.run_in_executor(None, _finalize, artifact, part_path, expected_size)
+    logging.info(f"Artefato {artifact.name} baixado e verificado")
+
+# Um download por destino, mesmo entre event loops diferentes
+_path_locks: Dict[str, threading.Lock] = {}
+_path_locks_guard = threading.Lock()
+
+def _path_lock(path: str) -> threading.Lock:
+    with _path_locks_guard:
+        return _path_locks.setdefault(path, threading.Lock())
+
+async def ensure_artifact(
+    artifact: Artifact,
+    client: httpx.AsyncClient,
+    mirror_dir: str = MODEL_MIRROR_DIR
+) -> str:
+    """Garante que o artefato exista e seja válido, retornando o caminho local"""
+    loop = asyncio.get_event_loop()
+    os.makedirs(os.path.dirname(artifact.path), exist_ok=True)
+
+    # Espera sem bloquear o event loop (e sem deixar o lock preso se cancelada)
+    lock = _path_lock(artifact.path)
+    while not lock.acquire(blocking=False):
+        await asyncio.sleep(0.1)
+    try:
+        if await loop.run_in_executor(None, verify_artifact, artifact):
+            return artifact.path
+        if os.path.exists(artifact.path):
+            logging.warning(f"Artefato {artifact.name} corrompido; obtendo novamente")
+            os.remove(artifact.path)
+
+        if mirror_dir and await loop.run_in_executor(None, _copy_from_mirror, artifact, mirror_dir):
+            return artifact.path
+
+        await _download(client, artifact)
+        return artifact.path
+    finally:
+        lock.release()
+
+async def ensure_artifacts(
+    group: Optional[str] = None,
+    names: Optional[List[str]] = None,
+    mirror_dir: str = MODEL_MIRROR_DIR,
+    concurrency: int = ARTIFACT_DOWNLOAD_CONCURRENCY
+) -> Dict[str, str]:
+    """
+    Obtém em paralelo os artefatos do manifesto (todos, de um grupo ou pelos nomes)
+
+    Returns:
+        Dicionário nome → caminho local
+
+    Raises:
+        ArtifactError: Se algum artefato não puder ser obtido ou verificado
+    """
+    artifacts = [
+        artifact for artifact in load_manifest()
+        if (group is None or artifact.group == group) and (names is None or artifact.name in names)
+    ]
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async with httpx.AsyncClient(follow_redirects=True, timeout=httpx.Timeout(60.0, connect=10.0)) as client:
+        async def _ensure(artifact: Artifact):
+            async with semaphore:
+                return await ensure_artifact(artifact, client, mirror_dir)
+
+        results = await asyncio.gather(*(_ensure(artifact) for artifact in artifacts), return_exceptions=True)
+
+    errors = [
+        f"{artifact.name}: {str(result)}"
+        for artifact, result in zip(artifacts, results) if isinstance(result, Exception)
+    ]
+    if errors:
+        raise ArtifactError("Falha ao obter artefatos: " + "; ".join(errors))
+    return {artifact.name: path for artifact, path in zip(artifacts, results)}
+
+def ensure_artifacts_sync(group: Optional[str] = None, names: Optional[List[str]] = None) -> Dict[str, str]:
+    """
+    Versão síncrona de ensure_artifacts, para threads sem event loop próprio
+    """
+    return asyncio.run(ensure_artifacts(group=group, names=names))
@@ -0,0 +1,158 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, Any, List
+
+from app.services.metrics import CollectedMetric, metrics
+
+# Diretório onde os áudios gerados pelo TTS são servidos
+AUDIO_DIR = "app/static/audio"
+
+# Configuração do janitor (sobrescrevível por variáveis de ambiente)
+AUDIO_MAX_AGE_SECONDS = int(os.environ.get("AUDIO_MAX_AGE_SECONDS", "3600"))
+AUDIO_DISK_QUOTA_MB = float(os.environ.get("AUDIO_DISK_QUOTA_MB", "512"))
+AUDIO_SWEEP_INTERVAL_SECONDS = int(os.environ.get("AUDIO_SWEEP_INTERVAL_SECONDS", "300"))
+
+# Estatísticas da última varredura e contadores acumulados
+_stats: Dict[str, Any] = {
+    "dir_size_bytes": 0,
+    "file_count": 0,
+    "evicted_by_age": 0,
+    "evicted_by_quota": 0,
+    "last_sweep_at": None,
+    "last_sweep_duration_seconds": None,
+}
+
+def mark_audio_served(filename: str):
+    """
+    Registra que um arquivo de áudio foi servido, atualizando seu atime
+
+    O mtime é preservado (marca a criação) e o atime passa a indicar o último
+    acesso, o que sobrevive a reinicializações do processo.
+    """
+    path = os.path.join(AUDIO_DIR, os.path.basename(filename))
+    try:
+        st = os.stat(path)
+        os.utime(path, (time.time(), st.st_mtime))
+    except OSError:
+        pass
+
+def sweep_audio_dir(
+    max_age: float = AUDIO_MAX_AGE_SECONDS,
+    quota_bytes: float = AUDIO_DISK_QUOTA_MB * 1024 * 1024
+) -> Dict[str, Any]:
+    """
+    Remove áudios expirados e aplica a cota total de disco
+
+    Primeiro remove arquivos criados há mais de `max_age` segundos; se o
+    diretório ainda exceder a cota, remove os arquivos servidos há mais tempo
+    (LRU) até ficar abaixo dela.
+
+    Returns:
+        Dict com o tamanho do diretório e as remoções desta varredura
+    """
+    started = time.monotonic()
+    now = time.time()
+    evicted_age = 0
+    evicted_quota = 0
+    entries = []
+
+    try:
+        with os.scandir(AUDIO_DIR) as it:
+            for entry in it:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+
+                if now - st.st_mtime > max_age:
+                    try:
+                        os.remove(entry.path)
+                        evicted_age += 1
+                    except OSError:
+                        pass
+                    continue
+
+                last_used = max(st.st_atime, st.st_mtime)
+                entries.append((last_used, st.st_size, entry.path))
+    except FileNotFoundError:
+        pass
+
+    total = sum(size for _, size, _ in entries)
+
+    # Aplicar cota removendo os menos recentemente servidos primeiro
+    if total > quota_bytes:
+        entries.sort()
+        while entries and total > quota_bytes:
+            _, size, path = entries.pop(0)
+            try:
+                os.remove(path)
+                total -= size
+                evicted_quota += 1
+            except OSError:
+                pass
+
+    _stats["dir_size_bytes"] = total
+    _stats["file_count"] = len(entries)
+    _stats["evicted_by_age"] += evicted_age
+    _stats["evicted_by_quota"] += evicted_quota
+    _stats["last_sweep_at"] = now
+    _stats["last_sweep_duration_seconds"] = time.monotonic() - started
+
+    if evicted_age or evicted_quota:
+        logging.info(
+            f"Janitor de áudio: {evicted_age} expirados e {evicted_quota} por cota removidos, "
+            f"{len(entries)} arquivos restantes ({total / (1024 * 1024):.1f} MB)"
+        )
+
+    return {
+        "dir_size_bytes": total,
+        "file_count": len(entries),
+        "evicted_by_age": evicted_age,
+        "evicted_by_quota": evicted_quota,
+    }
+
+def get_audio_storage_stats() -> Dict[str, Any]:
+    """Retorna o estado atual do diretório de áudio e os contadores do janitor"""
+    return dict(
+        _stats,
+        max_age_seconds=AUDIO_MAX_AGE_SECONDS,
+        quota_bytes=int(AUDIO_DISK_QUOTA_MB * 1024 * 1024),
+        sweep_interval_seconds=AUDIO_SWEEP_INTERVAL_SECONDS,
+    )
+
+def _collect_metrics() -> List[CollectedMetric]:
+    return [
+        CollectedMetric(
+            "audio_dir_bytes", "gauge", "Tamanho do diretório de áudio na última varredura",
+            [({}, _stats["dir_size_bytes"])], aggregate="max"
+        ),
+        CollectedMetric(
+            "audio_dir_files", "gauge", "Arquivos no diretório de áudio na última varredura",
+            [({}, _stats["file_count"])], aggregate="max"
+        ),
+        CollectedMetric(
+            "audio_evicted_total", "counter", "Áudios removidos pelo janitor",
+            [({"reason": "age"}, _stats["evicted_by_age"]), ({"reason": "quota"}, _stats["evicted_by_quota"])]
+        ),
+    ]
+
+metrics.register_collector(_collect_metrics)
+
+async def run_audio_janitor(interval: float = AUDIO_SWEEP_INTERVAL_SECONDS):
+    """
+    Laço único de limpeza do diretório de áudio
+
+    Faz uma varredura imediata (recuperando sobras de execuções anteriores)
+    e depois repete a cada `interval` segundos até ser cancelado.
+    """
+    loop = asyncio.get_event_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, sweep_audio_dir)
+        except Exception as e:
+            logging.error(f"Erro na varredura do diretório de áudio: {str(e)}")
+        await asyncio.sleep(interval)
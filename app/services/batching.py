@@ -0,0 +1,176 @@
+import time
+import asyncio
+import logging
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.services.executors import run_inference
+from app.services.metrics import CollectedMetric, metrics
+from app.services.tracing import detach_trace
+from app.services.deadlines import check_deadline, detach_deadline, guard
+
+# Batchers criados no processo (expostos em /metrics)
+_batchers: List["MicroBatcher"] = []
+
+class MicroBatcher:
+    """
+    Agrupa requisições concorrentes em lotes para uma única passagem do modelo
+
+    Cada chamada a `submit` entra em uma fila; um worker coleta os itens que
+    chegam dentro de `max_wait_ms` a partir do primeiro (ou até `max_batch_size`)
+    e executa `process_batch` uma vez por lote no executor da modalidade
+    (`executor`, ver app.services.executors), devolvendo a cada chamador o
+    seu resultado.
+
+    `process_batch` recebe a lista de itens e deve retornar uma lista de
+    resultados na mesma ordem; uma exceção na posição de um item é repassada
+    apenas ao chamador correspondente.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        process_batch: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 16,
+        max_wait_ms: float = 5.0,
+        executor: Optional[str] = None
+    ):
+        self.name = name
+        self.executor = executor
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+
+        self._pending: List[Tuple[Any, asyncio.Future, float]] = []
+        self._arrived: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # Métricas
+        self._batch_sizes: Counter = Counter()
+        self._items = 0
+        self._batches = 0
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+        self._batch_seconds_total = 0.0
+        _batchers.append(self)
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._arrived = asyncio.Event()
+            self._worker = loop.create_task(self._run())
+
+    async def submit(self, item: Any) -> Any:
+        """
+        Enfileira um item e aguarda o resultado do lote em que ele for processado
+
+        Se a requisição for abandonada antes (prazo ou desconexão), o item é
+        retirado do próximo lote e RequestCancelled é levantada.
+        """
+        check_deadline(f"{self.name}_batch")
+        self._ensure_worker()
+        future = self._loop.create_future()
+        self._pending.append((item, future, time.monotonic()))
+        self._arrived.set()
+        return await guard(future, f"{self.name}_batch")
+
+    async def _wait_arrival(self, timeout: Optional[float] = None) -> bool:
+        self._arrived.clear()
+        try:
+            await asyncio.wait_for(self._arrived.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _collect(self) -> List[Tuple[Any, asyncio.Future, float]]:
+        """Aguarda o primeiro item e a janela de espera (ou o lote cheio)"""
+        while not self._pending:
+            await self._wait_arrival()
+
+        deadline = self._pending[0][2] + self.max_wait
+        while len(self._pending) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not await self._wait_arrival(remaining):
+                break
+
+        batch = self._pending[:self.max_batch_size]
+        del self._pending[:self.max_batch_size]
+        return batch
+
+    async def _run(self):
+        # O worker atende a todas as requisições, não à que o criou
+        detach_trace()
+        detach_deadline()
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+
+            # Descartar itens cujos chamadores já desistiram
+            batch = [entry for entry in batch if not entry[1].done()]
+            if not batch:
+                continue
+
+            started = time.monotonic()
+            waits = [started - enqueued for _, _, enqueued in batch]
+            self._batch_sizes[len(batch)] += 1
+            self._batches += 1
+            self._items += len(batch)
+            self._queue_wait_total += sum(waits)
+            self._queue_wait_max = max(self._queue_wait_max, max(waits))
+
+            try:
+                items = [item for item, _, _ in batch]
+                if self.executor:
+                    results = await run_inference(self.executor, self.process_batch, items)
+                else:
+                    results = await loop.run_in_executor(None, self.process_batch, items)
+                if len(results) != len(batch):
+                    raise RuntimeError(f"{len(results)} resultados para um lote de {len(batch)} itens")
+            except Exception as e:
+                logging.error(f"Erro no lote {self.name}: {str(e)}")
+                results = [e] * len(batch)
+            self._batch_seconds_total += time.monotonic() - started
+
+            for (_, future, _), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        """Tamanhos de lote, espera na fila e tempo de execução acumulados"""
+        return {
+            "name": self.name,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self._batches,
+            "items": self._items,
+            "queue_depth": len(self._pending),
+            "mean_batch_size": self._items / self._batches if self._batches else 0.0,
+            "batch_size_histogram": {str(size): count for size, count in sorted(self._batch_sizes.items())},
+            "queue_wait_seconds_total": self._queue_wait_total,
+            "queue_wait_seconds_max": self._queue_wait_max,
+            "batch_seconds_total": self._batch_seconds_total,
+        }
+
+def _collect_metrics() -> List[CollectedMetric]:
+    stats = [batcher.stats() for batcher in _batchers]
+    def _samples(field: str):
+        return [({"batcher": batcher_stats["name"]}, batcher_stats[field]) for batcher_stats in stats]
+    return [
+        CollectedMetric("batcher_queue_depth", "gauge", "Itens aguardando o próximo lote", _samples("queue_depth")),
+        CollectedMetric("batcher_batches_total", "counter", "Lotes executados", _samples("batches")),
+        CollectedMetric("batcher_items_total", "counter", "Itens processados em lotes", _samples("items")),
+        CollectedMetric(
+            "batcher_queue_wait_seconds_total", "counter", "Espera acumulada dos itens até o lote", _samples("queue_wait_seconds_total")
+        ),
+        CollectedMetric(
+            "batcher_batch_seconds_total", "counter", "Tempo acumulado de execução dos lotes", _samples("batch_seconds_total")
+        ),
+    ]
+
+metrics.register_collector(_collect_metrics)
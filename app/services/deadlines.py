@@ -0,0 +1,220 @@
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from typing import Any, Awaitable, Optional, Tuple
+
+from app.services.metrics import metrics, route_modality
+
+# Prazo padrão (segundos) por modalidade; sobrescrito por <MODALIDADE>_REQUEST_TIMEOUT, 0 desativa
+REQUEST_TIMEOUT_DEFAULTS = {
+    "stt": 300.0,
+    "tts": 120.0,
+    "vision": 120.0,
+    "llm": 300.0,
+    "rag": 600.0,
+    "voice": 120.0,  # Por turno da sessão de voz (WebSocket)
+}
+
+# Prazo enviado pelo cliente, em segundos (ex.: o timeout do seu cliente HTTP), limitado a REQUEST_TIMEOUT_MAX
+REQUEST_TIMEOUT_HEADER = "x-request-timeout"
+REQUEST_TIMEOUT_MAX = float(os.environ.get("REQUEST_TIMEOUT_MAX", "3600"))
+
+ABANDONED_WORK = metrics.counter(
+    "abandoned_work_total",
+    "Trabalho descartado por prazo esgotado ou cliente desconectado, por etapa",
+    ("stage", "reason")
+)
+
+class RequestCancelled(Exception):
+    """O prazo da requisição acabou ou o cliente desconectou; o trabalho restante é descartado"""
+
+    def __init__(self, reason: str, stage: str):
+        super().__init__(reason, stage)
+        self.reason = reason
+        self.stage = stage
+
+    def __str__(self) -> str:
+        if self.reason == "disconnected":
+            return f"Cliente desconectado (etapa {self.stage})"
+        if self.reason != "deadline":
+            return f"Requisição cancelada: {self.reason} (etapa {self.stage})"
+        return f"Prazo da requisição esgotado (etapa {self.stage})"
+
+class Deadline:
+    """
+    Prazo de uma requisição e sinal de cancelamento (cliente desconectado)
+
+    Consultado no event loop e nas threads dos executores, que recebem o
+    contexto da requisição (ver app.services.executors).
+    """
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.expires_at = time.monotonic() + seconds if seconds else None
+        self.reason: Optional[str] = None
+        self._cancelled = threading.Event()
+        self._cancelled_async: Optional[asyncio.Event] = None
+
+    def remaining(self) -> Optional[float]:
+        """Segundos restantes, ou None se não houver prazo"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def done(self) -> bool:
+        """True se o cliente desconectou ou o prazo acabou"""
+        if self._cancelled.is_set():
+            return True
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def cancel(self, reason: str = "disconnected"):
+        """Marca a requisição como abandonada (chamado no event loop)"""
+        if self._cancelled.is_set():
+            return
+        self.reason = reason
+        self._cancelled.set()
+        if self._cancelled_async is not None:
+            self._cancelled_async.set()
+
+    def abandon(self, stage: str) -> RequestCancelled:
+        """Registra o trabalho descartado na etapa e retorna a exceção a levantar"""
+        reason = self.reason if self._cancelled.is_set() else "deadline"
+        ABANDONED_WORK.inc(stage=stage, reason=reason)
+        return RequestCancelled(reason, stage)
+
+    async def wait(self, future: asyncio.Future) -> bool:
+        """
+        Aguarda o future até o fim do prazo ou a desconexão, sem cancelá-lo
+
+        Returns:
+            True se o future terminou, False se a requisição foi abandonada antes
+        """
+        if future.done():
+            return True
+        if self.done():
+            return False
+        if self._cancelled_async is None:
+            self._cancelled_async = asyncio.Event()
+        cancelled = asyncio.ensure_future(self._cancelled_async.wait())
+        try:
+            done, _ = await asyncio.wait(
+                {future, cancelled}, timeout=self.remaining(), return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            cancelled.cancel()
+        return future in done
+
+_current_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("request_deadline", default=None)
+
+def start_deadline(seconds: Optional[float] = None) -> Tuple[Deadline, contextvars.Token]:
+    """Associa um prazo à requisição no contexto atual"""
+    deadline = Deadline(seconds)
+    return deadline, _current_deadline.set(deadline)
+
+def end_deadline(token: contextvars.Token):
+    _current_deadline.reset(token)
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+def detach_deadline():
+    """Desassocia a tarefa atual da requisição que a criou (ver tracing.detach_trace)"""
+    _current_deadline.set(None)
+
+def check_deadline(stage: str):
+    """
+    Levanta RequestCancelled se a requisição atual foi abandonada
+
+    Chamado entre etapas ou segmentos de trabalhos longos; sem efeito fora de
+    uma requisição.
+    """
+    deadline = _current_deadline.get()
+    if deadline is not None and deadline.done():
+        raise deadline.abandon(stage)
+
+async def guard(awaitable: Awaitable[Any], stage: str) -> Any:
+    """
+    Aguarda `awaitable`, cancelando-o se o prazo acabar ou o cliente desconectar
+
+    Raises:
+        RequestCancelled: Se a requisição for abandonada antes do término
+    """
+    future = asyncio.ensure_future(awaitable)
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return await future
+    try:
+        finished = await deadline.wait(future)
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    if not finished:
+        future.cancel()
+        raise deadline.abandon(stage)
+    return future.result()
+
+def request_timeout(scope: dict) -> Optional[float]:
+    """Prazo da requisição: cabeçalho X-Request-Timeout ou padrão da modalidade (None sem prazo)"""
+    for name, value in scope.get("headers", []):
+        if name.decode("latin-1").lower() == REQUEST_TIMEOUT_HEADER:
+            try:
+                seconds = float(value.decode("latin-1"))
+            except ValueError:
+                break
+            if seconds > 0:
+                return min(seconds, REQUEST_TIMEOUT_MAX)
+            break
+
+    path = scope.get("path", "")
+    # Rotas em lote transmitem resultados por muito tempo: sem prazo padrão (a desconexão ainda interrompe)
+    if path.endswith("/batch"):
+        return None
+    modality = route_modality(path)
+    if modality not in REQUEST_TIMEOUT_DEFAULTS:
+        return None
+    seconds = float(os.environ.get(f"{modality.upper()}_REQUEST_TIMEOUT", REQUEST_TIMEOUT_DEFAULTS[modality]))
+    return seconds if seconds > 0 else None
+
+class RequestDeadlineMiddleware:
+    """
+    Middleware ASGI que associa um prazo a cada requisição HTTP e detecta a desconexão do cliente
+
+    Depois que a aplicação lê o corpo inteiro, uma tarefa aguarda a próxima
+    mensagem do servidor, que só chega quando o cliente desconecta ou a
+    resposta termina; na desconexão, o prazo é cancelado.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        deadline, token = start_deadline(request_timeout(scope))
+        watcher: Optional[asyncio.Task] = None
+
+        async def _watch_disconnect():
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    deadline.cancel("disconnected")
+                    return
+
+        async def _receive():
+            nonlocal watcher
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                deadline.cancel("disconnected")
+            elif watcher is None and not message.get("more_body", False):
+                watcher = asyncio.create_task(_watch_disconnect())
+            return message
+
+        try:
+            await self.app(scope, _receive, send)
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+            end_deadline(token)
@@ -0,0 +1,284 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+from app.services.metrics import CollectedMetric, metrics
+from app.services.tracing import record_span
+from app.services.deadlines import RequestCancelled, check_deadline, current_deadline
+
+# Configuração padrão de cada modalidade: (workers, fila, threads do PyTorch por worker)
+# Sobrescrita por <MODALIDADE>_WORKERS, <MODALIDADE>_QUEUE, <MODALIDADE>_TORCH_THREADS
+# e <MODALIDADE>_EXECUTOR (thread ou process), ex.: STT_WORKERS=2, STT_EXECUTOR=process.
+# "vision" executa o trabalho de CPU da visão fora dos modelos (decodificação, hash,
+# armazenamento e busca vetorial).
+EXECUTOR_DEFAULTS = {
+    "stt": (1, 8, 0),
+    "tts": (2, 16, 0),
+    "caption": (1, 16, 0),
+    "clip": (1, 32, 0),
+    "rag": (2, 32, 0),
+    "vision": (4, 64, 0),
+}
+
+# Modalidades cujos jobs são funções de módulo (serializáveis) e podem rodar em processos
+PROCESS_CAPABLE = {"stt", "tts"}
+
+class ExecutorSaturated(Exception):
+    """A fila do executor da modalidade está cheia; a requisição deve ser recusada (503)"""
+
+    def __init__(self, name: str, limit: int):
+        super().__init__(f"Executor {name} saturado ({limit} jobs na fila)")
+        self.name = name
+        self.limit = limit
+
+def _init_worker(torch_threads: int):
+    """
+    Inicializa um processo do pool, limitando as threads do PyTorch
+
+    Apenas em pools de processos: torch.set_num_threads vale para o processo
+    inteiro, então em pools de threads o número é o do processo (definido por
+    app.serve com SERVE_TORCH_THREADS).
+    """
+    if torch_threads <= 0:
+        return
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+    except ImportError:
+        pass
+
+def _timed_call(function: Callable, *args) -> Tuple[float, float, Any]:
+    """Executa o job registrando início e fim (relógio de parede, válido entre processos)"""
+    started = time.time()
+    result = function(*args)
+    return started, time.time(), result
+
+def _checked_call(stage: str, function: Callable, *args) -> Tuple[float, float, Any]:
+    """Descarta o job se a requisição foi abandonada enquanto ele esperava na fila"""
+    check_deadline(stage)
+    return _timed_call(function, *args)
+
+class InferenceExecutor:
+    """
+    Pool de threads (ou de processos) dedicado a uma modalidade, com fila limitada
+
+    No máximo `max_workers` jobs executam ao mesmo tempo e no máximo
+    `max_queue` aguardam; além disso `run` levanta ExecutorSaturated em vez
+    de enfileirar. Em pools de threads o contexto (contextvars) do chamador é
+    propagado para o job.
+
+    Jobs de requisições abandonadas (prazo esgotado ou cliente desconectado,
+    ver app.services.deadlines) ainda na fila são descartados sem executar;
+    jobs já em execução terminam normalmente.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_workers: int = 1,
+        max_queue: int = 16,
+        torch_threads: int = 0,
+        kind: str = "thread"
+    ):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.kind = kind
+        # Threads do PyTorch por worker só existem em pools de processos
+        self.torch_threads = torch_threads if kind == "process" else 0
+
+        if kind == "process":
+            self._executor: Executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=_init_worker,
+                initargs=(torch_threads,)
+            )
+        else:
+            if torch_threads > 0:
+                logging.warning(
+                    f"{name.upper()}_TORCH_THREADS ignorado: o executor {name} usa threads, "
+                    "que compartilham o número de threads do PyTorch do processo"
+                )
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix=f"{name}-worker"
+            )
+
+        # Métricas
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._running = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._abandoned = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._run_total = 0.0
+
+    async def run(self, function: Callable, *args) -> Any:
+        """
+        Executa `function(*args)` no pool e retorna o resultado
+
+        Raises:
+            ExecutorSaturated: Se já houver max_workers + max_queue jobs pendentes
+            RequestCancelled: Se a requisição for abandonada antes do início do job
+        """
+        deadline = current_deadline()
+        if deadline is not None and deadline.done():
+            with self._lock:
+                self._abandoned += 1
+            raise deadline.abandon(f"{self.name}_queue")
+
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise ExecutorSaturated(self.name, self.max_queue)
+            self._in_flight += 1
+            self._submitted += 1
+
+        enqueued = time.time()
+        enqueued_perf = time.perf_counter()
+        try:
+            if self.kind == "process":
+                job = self._executor.submit(_timed_call, function, *args)
+            else:
+                context = contextvars.copy_context()
+                job = self._executor.submit(self._run_in_thread, context, function, args)
+            future = asyncio.wrap_future(job)
+            if deadline is not None and not await deadline.wait(future) and job.cancel():
+                # Ainda na fila: descartado sem executar (um job já iniciado é aguardado até o fim)
+                raise deadline.abandon(f"{self.name}_queue")
+            started, finished, result = await future
+        except RequestCancelled:
+            with self._lock:
+                self._abandoned += 1
+            raise
+        except Exception:
+            with self._lock:
+                self._failed += 1
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+        with self._lock:
+            self._completed += 1
+            wait = max(0.0, started - enqueued)
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            self._run_total += finished - started
+
+        # Espera na fila e execução como etapas da requisição (Server-Timing)
+        record_span(f"{self.name}_queue", enqueued_perf, wait)
+        record_span(f"{self.name}_job", enqueued_perf + wait, finished - started)
+        return result
+
+    def _run_in_thread(self, context: contextvars.Context, function: Callable, args: tuple):
+        with self._lock:
+            self._running += 1
+        try:
+            return context.run(_checked_call, f"{self.name}_queue", function, *args)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Profundidade da fila, jobs em execução e tempos acumulados"""
+        with self._lock:
+            # Em pools de processos não há como observar o início do job no pai
+            running = self._running if self.kind == "thread" else min(self._in_flight, self.max_workers)
+            return {
+                "name": self.name,
+                "kind": self.kind,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "torch_threads": self.torch_threads,
+                "running": running,
+                "queue_depth": self._in_flight - running,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "abandoned": self._abandoned,
+                "queue_wait_seconds_total": self._wait_total,
+                "queue_wait_seconds_max": self._wait_max,
+                "run_seconds_total": self._run_total,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+_executors: Dict[str, InferenceExecutor] = {}
+_executors_lock = threading.Lock()
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, str(default)))
+
+def get_executor(name: str) -> InferenceExecutor:
+    """Retorna o executor da modalidade (stt, tts, caption, clip, rag, vision), criando-o na primeira chamada"""
+    executor = _executors.get(name)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                workers, queue, torch_threads = EXECUTOR_DEFAULTS[name]
+                prefix = name.upper()
+                kind = os.environ.get(f"{prefix}_EXECUTOR", "thread")
+                if kind == "process" and name not in PROCESS_CAPABLE:
+                    logging.warning(f"Executor {name} não suporta processos; usando threads")
+                    kind = "thread"
+                executor = InferenceExecutor(
+                    name,
+                    max_workers=_env_int(f"{prefix}_WORKERS", workers),
+                    max_queue=_env_int(f"{prefix}_QUEUE", queue),
+                    torch_threads=_env_int(f"{prefix}_TORCH_THREADS", torch_threads),
+                    kind=kind
+                )
+                _executors[name] = executor
+    return executor
+
+async def run_inference(name: str, function: Callable, *args) -> Any:
+    """Atalho para `get_executor(name).run(function, *args)`"""
+    return await get_executor(name).run(function, *args)
+
+def get_executor_stats() -> Dict[str, Any]:
+    """Métricas de todos os executores já criados"""
+    return {name: executor.stats() for name, executor in list(_executors.items())}
+
+def shutdown_executors():
+    """Encerra os pools, cancelando jobs que ainda não começaram"""
+    with _executors_lock:
+        for executor in _executors.values():
+            executor.shutdown()
+        _executors.clear()
+
+def _collect_metrics() -> List[CollectedMetric]:
+    stats = get_executor_stats()
+    def _samples(field: str):
+        return [({"executor": name}, executor_stats[field]) for name, executor_stats in stats.items()]
+    return [
+        CollectedMetric("executor_queue_depth", "gauge", "Jobs aguardando na fila do executor", _samples("queue_depth")),
+        CollectedMetric("executor_running", "gauge", "Jobs em execução no executor", _samples("running")),
+        CollectedMetric("executor_workers", "gauge", "Workers do executor", _samples("max_workers")),
+        CollectedMetric("executor_jobs_completed_total", "counter", "Jobs concluídos", _samples("completed")),
+        CollectedMetric("executor_jobs_failed_total", "counter", "Jobs que levantaram exceção", _samples("failed")),
+        CollectedMetric("executor_jobs_rejected_total", "counter", "Jobs recusados por fila cheia (503)", _samples("rejected")),
+        CollectedMetric(
+            "executor_jobs_abandoned_total", "counter", "Jobs descartados antes de executar (requisição abandonada)", _samples("abandoned")
+        ),
+        CollectedMetric(
+            "executor_queue_wait_seconds_total", "counter", "Tempo acumulado de espera na fila", _samples("queue_wait_seconds_total")
+        ),
+        CollectedMetric(
+            "executor_run_seconds_total", "counter", "Tempo acumulado de execução dos jobs", _samples("run_seconds_total")
+        ),
+    ]
+
+metrics.register_collector(_collect_metrics)
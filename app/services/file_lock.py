@@ -0,0 +1,80 @@
+import os
+import threading
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Sem flock (Windows): apenas a trava entre threads
+    fcntl = None
+
+class LockBusy(RuntimeError):
+    """Trava mantida por outro processo (aquisição sem bloqueio)"""
+
+class FileLock:
+    """
+    Trava exclusiva entre threads e processos, com fcntl.flock sobre um arquivo
+
+    Reentrante na mesma thread. O arquivo é aberto a cada aquisição, e não
+    herdado, então a trava também separa os workers criados por fork.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd: Optional[int] = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if not self._lock.acquire(blocking):
+            return False
+        if self._depth == 0 and fcntl is not None:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BaseException as e:
+                os.close(fd)
+                self._lock.release()
+                if isinstance(e, BlockingIOError):
+                    return False
+                raise
+            self._fd = fd
+        self._depth += 1
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fd, self._fd = self._fd, None
+            os.close(fd)  # Fechar o descritor libera o flock
+        self._lock.release()
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+def claim(path: str, exclusive: bool = False) -> Optional[int]:
+    """
+    Marca um recurso como em uso por este processo até o seu fim
+
+    Processos que apenas usam o recurso (os workers do servidor) tomam a trava
+    compartilhada; ferramentas que exigem acesso exclusivo (ex.: migração),
+    a exclusiva. Nenhuma das duas espera.
+
+    Returns:
+        Descritor que mantém a trava (None sem flock); deve ficar aberto
+
+    Raises:
+        LockBusy: Se outro processo mantém uma trava incompatível
+    """
+    if fcntl is None:
+        return None
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        raise LockBusy(f"Recurso em uso por outro processo: {path}")
+    return fd
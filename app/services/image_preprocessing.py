@@ -0,0 +1,126 @@
+import io
+import os
+from typing import Any, Optional, Sequence, Union
+import numpy as np
+
+# Limite de pixels por imagem (proteção contra decompression bombs)
+VISION_MAX_IMAGE_PIXELS = int(os.environ.get("VISION_MAX_IMAGE_PIXELS", str(40_000_000)))
+
+# Modos aceitos por `Image.reduce`; os demais (P, 1, I;16...) são convertidos para RGB antes
+_REDUCE_MODES = ("L", "LA", "RGB", "RGBA", "CMYK", "I", "F")
+
+def decode_image(source: Union[str, bytes], target_size: Optional[int] = None):
+    """
+    Decodifica uma imagem (caminho ou bytes) em RGB, já perto da resolução alvo
+
+    Para JPEG usa o modo draft do PIL, que decodifica diretamente em 1/2, 1/4
+    ou 1/8 da resolução; para os demais formatos usa `Image.reduce`. Em ambos
+    os casos o menor lado continua ≥ `target_size`, então o redimensionamento
+    final do modelo não perde qualidade.
+
+    Args:
+        source: Caminho do arquivo ou bytes da imagem
+        target_size: Menor lado desejado (None decodifica em resolução total)
+
+    Returns:
+        Imagem PIL em RGB
+
+    Raises:
+        ValueError: Se a imagem exceder VISION_MAX_IMAGE_PIXELS
+    """
+    from PIL import Image
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    image = Image.open(source)
+
+    # Apenas o cabeçalho foi lido até aqui: checar o tamanho antes de decodificar
+    width, height = image.size
+    if width * height > VISION_MAX_IMAGE_PIXELS:
+        raise ValueError(
+            f"Imagem muito grande: {width}x{height} excede o limite de {VISION_MAX_IMAGE_PIXELS} pixels"
+        )
+
+    if target_size:
+        if image.format == "JPEG":
+            image.draft("RGB", (target_size, target_size))
+        else:
+            factor = min(image.size) // target_size
+            if factor >= 2:
+                if image.mode not in _REDUCE_MODES:
+                    image = image.convert("RGB")
+                image = image.reduce(factor)
+
+    return image.convert("RGB")
+
+def resize_shortest_edge(image, size: int, resample: Optional[int] = None):
+    """Redimensiona mantendo a proporção para que o menor lado tenha `size` pixels"""
+    from PIL import Image
+
+    width, height = image.size
+    if min(width, height) == size:
+        return image
+    scale = size / min(width, height)
+    new_size = (max(size, round(width * scale)), max(size, round(height * scale)))
+    return image.resize(new_size, resample if resample is not None else Image.BICUBIC)
+
+def center_crop(image, height: int, width: int):
+    """Recorta o centro da imagem no tamanho indicado"""
+    image_width, image_height = image.size
+    left = (image_width - width) // 2
+    top = (image_height - height) // 2
+    return image.crop((left, top, left + width, top + height))
+
+def to_pixel_values(
+    images: Sequence[Any],
+    mean: Sequence[float],
+    std: Sequence[float]
+) -> np.ndarray:
+    """
+    Empilha imagens do mesmo tamanho e normaliza o lote de uma vez
+
+    Returns:
+        Array (n, 3, h, w) em float32, no layout esperado pelos modelos
+    """
+    batch = np.stack([np.asarray(image, dtype=np.uint8) for image in images])
+    scale = 1.0 / (255.0 * np.asarray(std, dtype=np.float32))
+    offset = np.asarray(mean, dtype=np.float32) / np.asarray(std, dtype=np.float32)
+    pixels = batch.astype(np.float32) * scale - offset
+    return np.ascontiguousarray(pixels.transpose(0, 3, 1, 2))
+
+def preprocess_clip(images: Sequence[Any], image_processor) -> np.ndarray:
+    """
+    Pré-processamento do CLIP (menor lado, recorte central e normalização) em lote
+
+    Args:
+        images: Imagens PIL em RGB
+        image_processor: `processor.image_processor` do CLIP, de onde vêm tamanhos e estatísticas
+    """
+    size = image_processor.size
+    shortest_edge = size["shortest_edge"] if isinstance(size, dict) else size
+    crop = image_processor.crop_size
+    crop_height, crop_width = (crop["height"], crop["width"]) if isinstance(crop, dict) else (crop, crop)
+
+    prepared = [
+        center_crop(resize_shortest_edge(image, shortest_edge), crop_height, crop_width)
+        for image in images
+    ]
+    return to_pixel_values(prepared, image_processor.image_mean, image_processor.image_std)
+
+def preprocess_blip(images: Sequence[Any], image_processor) -> np.ndarray:
+    """
+    Pré-processamento do BLIP (redimensionamento quadrado e normalização) em lote
+
+    Args:
+        images: Imagens PIL em RGB
+        image_processor: `processor.image_processor` do BLIP, de onde vêm tamanhos e estatísticas
+    """
+    from PIL import Image
+
+    size = image_processor.size
+    height, width = (size["height"], size["width"]) if isinstance(size, dict) else (size, size)
+    prepared = [
+        image if image.size == (width, height) else image.resize((width, height), Image.BICUBIC)
+        for image in images
+    ]
+    return to_pixel_values(prepared, image_processor.image_mean, image_processor.image_std)
@@ -0,0 +1,139 @@
+import os
+import json
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from app.services.tracing import span
+from app.services.deadlines import check_deadline, guard
+
+class OllamaError(Exception):
+    """O Ollama respondeu com erro (status diferente de 200)"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(f"Erro na API Ollama ({status_code}): {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+def ollama_host() -> str:
+    return os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+
+async def stream_generate(
+    prompt: str,
+    model: str = "tinyllama",
+    system_prompt: Optional[str] = None,
+    temperature: float = 0.7,
+    max_tokens: int = 1000,
+    timeout: float = 300.0
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Gera texto com o Ollama em streaming, produzindo cada objeto JSON recebido
+
+    Args:
+        prompt: Texto de entrada
+        model: Modelo do Ollama
+        system_prompt: Instrução de sistema (opcional)
+        temperature: Temperatura de amostragem
+        max_tokens: Máximo de tokens gerados
+        timeout: Timeout do cliente HTTP, em segundos
+
+    Returns:
+        Iterador assíncrono de dicts do Ollama ({"response": ..., "done": ...}),
+        encerrado após o objeto com done=True
+
+    Raises:
+        OllamaError: Se o Ollama responder com erro
+        RequestCancelled: Se a requisição for abandonada (a conexão é fechada e o Ollama para de gerar)
+        json.JSONDecodeError: Se uma linha da resposta não for JSON válido
+    """
+    payload = {
+        "model": model,
+        "prompt": prompt,
+        "stream": True,
+        "options": {
+            "temperature": temperature,
+            "num_predict": max_tokens
+        }
+    }
+    if system_prompt:
+        payload["system"] = system_prompt
+
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        # Etapa "ollama" até a chegada dos cabeçalhos (o restante chega em streaming)
+        with span("ollama"):
+            request = client.build_request(
+                "POST", f"{ollama_host()}/api/generate", json=payload, headers={"Accept": "application/json"}
+            )
+            response = await guard(client.send(request, stream=True), "ollama")
+        try:
+            if response.status_code != 200:
+                detail = (await response.aread()).decode("utf-8", errors="replace")
+                raise OllamaError(response.status_code, detail)
+
+            # Uma linha por objeto JSON; aiter_lines junta linhas divididas entre pacotes
+            async for line in response.aiter_lines():
+                check_deadline("ollama_stream")
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+                yield data
+                if data.get("done", False):
+                    break
+        finally:
+            await response.aclose()
+
+# /api/embed (lotes) não existe em versões antigas do Ollama; após um 404 usa-se /api/embeddings
+_legacy_embeddings = False
+
+async def embed_texts(
+    texts: List[str],
+    model: str,
+    client: Optional[httpx.AsyncClient] = None,
+    timeout: float = 120.0
+) -> List[List[float]]:
+    """
+    Calcula os embeddings de vários textos com o Ollama, em uma única chamada
+
+    Usa /api/embed, que recebe o lote inteiro; em versões do Ollama sem essa
+    rota, recorre a /api/embeddings (um texto por chamada, em paralelo).
+
+    Args:
+        texts: Textos do lote
+        model: Modelo de embeddings do Ollama (ex.: nomic-embed-text)
+        client: Cliente HTTP reutilizado entre lotes (opcional)
+        timeout: Timeout do cliente criado quando `client` não é informado
+
+    Returns:
+        Um vetor por texto, na mesma ordem
+
+    Raises:
+        OllamaError: Se o Ollama responder com erro
+    """
+    global _legacy_embeddings
+    if not texts:
+        return []
+    if client is None:
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            return await embed_texts(texts, model, client)
+
+    with span("ollama_embed"):
+        if not _legacy_embeddings:
+            response = await client.post(f"{ollama_host()}/api/embed", json={"model": model, "input": texts})
+            # Modelo inexistente também responde 404, mas com {"error": ...}; rota inexistente não
+            if response.status_code != 404 or '"error"' in response.text:
+                if response.status_code != 200:
+                    raise OllamaError(response.status_code, response.text)
+                embeddings = response.json().get("embeddings", [])
+                if len(embeddings) != len(texts):
+                    raise OllamaError(200, f"{len(embeddings)} embeddings para {len(texts)} textos")
+                return embeddings
+            _legacy_embeddings = True
+
+        async def _embed_one(text: str) -> List[float]:
+            response = await client.post(f"{ollama_host()}/api/embeddings", json={"model": model, "prompt": text})
+            if response.status_code != 200:
+                raise OllamaError(response.status_code, response.text)
+            return response.json()["embedding"]
+
+        return list(await asyncio.gather(*(_embed_one(text) for text in texts)))
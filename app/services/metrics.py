@@ -0,0 +1,303 @@
+import os
+import math
+import shutil
+import logging
+import tempfile
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Prefixo de todas as métricas exportadas em /metrics
+METRICS_PREFIX = os.environ.get("METRICS_PREFIX", "ai_agent")
+
+# Limites dos histogramas de latência (segundos) e de tamanho (bytes)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+SIZE_BUCKETS = tuple(1024 * 4 ** exponent for exponent in range(10))  # 1 KiB .. 256 MiB
+
+# Amostra coletada sob demanda: (sufixo do nome, rótulos, valor)
+Sample = Tuple[str, Dict[str, str], float]
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+class Metric:
+    """
+    Métrica com rótulos, no formato de exposição de texto do Prometheus
+
+    Seguro para uso entre threads; cada combinação de rótulos é uma série.
+    `aggregate` define como os valores de vários workers são combinados
+    (app.services.worker_state): contadores e histogramas são sempre somados;
+    gauges usam "sum", "max" ou "min".
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (), aggregate: str = "sum"):
+        self.name = f"{METRICS_PREFIX}_{name}"
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.aggregate = aggregate
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            return [("", dict(zip(self.label_names, key)), value) for key, value in self._series.items()]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0.0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._series[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [contagens por limite..., soma, total]
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self) -> List[Sample]:
+        samples = []
+        with self._lock:
+            series_items = [(key, list(series)) for key, series in self._series.items()]
+        for key, series in series_items:
+            labels = dict(zip(self.label_names, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                samples.append(("_bucket", dict(labels, le=_format_value(bound)), cumulative))
+            samples.append(("_bucket", dict(labels, le="+Inf"), series[-1]))
+            samples.append(("_sum", labels, series[-2]))
+            samples.append(("_count", labels, series[-1]))
+        return samples
+
+class CollectedMetric:
+    """Métrica cujas amostras são lidas de outro módulo no momento da coleta"""
+
+    def __init__(self, name: str, kind: str, documentation: str, samples: Iterable[Tuple[Dict[str, str], float]],
+                 aggregate: str = "sum"):
+        self.name = f"{METRICS_PREFIX}_{name}"
+        self.kind = kind
+        self.documentation = documentation
+        self.aggregate = aggregate
+        self._samples = [("", labels, value) for labels, value in samples]
+
+    def samples(self) -> List[Sample]:
+        return self._samples
+
+class MetricsRegistry:
+    """
+    Métricas instrumentadas diretamente e coletores chamados a cada leitura de /metrics
+
+    Coletores são funções sem argumentos que retornam CollectedMetric; assim os
+    serviços expõem os contadores que já mantêm sem duplicá-los.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], Iterable[CollectedMetric]]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            # Reimportações do módulo reutilizam a métrica existente
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, label_names))
+
+    def gauge(self, name: str, documentation: str, label_names: Sequence[str] = (), aggregate: str = "sum") -> Gauge:
+        return self.register(Gauge(name, documentation, label_names, aggregate))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, label_names, buckets))
+
+    def register_collector(self, collector: Callable[[], Iterable[CollectedMetric]]):
+        with self._lock:
+            if collector not in self._collectors:
+                self._collectors.append(collector)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """
+        Amostras atuais de todas as métricas, em formato serializável (JSON)
+
+        Returns:
+            Lista de {"name", "kind", "documentation", "aggregate", "samples": [(sufixo, rótulos, valor)]}
+        """
+        with self._lock:
+            families: List = list(self._metrics.values())
+            collectors = list(self._collectors)
+
+        for collector in collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                logging.error(f"Erro no coletor de métricas {collector.__name__}: {str(e)}")
+
+        return [
+            {
+                "name": metric.name,
+                "kind": metric.kind,
+                "documentation": metric.documentation,
+                "aggregate": metric.aggregate,
+                "samples": metric.samples(),
+            }
+            for metric in families
+        ]
+
+    def render(self) -> str:
+        """Gera o texto no formato de exposição do Prometheus (version=0.0.4)"""
+        return format_snapshot(self.snapshot())
+
+def format_snapshot(families: Iterable[Dict[str, Any]]) -> str:
+    """Formata as métricas de MetricsRegistry.snapshot() no formato de exposição do Prometheus"""
+    lines = []
+    for family in families:
+        if not family["samples"]:
+            continue
+        lines.append(f"# HELP {family['name']} {family['documentation']}")
+        lines.append(f"# TYPE {family['name']} {family['kind']}")
+        for suffix, labels, value in family["samples"]:
+            lines.append(f"{family['name']}{suffix}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+# Registro compartilhado pela aplicação
+metrics = MetricsRegistry()
+
+# Métricas HTTP (preenchidas pelo middleware de app/main.py)
+HTTP_REQUESTS = metrics.counter(
+    "http_requests_total", "Requisições HTTP concluídas", ("method", "route", "status")
+)
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "http_request_duration_seconds",
+    "Latência até o envio dos cabeçalhos da resposta",
+    ("method", "route")
+)
+HTTP_IN_FLIGHT = metrics.gauge(
+    "http_requests_in_flight", "Requisições em andamento por modalidade", ("modality",)
+)
+HTTP_REQUEST_BYTES = metrics.histogram(
+    "http_request_body_bytes",
+    "Tamanho do corpo das requisições (uploads), pelo Content-Length",
+    ("route",),
+    buckets=SIZE_BUCKETS
+)
+
+# Arquivos temporários de upload ainda no disco
+TEMP_UPLOAD_BYTES = metrics.gauge(
+    "temp_upload_bytes", "Bytes de uploads gravados em arquivos temporários ainda não removidos", ("modality",)
+)
+TEMP_UPLOAD_FILES = metrics.gauge(
+    "temp_upload_files", "Arquivos temporários de upload ainda não removidos", ("modality",)
+)
+
+def route_modality(path: str) -> str:
+    """Modalidade de uma rota da API (/api/<modalidade>/...) ou 'other'"""
+    parts = path.split("/")
+    if len(parts) > 2 and parts[1] == "api" and parts[2]:
+        return parts[2]
+    return "other"
+
+def route_template(scope: dict) -> str:
+    """
+    Modelo da rota atendida (ex.: /api/vision/images/{image_id}), ou 'unmatched'
+
+    Usar o modelo em vez da URL evita uma série por valor de parâmetro.
+    Versões recentes do FastAPI guardam em scope["route"] o caminho sem o
+    prefixo do router incluído; nesse caso o prefixo é recuperado da URL.
+    """
+    template = getattr(scope.get("route"), "path", None)
+    if not template:
+        return "unmatched"
+    path_parts = scope["path"].rstrip("/").split("/")
+    template_parts = template.rstrip("/").split("/")
+    if len(path_parts) > len(template_parts):
+        return "/".join(path_parts[:len(path_parts) - len(template_parts) + 1]) + template
+    return template
+
+def track_temp_file(modality: str, size: int):
+    """Registra um arquivo temporário de upload gravado"""
+    TEMP_UPLOAD_BYTES.inc(size, modality=modality)
+    TEMP_UPLOAD_FILES.inc(modality=modality)
+
+def release_temp_file(modality: str, size: int):
+    """Registra a remoção de um arquivo temporário de upload"""
+    TEMP_UPLOAD_BYTES.dec(size, modality=modality)
+    TEMP_UPLOAD_FILES.dec(modality=modality)
+
+def _collect_temp_disk() -> List[CollectedMetric]:
+    usage = shutil.disk_usage(tempfile.gettempdir())
+    return [
+        CollectedMetric(
+            "temp_disk_free_bytes", "gauge", "Espaço livre no sistema de arquivos temporário", [({}, usage.free)], aggregate="max"
+        ),
+        CollectedMetric(
+            "temp_disk_used_bytes", "gauge", "Espaço usado no sistema de arquivos temporário", [({}, usage.used)], aggregate="max"
+        ),
+    ]
+
+metrics.register_collector(_collect_temp_disk)
+
+def render_metrics() -> str:
+    """Atalho para `metrics.render()`"""
+    return metrics.render()
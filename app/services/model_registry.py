@@ -0,0 +1,153 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from typing import Any, Callable, Dict, Hashable, List
+
+from app.services.metrics import CollectedMetric, metrics
+from app.services.tracing import span
+
+# Tempo ocioso (segundos) após o qual um modelo é descarregado; 0 desativa
+MODEL_IDLE_UNLOAD_SECONDS = int(os.environ.get("MODEL_IDLE_UNLOAD_SECONDS", "0"))
+
+MODEL_LOAD_SECONDS = metrics.histogram(
+    "model_load_duration_seconds", "Duração das cargas de modelo por serviço", ("service", "model")
+)
+MODEL_UNLOADS = metrics.counter(
+    "model_unloads_total", "Modelos descarregados da memória por serviço", ("service", "model")
+)
+
+def _key_labels(key: Hashable) -> Dict[str, str]:
+    """Rótulos de métrica de uma chave do registro: serviço (1º elemento) e modelo (restante)"""
+    parts = list(key) if isinstance(key, tuple) else [key]
+    return {"service": str(parts[0]), "model": "/".join(str(part) for part in parts[1:])}
+
+class ModelRegistry:
+    """
+    Mantém modelos residentes em memória, carregando cada chave uma única vez
+
+    Seguro para uso entre threads: cargas concorrentes da mesma chave esperam
+    pela primeira, e chaves diferentes carregam em paralelo.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+        self._models: Dict[Hashable, Any] = {}
+        self._last_used: Dict[Hashable, float] = {}
+        self._load_stats: Dict[Hashable, Dict[str, float]] = {}
+
+    def _key_lock(self, key: Hashable) -> threading.Lock:
+        with self._lock:
+            if key not in self._key_locks:
+                self._key_locks[key] = threading.Lock()
+            return self._key_locks[key]
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        Retorna o modelo da chave, chamando `loader` apenas na primeira vez
+
+        Args:
+            key: Identificador do modelo (ex.: ("clip", "openai/clip-vit-base-patch32", "cpu"))
+            loader: Função sem argumentos que carrega e retorna o modelo
+
+        Returns:
+            O objeto retornado por `loader`
+        """
+        model = self._models.get(key)
+        if model is None:
+            with self._key_lock(key):
+                model = self._models.get(key)
+                if model is None:
+                    started = time.monotonic()
+                    logging.info(f"Carregando modelo {key}...")
+                    with span("model_load"):
+                        model = loader()
+                    elapsed = time.monotonic() - started
+                    with self._lock:
+                        self._models[key] = model
+                        stats = self._load_stats.setdefault(key, {"loads": 0, "load_seconds_total": 0.0})
+                        stats["loads"] += 1
+                        stats["load_seconds_total"] += elapsed
+                        stats["last_load_seconds"] = elapsed
+                    MODEL_LOAD_SECONDS.observe(elapsed, **_key_labels(key))
+                    logging.info(f"Modelo {key} carregado em {elapsed:.2f}s")
+        self._last_used[key] = time.monotonic()
+        return model
+
+    def unload(self, key: Hashable) -> bool:
+        """Remove o modelo da memória; retorna True se estava carregado"""
+        with self._key_lock(key):
+            with self._lock:
+                model = self._models.pop(key, None)
+                self._last_used.pop(key, None)
+        if model is None:
+            return False
+
+        del model
+        MODEL_UNLOADS.inc(**_key_labels(key))
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+        logging.info(f"Modelo {key} descarregado")
+        return True
+
+    def unload_idle(self, max_idle: float) -> List[Hashable]:
+        """Descarrega os modelos sem uso há mais de `max_idle` segundos"""
+        now = time.monotonic()
+        idle = [key for key, last in list(self._last_used.items()) if now - last > max_idle]
+        return [key for key in idle if self.unload(key)]
+
+    def stats(self) -> Dict[str, Any]:
+        """Retorna os modelos carregados e as estatísticas de carga por chave"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "loaded": [
+                    {"key": list(key) if isinstance(key, tuple) else key,
+                     "idle_seconds": now - self._last_used.get(key, now)}
+                    for key in self._models
+                ],
+                "loads": [
+                    dict(stats, key=list(key) if isinstance(key, tuple) else key)
+                    for key, stats in self._load_stats.items()
+                ],
+            }
+
+# Registro compartilhado por todos os serviços
+registry = ModelRegistry()
+
+def _collect_metrics() -> List[CollectedMetric]:
+    now = time.monotonic()
+    with registry._lock:
+        keys = list(registry._models)
+        last_used = dict(registry._last_used)
+    return [
+        CollectedMetric(
+            "model_loaded", "gauge", "Modelos residentes em memória",
+            [(_key_labels(key), 1) for key in keys]
+        ),
+        CollectedMetric(
+            "model_idle_seconds", "gauge", "Tempo desde o último uso de cada modelo residente",
+            [(_key_labels(key), now - last_used.get(key, now)) for key in keys],
+            aggregate="min"
+        ),
+    ]
+
+metrics.register_collector(_collect_metrics)
+
+async def run_idle_unloader(max_idle: float = MODEL_IDLE_UNLOAD_SECONDS):
+    """
+    Descarrega periodicamente modelos ociosos até ser cancelado
+    """
+    interval = max(1.0, max_idle / 4)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            registry.unload_idle(max_idle)
+        except Exception as e:
+            logging.error(f"Erro ao descarregar modelos ociosos: {str(e)}")
@@ -0,0 +1,129 @@
+import os
+import sys
+import time
+import uuid
+import hmac
+import logging
+import tempfile
+import threading
+from collections import Counter
+from typing import List, Optional
+
+# Token que autoriza a captura (cabeçalho X-Profile); vazio desativa o profiling
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+
+# Intervalo entre amostras das pilhas e diretório/quantidade dos perfis salvos
+PROFILE_SAMPLE_INTERVAL_MS = float(os.environ.get("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+PROFILES_DIR = os.environ.get("PROFILES_DIR", os.path.join(tempfile.gettempdir(), "ai-agent-profiles"))
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", "20"))
+
+# Threads paradas em esperas (pools ociosos, event loop sem eventos) não entram no perfil
+_IDLE_FILES = {"threading.py", "thread.py", "queue.py", "selectors.py"}
+
+def is_authorized(token: Optional[str]) -> bool:
+    """Verifica o token enviado contra PROFILE_TOKEN (comparação em tempo constante)"""
+    return bool(PROFILE_TOKEN) and bool(token) and hmac.compare_digest(token, PROFILE_TOKEN)
+
+class SamplingProfiler:
+    """
+    Amostra periodicamente as pilhas de todas as threads do processo
+
+    O trabalho de uma requisição roda no event loop e nas threads dos
+    executores, por isso todas as threads são amostradas (exceto a do
+    profiler e as ociosas). O resultado usa o formato "folded" (uma pilha por linha,
+    quadros separados por ';', seguida da contagem), aceito por
+    flamegraph.pl e pelo speedscope. Jobs em pools de processos não aparecem.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or os.path.basename(frame.f_code.co_filename) in _IDLE_FILES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+            self.sample_count += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+# Uma captura por vez: a amostragem cobre o processo inteiro
+_profile_lock = threading.Lock()
+
+def try_start_profile() -> Optional[SamplingProfiler]:
+    """Inicia uma captura, ou retorna None se outra já estiver em andamento"""
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    profiler = SamplingProfiler(PROFILE_SAMPLE_INTERVAL_MS / 1000.0)
+    profiler.start()
+    return profiler
+
+def _prune_profiles():
+    paths = sorted(
+        (os.path.join(PROFILES_DIR, name) for name in os.listdir(PROFILES_DIR) if name.endswith(".folded")),
+        key=os.path.getmtime
+    )
+    for path in paths[:-PROFILE_MAX_FILES] if PROFILE_MAX_FILES > 0 else []:
+        os.remove(path)
+        summary_path = path[:-len(".folded")] + ".txt"
+        if os.path.exists(summary_path):
+            os.remove(summary_path)
+
+def new_profile_id() -> str:
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+def finish_profile(profiler: SamplingProfiler, profile_id: str, method: str, path: str, server_timing: str = ""):
+    """
+    Encerra a captura e salva o perfil com o identificador informado
+
+    Função síncrona: deve ser executada fora do event loop.
+    """
+    try:
+        profiler.stop()
+    finally:
+        _profile_lock.release()
+
+    os.makedirs(PROFILES_DIR, exist_ok=True)
+    with open(os.path.join(PROFILES_DIR, f"{profile_id}.folded"), "w") as f:
+        f.write(profiler.folded())
+    with open(os.path.join(PROFILES_DIR, f"{profile_id}.txt"), "w") as f:
+        f.write(f"{method} {path}\nsamples: {profiler.sample_count}\ninterval_ms: {profiler.interval * 1000}\n")
+        if server_timing:
+            f.write(f"server-timing: {server_timing}\n")
+    try:
+        _prune_profiles()
+    except OSError as e:
+        logging.warning(f"Erro ao remover perfis antigos: {str(e)}")
+
+def profile_path(profile_id: str) -> Optional[str]:
+    """Caminho do perfil salvo, ou None se não existir (o id não pode conter caminhos)"""
+    if os.path.basename(profile_id) != profile_id:
+        return None
+    path = os.path.join(PROFILES_DIR, f"{profile_id}.folded")
+    return path if os.path.isfile(path) else None
+
+def list_profiles() -> List[str]:
+    if not os.path.isdir(PROFILES_DIR):
+        return []
+    return sorted((name[:-len(".folded")] for name in os.listdir(PROFILES_DIR) if name.endswith(".folded")), reverse=True)
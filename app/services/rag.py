@@ -0,0 +1,447 @@
+import os
+import re
+import time
+import asyncio
+import hashlib
+import datetime
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Sequence, Tuple
+
+import httpx
+import numpy as np
+
+from app.services.vector_store import VectorStore
+from app.services.ann_index import IVFPQIndex, ANN_MIN_TRAIN_SIZE, ANN_RERANK, ensure_trained, index_stats
+from app.services.executors import run_inference
+from app.services.deadlines import check_deadline
+from app.services.llm import embed_texts
+from app.services.metrics import metrics
+from app.services.tracing import span
+
+# Diretório dos índices de documentos (um subdiretório por modelo de embeddings)
+RAG_DIR = os.environ.get("RAG_DIR", "app/models/rag")
+
+# Modelo de embeddings do Ollama (ex.: ollama pull nomic-embed-text)
+RAG_EMBED_MODEL = os.environ.get("RAG_EMBED_MODEL", "nomic-embed-text")
+
+# Precisão das matrizes de vetores (float32 ou float16, metade do espaço em coleções grandes)
+RAG_DTYPE = os.environ.get("RAG_DTYPE", "float32")
+
+# Tamanho máximo de cada trecho e sobreposição entre trechos consecutivos, em caracteres
+RAG_CHUNK_CHARS = int(os.environ.get("RAG_CHUNK_CHARS", "1000"))
+RAG_CHUNK_OVERLAP = int(os.environ.get("RAG_CHUNK_OVERLAP", "150"))
+
+# Trechos por chamada ao Ollama e chamadas simultâneas durante a ingestão
+RAG_EMBED_BATCH_SIZE = int(os.environ.get("RAG_EMBED_BATCH_SIZE", "64"))
+RAG_EMBED_CONCURRENCY = int(os.environ.get("RAG_EMBED_CONCURRENCY", "4"))
+RAG_EMBED_TIMEOUT = float(os.environ.get("RAG_EMBED_TIMEOUT", "300"))
+
+# Trechos recuperados por consulta e limite do contexto inserido no prompt
+RAG_TOP_K = int(os.environ.get("RAG_TOP_K", "4"))
+RAG_MAX_CONTEXT_CHARS = int(os.environ.get("RAG_MAX_CONTEXT_CHARS", "6000"))
+
+# Índice aproximado (IVF-PQ), treinado quando a coleção atinge ANN_MIN_TRAIN_SIZE trechos
+RAG_ANN_ENABLED = os.environ.get("RAG_ANN_ENABLED", "1") == "1"
+
+# Número máximo de consultas com embeddings em cache
+RAG_QUERY_CACHE_SIZE = int(os.environ.get("RAG_QUERY_CACHE_SIZE", "1024"))
+
+# Trechos processados por etapa da ingestão (limita a memória em documentos grandes)
+_INGEST_WINDOW_CHUNKS = 2048
+
+RAG_EMBEDDING_CACHE = metrics.counter(
+    "rag_embedding_cache_total", "Trechos encontrados (hit) ou não (miss) no cache de embeddings", ("result",)
+)
+RAG_CHUNKS_ADDED = metrics.counter("rag_chunks_added_total", "Trechos adicionados ao índice de documentos")
+RAG_EMBED_BATCH_SECONDS = metrics.histogram(
+    "rag_embed_batch_seconds", "Duração de cada lote de embeddings calculado pelo Ollama"
+)
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?…])\s+")
+
+def _units(text: str, max_chars: int) -> Iterator[Tuple[str, str]]:
+    """Parágrafos, ou frases dos parágrafos longos, com o separador que os precede"""
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        separator = "\n\n"
+        sentences = [paragraph] if len(paragraph) <= max_chars else _SENTENCE_BREAK.split(paragraph)
+        for sentence in sentences:
+            # Frases maiores que o trecho são cortadas no último espaço
+            while len(sentence) > max_chars:
+                cut = sentence.rfind(" ", 0, max_chars)
+                cut = cut if cut > 0 else max_chars
+                yield separator, sentence[:cut]
+                separator, sentence = " ", sentence[cut:].lstrip()
+            if sentence:
+                yield separator, sentence
+            separator = " "
+
+def _join(parts: Sequence[Tuple[str, str]]) -> str:
+    return "".join(separator + unit for separator, unit in parts).strip()
+
+def chunk_text(text: str, chunk_chars: int = RAG_CHUNK_CHARS, overlap: int = RAG_CHUNK_OVERLAP) -> List[str]:
+    """
+    Divide o texto em trechos de até `chunk_chars` caracteres, sem cortar parágrafos
+    ou frases quando possível
+
+    Trechos consecutivos compartilham as últimas frases do anterior, até
+    `overlap` caracteres, para que o contexto de uma frase não se perca na
+    fronteira entre trechos.
+
+    Returns:
+        Lista de trechos, na ordem do texto
+    """
+    chunk_chars = max(1, chunk_chars)
+    chunks: List[str] = []
+    current: List[Tuple[str, str]] = []
+    size = 0
+    for separator, unit in _units(text, chunk_chars):
+        if current and size + len(separator) + len(unit) > chunk_chars:
+            chunks.append(_join(current))
+            carried: List[Tuple[str, str]] = []
+            carried_size = 0
+            for previous in reversed(current):
+                if carried_size + len(previous[1]) + 2 > overlap:
+                    break
+                carried.insert(0, previous)
+                carried_size += len(previous[1]) + 2
+            if carried_size + len(separator) + len(unit) > chunk_chars:
+                carried, carried_size = [], 0
+            current, size = carried, carried_size
+        current.append((separator, unit))
+        size += len(separator) + len(unit)
+    if current:
+        chunks.append(_join(current))
+    return chunks
+
+def _chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+class _Collection:
+    """
+    Trechos indexados e cache de embeddings de um modelo
+
+    Os trechos ficam em um VectorStore (vetores memory-mapped, texto e
+    metadados no disco, lidos apenas para os resultados) com um índice IVF-PQ
+    alinhado às suas linhas. O cache guarda o embedding de cada trecho já
+    calculado, identificado pelo hash do texto, então documentos reenviados
+    ou editados só calculam os trechos novos.
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+        directory = os.path.join(RAG_DIR, re.sub(r"[^A-Za-z0-9_.-]+", "_", model))
+        self.chunks = VectorStore(os.path.join(directory, "chunks"), dtype=RAG_DTYPE)
+        self.cache = VectorStore(os.path.join(directory, "embedding_cache"), dtype=RAG_DTYPE)
+        self.index = IVFPQIndex(self.chunks.directory) if RAG_ANN_ENABLED else None
+        self._training = threading.Lock()
+
+    def cache_vectors(self, hashes: Sequence[str], vectors: np.ndarray):
+        """Guarda embeddings novos no cache, ignorando os já gravados por outra requisição (ou worker)"""
+        with self.cache.locked():
+            fresh = [position for position, chunk_hash in enumerate(hashes) if chunk_hash not in self.cache]
+            if fresh:
+                self.cache.add_many([hashes[position] for position in fresh], vectors[fresh])
+
+    def cached_vectors(self, hashes: Sequence[str]) -> np.ndarray:
+        return self.cache.get_vectors([self.cache.get_row(chunk_hash) for chunk_hash in hashes])
+
+    def add_chunks(self, chunk_ids: Sequence[str], vectors: np.ndarray, metadatas: Sequence[Dict[str, Any]]) -> List[str]:
+        """
+        Adiciona os trechos ainda não indexados e atualiza o índice aproximado
+
+        Função síncrona: deve ser executada fora do event loop.
+
+        Returns:
+            Ids dos trechos efetivamente gravados (sem os já indexados por outra requisição)
+        """
+        with self.chunks.locked():
+            fresh = [position for position, chunk_id in enumerate(chunk_ids) if chunk_id not in self.chunks]
+            if fresh:
+                self.chunks.add_many(
+                    [chunk_ids[position] for position in fresh],
+                    vectors[fresh],
+                    [metadatas[position] for position in fresh]
+                )
+        self.update_index()
+        return [chunk_ids[position] for position in fresh]
+
+    def _train_index(self):
+        try:
+            ensure_trained(self.index, self.chunks)
+        except Exception as e:
+            print(f"Erro ao treinar índice ANN dos documentos: {str(e)}")
+        finally:
+            self._training.release()
+
+    def update_index(self):
+        """Indexa os trechos novos; o treino inicial roda em uma thread separada (ver vision.update_ann_index)"""
+        if self.index is None:
+            return
+        if self.index.trained:
+            self.index.sync(self.chunks)
+        elif len(self.chunks) >= ANN_MIN_TRAIN_SIZE and self._training.acquire(blocking=False):
+            threading.Thread(target=self._train_index, name="rag-ann-train", daemon=True).start()
+
+    def search(self, query: np.ndarray, top_k: int) -> List[Dict[str, Any]]:
+        """
+        Trechos mais similares à consulta, com texto e metadados
+
+        Função síncrona: deve ser executada fora do event loop.
+        """
+        self.chunks.refresh()
+        if self.chunks.dim is not None and query.shape[0] != self.chunks.dim:
+            raise ValueError(f"Dimensão da consulta ({query.shape[0]}) diferente da coleção ({self.chunks.dim})")
+        if self.index is not None:
+            self.index.refresh()  # Treino e trechos indexados por outros workers
+        if self.index is not None and self.index.trained:
+            matches = self.index.search(query, top_k, self.chunks, rerank=max(top_k, ANN_RERANK))
+        else:
+            matches = self.chunks.search(query, top_k=top_k)
+        metadatas = self.chunks.get_metadata(row for row, _ in matches)
+        return [
+            {"id": self.chunks.get_id(row), "similarity": similarity, **metadata}
+            for (row, similarity), metadata in zip(matches, metadatas)
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "chunks": len(self.chunks),
+            "cached_embeddings": len(self.cache),
+            "dim": self.chunks.dim,
+            "ann": index_stats(self.index) if self.index is not None else None
+        }
+
+_collections: Dict[str, _Collection] = {}
+_collections_lock = threading.Lock()
+
+def get_collection(model: str = RAG_EMBED_MODEL) -> _Collection:
+    """Retorna a coleção de documentos do modelo de embeddings, abrindo-a na primeira chamada"""
+    collection = _collections.get(model)
+    if collection is None:
+        with _collections_lock:
+            collection = _collections.get(model)
+            if collection is None:
+                collection = _Collection(model)
+                _collections[model] = collection
+    return collection
+
+async def _embed_missing(collection: _Collection, missing: List[Tuple[str, str]]):
+    """Calcula em lotes paralelos os embeddings de (hash, texto) e os guarda no cache"""
+    batch_size = max(1, RAG_EMBED_BATCH_SIZE)
+    limit = asyncio.Semaphore(max(1, RAG_EMBED_CONCURRENCY))
+
+    async with httpx.AsyncClient(timeout=RAG_EMBED_TIMEOUT) as client:
+        async def _embed_batch(batch: List[Tuple[str, str]]):
+            async with limit:
+                check_deadline("rag_embed")
+                started = time.perf_counter()
+                embeddings = await embed_texts([text for _, text in batch], collection.model, client)
+                RAG_EMBED_BATCH_SECONDS.observe(time.perf_counter() - started)
+            vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+            await run_inference("rag", collection.cache_vectors, [chunk_hash for chunk_hash, _ in batch], vectors)
+
+        tasks = [
+            asyncio.ensure_future(_embed_batch(missing[start:start + batch_size]))
+            for start in range(0, len(missing), batch_size)
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+async def _embed_chunks(collection: _Collection, texts: List[str]) -> Tuple[np.ndarray, int, int]:
+    """
+    Embeddings normalizados dos trechos, calculando apenas os que não estão no cache
+
+    Returns:
+        (matriz (n, dim), trechos encontrados no cache, embeddings calculados)
+    """
+    hashes = [_chunk_hash(text) for text in texts]
+    missing: Dict[str, str] = {}
+    for chunk_hash, text in zip(hashes, texts):
+        if chunk_hash not in collection.cache:
+            missing.setdefault(chunk_hash, text)
+    hits = len(texts) - len(missing)
+    RAG_EMBEDDING_CACHE.inc(hits, result="hit")
+    RAG_EMBEDDING_CACHE.inc(len(missing), result="miss")
+
+    if missing:
+        await _embed_missing(collection, list(missing.items()))
+    vectors = await run_inference("rag", collection.cached_vectors, hashes)
+    return vectors, hits, len(missing)
+
+def _prepare_documents(documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Divide os documentos em trechos e calcula seus ids (conteúdo + parâmetros de divisão)"""
+    prepared = []
+    for document in documents:
+        text = document.get("text") or ""
+        if not text.strip():
+            raise ValueError(f"Documento vazio: {document.get('source') or 'sem nome'}")
+        document_id = _chunk_hash(f"{RAG_CHUNK_CHARS}:{RAG_CHUNK_OVERLAP}\0{text}")[:32]
+        prepared.append({
+            "document_id": document_id,
+            "source": document.get("source") or document_id,
+            "metadata": document.get("metadata") or {},
+            "chunks": chunk_text(text)
+        })
+    return prepared
+
+async def ingest_documents(documents: List[Dict[str, Any]], model: str = RAG_EMBED_MODEL) -> Dict[str, Any]:
+    """
+    Divide documentos em trechos, calcula os embeddings em lotes e os indexa
+
+    Documentos já indexados (mesmo conteúdo) não são processados novamente; o
+    cache de embeddings evita recalcular trechos repetidos entre documentos ou
+    versões de um mesmo documento. Os trechos são processados em janelas, para
+    limitar a memória com documentos grandes.
+
+    Args:
+        documents: Dicts com text, source (opcional) e metadata (opcional)
+        model: Modelo de embeddings do Ollama
+
+    Returns:
+        Dict com o resultado por documento (document_id, source, chunks, added,
+        duplicate) e os totais de trechos adicionados, calculados e do cache
+
+    Raises:
+        ValueError: Se algum documento estiver vazio
+        OllamaError: Se o Ollama responder com erro
+    """
+    collection = get_collection(model)
+    with span("rag_chunk"):
+        prepared = await run_inference("rag", _prepare_documents, documents)
+
+    # Trechos ainda não indexados (um documento repetido na requisição entra uma vez)
+    pending = []
+    seen = set()
+    for document in prepared:
+        for position, text in enumerate(document["chunks"]):
+            chunk_id = f"{document['document_id']}:{position}"
+            if chunk_id not in seen and chunk_id not in collection.chunks:
+                seen.add(chunk_id)
+                pending.append((document, position, text))
+    added: Dict[str, int] = {}
+    chunks_added = 0
+    cache_hits = 0
+    embedded = 0
+    created_at = str(datetime.datetime.now())
+
+    for start in range(0, len(pending), _INGEST_WINDOW_CHUNKS):
+        check_deadline("rag_ingest")
+        window = pending[start:start + _INGEST_WINDOW_CHUNKS]
+        vectors, hits, computed = await _embed_chunks(collection, [text for _, _, text in window])
+        cache_hits += hits
+        embedded += computed
+
+        chunk_ids = [f"{document['document_id']}:{position}" for document, position, _ in window]
+        metadatas = [
+            {
+                "document_id": document["document_id"],
+                "source": document["source"],
+                "chunk": position,
+                "chunks": len(document["chunks"]),
+                "text": text,
+                "metadata": document["metadata"],
+                "created_at": created_at
+            }
+            for document, position, text in window
+        ]
+        stored = await run_inference("rag", collection.add_chunks, chunk_ids, vectors, metadatas)
+        chunks_added += len(stored)
+        for chunk_id in stored:
+            document_id = chunk_id.split(":", 1)[0]
+            added[document_id] = added.get(document_id, 0) + 1
+
+    RAG_CHUNKS_ADDED.inc(chunks_added)
+    return {
+        "documents": [
+            {
+                "document_id": document["document_id"],
+                "source": document["source"],
+                "chunks": len(document["chunks"]),
+                "added": added.get(document["document_id"], 0),
+                "duplicate": document["document_id"] not in added
+            }
+            for document in prepared
+        ],
+        "chunks_added": chunks_added,
+        "chunks_embedded": embedded,
+        "cache_hits": cache_hits
+    }
+
+_query_cache: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+
+async def _embed_query(query: str, model: str) -> np.ndarray:
+    key = (model, query)
+    vector = _query_cache.get(key)
+    if vector is not None:
+        _query_cache.move_to_end(key)
+        return vector
+    embeddings = await embed_texts([query], model)
+    vector = _normalize(np.asarray(embeddings, dtype=np.float32))[0]
+    _query_cache[key] = vector
+    if len(_query_cache) > RAG_QUERY_CACHE_SIZE:
+        _query_cache.popitem(last=False)
+    return vector
+
+async def retrieve(query: str, top_k: int = RAG_TOP_K, model: str = RAG_EMBED_MODEL) -> List[Dict[str, Any]]:
+    """
+    Busca os trechos de documentos mais relevantes para a consulta
+
+    Args:
+        query: Texto da consulta (ex.: o prompt do usuário)
+        top_k: Número de trechos
+        model: Modelo de embeddings do Ollama
+
+    Returns:
+        Lista de trechos (id, similarity, document_id, source, chunk, text,
+        metadata) em ordem decrescente de similaridade
+
+    Raises:
+        OllamaError: Se o Ollama responder com erro
+    """
+    collection = get_collection(model)
+    if len(collection.chunks) == 0 or top_k <= 0:
+        return []
+    query_vector = await _embed_query(query, model)
+    return await run_inference("rag", collection.search, query_vector, top_k)
+
+def build_rag_prompt(prompt: str, chunks: List[Dict[str, Any]], max_chars: int = RAG_MAX_CONTEXT_CHARS) -> str:
+    """
+    Insere os trechos recuperados antes da pergunta, numerados com a fonte
+
+    Trechos que ultrapassariam `max_chars` são omitidos (os mais relevantes vêm primeiro).
+    """
+    if not chunks:
+        return prompt
+    sections = []
+    size = 0
+    for number, chunk in enumerate(chunks, start=1):
+        section = f"[{number}] {chunk['source']}\n{chunk['text']}"
+        if sections and size + len(section) > max_chars:
+            break
+        sections.append(section)
+        size += len(section)
+    context = "\n\n".join(sections)
+    return (
+        "Use os trechos de documentos abaixo para responder. "
+        "Se a resposta não estiver nos trechos, diga que não sabe.\n\n"
+        f"{context}\n\nPergunta: {prompt}"
+    )
+
+def get_rag_stats(model: str = RAG_EMBED_MODEL) -> Dict[str, Any]:
+    """Trechos indexados, embeddings em cache e estado do índice aproximado"""
+    return get_collection(model).stats()
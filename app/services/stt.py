@@ -1,9 +1,96 @@
 import os
-import asyncio
 from pathlib import Path
 import tempfile
 import shutil
-from typing import Dict, Optional, Union
+from typing import Dict, Iterator, Optional, Tuple, Union
+import numpy as np
+
+from app.services.executors import ExecutorSaturated, run_inference
+from app.services.deadlines import RequestCancelled, check_deadline
+from app.services.model_registry import registry
+from app.services.tracing import traced
+
+# Taxa de amostragem esperada pelo Whisper
+WHISPER_SAMPLE_RATE = 16000
+
+# Duração (segundos) de cada janela transcrita; o prazo da requisição é checado entre janelas
+STT_WINDOW_SECONDS = float(os.environ.get("STT_WINDOW_SECONDS", "30"))
+
+# Trecho (segundos) antes do fim da janela onde se procura uma pausa para o corte
+_CUT_SEARCH_SECONDS = 3.0
+
+def get_whisper(model_name: str = "base"):
+    """Retorna o modelo Whisper residente, carregando-o na primeira chamada"""
+    def _load():
+        # Importar Whisper apenas quando necessário
+        import whisper
+        model = whisper.load_model(model_name)
+        # Apenas inferência: sem gradientes (pesos nunca escritos, compartilháveis entre processos)
+        model.eval()
+        model.requires_grad_(False)
+        return model
+
+    return registry.get(("whisper", model_name), _load)
+
+def _load_audio(audio_path: str) -> np.ndarray:
+    """Decodifica o áudio (ffmpeg) em float32 mono a 16 kHz"""
+    import whisper
+    return whisper.load_audio(audio_path)
+
+def _windows(audio: np.ndarray, window: int) -> Iterator[Tuple[int, int]]:
+    """
+    Divide o áudio em janelas de até `window` amostras, cortando no trecho mais
+    silencioso perto do fim de cada janela para não partir palavras
+    """
+    frame = WHISPER_SAMPLE_RATE // 10
+    search = int(_CUT_SEARCH_SECONDS * WHISPER_SAMPLE_RATE)
+    start = 0
+    while start + window < len(audio):
+        end = start + window
+        region = audio[max(start, end - search):end]
+        frames = len(region) // frame
+        if frames > 1:
+            energy = np.square(region[:frames * frame].reshape(frames, frame)).mean(axis=1)
+            end = end - len(region) + (int(energy.argmin()) + 1) * frame
+        yield start, end
+        start = end
+    yield start, len(audio)
+
+@traced("whisper_inference")
+def _transcribe_file(audio_path: str, model_name: str, language: Optional[str]) -> Dict[str, str]:
+    """
+    Transcreve o arquivo com o modelo residente, em janelas de STT_WINDOW_SECONDS
+
+    Entre janelas o prazo da requisição é checado, então um áudio longo para
+    pouco depois de o cliente desistir. O idioma detectado na primeira janela
+    vale para as seguintes, e o fim do texto anterior condiciona a próxima.
+
+    Função síncrona de módulo (serializável), executada no executor "stt",
+    que pode ser um pool de threads ou de processos (neste, sem o contexto da
+    requisição, a transcrição vai até o fim).
+
+    Raises:
+        RequestCancelled: Se a requisição for abandonada entre janelas
+    """
+    # Modelo residente (carregado uma vez por processo)
+    model = get_whisper(model_name)
+    audio = _load_audio(audio_path)
+    window = max(1, int(STT_WINDOW_SECONDS * WHISPER_SAMPLE_RATE))
+
+    texts = []
+    for start, end in _windows(audio, window):
+        check_deadline("stt_segment")
+        options = {"language": language} if language else {}
+        if texts:
+            options["initial_prompt"] = texts[-1][-200:]
+        result = model.transcribe(audio[start:end], **options)
+        language = language or result["language"]
+        texts.append(result["text"])
+
+    return {
+        "text": "".join(texts),
+        "language": language
+    }
 
 async def transcribe_audio(
     audio_path: str,
@@ -20,43 +107,24 @@ async def transcribe_audio(
     
     Returns:
         Dict com texto transcrito e idioma detectado, ou None em caso de erro
+    
+    Raises:
+        ExecutorSaturated: Se a fila do executor de STT estiver cheia
+        RequestCancelled: Se a requisição for abandonada (prazo esgotado ou cliente desconectado)
     """
     try:
-        # Importar Whisper apenas quando necessário
-        import whisper
-        
         # Validar modelo
         valid_models = ["tiny", "base", "small", "medium", "large"]
         if model_name not in valid_models:
             print(f"Modelo {model_name} não é válido, usando 'base'")
             model_name = "base"
         
-        # Função para carregar modelo e fazer transcrição (não assíncrona)
-        def _transcribe():
-            # Carregar modelo
-            model = whisper.load_model(model_name)
-            
-            # Configurar opções de transcrição
-            options = {}
-            if language:
-                options["language"] = language
-            
-            # Transcerver o áudio
-            if language:
-                result = model.transcribe(audio_path, language=language)
-            else:
-                result = model.transcribe(audio_path)
-            
-            return {
-                "text": result["text"],
-                "language": result["language"]
-            }
-        
-        # Executar em um ThreadPool, pois Whisper não é async-friendly
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(None, _transcribe)
+        # Executar no executor dedicado ao STT, pois Whisper não é async-friendly
+        result = await run_inference("stt", _transcribe_file, audio_path, model_name, language)
         
         return result
+    except (ExecutorSaturated, RequestCancelled):
+        raise
     except Exception as e:
         print(f"Erro na transcrição com Whisper: {str(e)}")
         return None 
\ No newline at end of file
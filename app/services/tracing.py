@@ -0,0 +1,106 @@
+import os
+import re
+import time
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Rastreamento por requisição (cabeçalho Server-Timing); "0" desativa
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "1") == "1"
+
+class RequestTrace:
+    """
+    Etapas de uma requisição (nome, início, duração), em segundos
+
+    As etapas podem ser registradas de threads dos executores, que recebem o
+    contexto da requisição (ver app.services.executors).
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spans: List[Tuple[str, float, float]] = []
+
+    def add(self, name: str, started: float, duration: float):
+        with self._lock:
+            self.spans.append((name, started - self.started, duration))
+
+    def totals(self) -> Dict[str, Tuple[float, int]]:
+        """Duração somada e número de ocorrências de cada etapa, na ordem de início"""
+        totals: Dict[str, Tuple[float, int]] = {}
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span[1])
+        for name, _, duration in spans:
+            total, count = totals.get(name, (0.0, 0))
+            totals[name] = (total + duration, count + 1)
+        return totals
+
+    def server_timing(self) -> str:
+        """Valor do cabeçalho Server-Timing, com as durações em milissegundos"""
+        entries = [
+            f"{name};dur={total * 1000:.1f}" + (f';desc="x{count}"' if count > 1 else "")
+            for name, (total, count) in self.totals().items()
+        ]
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+_current_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar("request_trace", default=None)
+
+def start_trace() -> Tuple[RequestTrace, contextvars.Token]:
+    """Inicia o rastreamento da requisição no contexto atual"""
+    trace = RequestTrace()
+    return trace, _current_trace.set(trace)
+
+def end_trace(token: contextvars.Token):
+    _current_trace.reset(token)
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+def detach_trace():
+    """
+    Desassocia a tarefa atual da requisição que a criou
+
+    Tarefas de longa duração (ex.: o worker de um MicroBatcher) herdam o
+    contexto da requisição que as iniciou e não devem registrar etapas nela.
+    """
+    _current_trace.set(None)
+
+_invalid_name = re.compile(r"[^A-Za-z0-9_.-]")
+
+def record_span(name: str, started: float, duration: float):
+    """Registra uma etapa já medida (início em time.perf_counter) na requisição atual"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(_invalid_name.sub("_", name), started, duration)
+
+@contextmanager
+def span(name: str):
+    """
+    Mede o bloco como uma etapa da requisição atual (sem efeito fora de uma requisição)
+
+    Uso:
+        with span("decode"):
+            image = decode_image(data)
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(_invalid_name.sub("_", name), started, time.perf_counter() - started)
+
+def traced(name: str) -> Callable[[Callable], Callable]:
+    """Decorador que mede cada chamada da função síncrona como a etapa `name`"""
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,224 +1,263 @@
 import os
-import asyncio
-from pathlib import Path
-import tempfile
-import shutil
 import logging
 import subprocess
+import io
+import wave
+from typing import Optional, Tuple
+import numpy as np
 
-# Lista de modelos Piper para download
-PIPER_MODELS = {
-    "pt_BR-edresson-low.onnx": "https://huggingface.co/rhasspy/piper-voices/resolve/main/pt/pt_BR/edresson/low/pt_BR-edresson-low.onnx",
-    "pt_BR-edresson-low.onnx.json": "https://huggingface.co/rhasspy/piper-voices/resolve/main/pt/pt_BR/edresson/low/pt_BR-edresson-low.onnx.json",
-    "en_US-lessac-medium.onnx": "https://huggingface.co/rhasspy/piper-voices/resolve/main/en/en_US/lessac/medium/en_US-lessac-medium.onnx",
-    "en_US-lessac-medium.onnx.json": "https://huggingface.co/rhasspy/piper-voices/resolve/main/en/en_US/lessac/medium/en_US-lessac-medium.onnx.json"
+from app.services.executors import ExecutorSaturated, run_inference
+from app.services.deadlines import RequestCancelled, check_deadline
+from app.services.model_registry import registry
+from app.services.tracing import span
+from app.services.artifacts import MODELS_DIR, ensure_artifacts
+
+# Diretório dos modelos Piper (os artefatos estão em app/models/manifest.json, grupo "piper")
+PIPER_MODELS_DIR = os.path.join(MODELS_DIR, "piper")
+
+# Formatos de saída suportados: extensão do arquivo e media type da resposta
+AUDIO_FORMATS = {
+    "wav": {"extension": "wav", "media_type": "audio/wav"},
+    "ogg": {"extension": "ogg", "media_type": "audio/ogg"},  # Opus em contêiner Ogg
+    "mp3": {"extension": "mp3", "media_type": "audio/mpeg"},
+    "pcm": {"extension": "pcm", "media_type": "audio/L16"},  # PCM 16-bit mono little-endian
+}
+
+# Apelidos aceitos para os formatos acima
+AUDIO_FORMAT_ALIASES = {
+    "opus": "ogg",
+    "raw": "pcm",
+}
+
+# Argumentos do ffmpeg para os formatos comprimidos
+_FFMPEG_CODECS = {
+    "ogg": ["-c:a", "libopus", "-b:a", os.environ.get("TTS_OPUS_BITRATE", "32k"), "-f", "ogg"],
+    "mp3": ["-c:a", "libmp3lame", "-b:a", os.environ.get("TTS_MP3_BITRATE", "64k"), "-f", "mp3"],
+}
+
+# Mapeamento de vozes para modelos Coqui (simplificado)
+COQUI_VOICE_MODELS = {
+    "pt_br_female": "tts_models/pt/cv/vits",   # Modelo português - mesmo para masculino e feminino
+    "pt_br_male": "tts_models/pt/cv/vits",     # Vamos diferenciar no frontend apenas
+    "en_us_female": "tts_models/en/ljspeech/tacotron2-DDC",
+    "en_us_male": "tts_models/en/vctk/vits"
+}
+
+# Modelo Coqui usado quando o modelo da voz falha
+COQUI_FALLBACK_MODEL = "tts_models/en/ljspeech/tacotron2-DDC"
+
+# Mapeamento de vozes para modelos do Piper (simplificado)
+PIPER_VOICE_MODELS = {
+    "pt_BR-16000": "pt_BR-edresson-low.onnx",
+    "en_US-22050": "en_US-lessac-medium.onnx"
 }
 
 def ensure_directories():
     """Garante que os diretórios necessários existam"""
-    os.makedirs("app/models/piper", exist_ok=True)
+    os.makedirs(PIPER_MODELS_DIR, exist_ok=True)
     os.makedirs("app/static/audio", exist_ok=True)
 
-def download_piper_models():
-    """Baixa os modelos Piper TTS se não existirem"""
-    ensure_directories()
-    
-    import requests
-    
-    models_dir = Path("app/models/piper")
-    
-    for model_file, model_url in PIPER_MODELS.items():
-        model_path = models_dir / model_file
-        if not model_path.exists():
-            try:
-                logging.info(f"Baixando modelo {model_file}...")
-                response = requests.get(model_url, stream=True)
-                response.raise_for_status()  # Verificar se o download foi bem-sucedido
-                
-                # Salvar o arquivo
-                with open(model_path, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                
-                logging.info(f"Modelo {model_file} baixado com sucesso")
-            except Exception as e:
-                logging.error(f"Erro ao baixar modelo {model_file}: {str(e)}")
-
-async def generate_tts_coqui(text: str, voice: str, output_path: str, speed: float = 1.0) -> bool:
+def normalize_audio_format(audio_format: str) -> Optional[str]:
+    """Resolve apelidos de formato, retornando None se o formato não for suportado"""
+    audio_format = (audio_format or "wav").lower()
+    audio_format = AUDIO_FORMAT_ALIASES.get(audio_format, audio_format)
+    return audio_format if audio_format in AUDIO_FORMATS else None
+
+def encode_audio(pcm: bytes, sample_rate: int, audio_format: str = "wav") -> bytes:
     """
-    Gera áudio a partir de texto usando Coqui TTS
-    
+    Codifica PCM 16-bit mono no formato solicitado
+
+    Função síncrona: deve ser executada fora do event loop.
+
     Args:
-        text: Texto para conversão
-        voice: Modelo de voz a ser usado
-        output_path: Caminho para salvar o arquivo de áudio
-        speed: Velocidade da fala (1.0 é normal)
-    
+        pcm: Amostras PCM 16-bit mono little-endian
+        sample_rate: Taxa de amostragem das amostras
+        audio_format: wav, ogg (Opus), mp3 ou pcm
+
     Returns:
-        bool: True se gerado com sucesso, False caso contrário
+        bytes com o áudio codificado
+    """
+    if audio_format == "pcm":
+        return pcm
+
+    if audio_format == "wav":
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav_file:
+            wav_file.setnchannels(1)  # Mono
+            wav_file.setsampwidth(2)  # 16-bit
+            wav_file.setframerate(sample_rate)
+            wav_file.writeframes(pcm)
+        return buffer.getvalue()
+
+    # Formatos comprimidos via ffmpeg (entrada e saída por pipes, sem disco)
+    command = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-f", "s16le", "-ar", str(sample_rate), "-ac", "1", "-i", "pipe:0",
+        *_FFMPEG_CODECS[audio_format],
+        "pipe:1"
+    ]
+    process = subprocess.run(command, input=pcm, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg falhou ao codificar {audio_format}: {process.stderr.decode(errors='ignore').strip()}")
+    return process.stdout
+
+def _float_to_pcm16(samples) -> bytes:
+    """Converte amostras float em [-1, 1] para PCM 16-bit"""
+    samples = np.clip(np.asarray(samples, dtype=np.float32), -1.0, 1.0)
+    return (samples * 32767).astype("<i2").tobytes()
+
+def _get_coqui(model_name: str):
+    """Retorna o modelo Coqui residente, carregando-o na primeira chamada"""
+    from TTS.api import TTS
+    return registry.get(("coqui", model_name), lambda: TTS(model_name=model_name))
+
+def _get_piper_voice(model_path: str):
+    """Retorna a voz Piper residente, carregando-a na primeira chamada"""
+    from piper.voice import PiperVoice
+    return registry.get(("piper", model_path), lambda: PiperVoice.load(model_path))
+
+def _synthesize_coqui(text: str, voice: str, speed: float = 1.0) -> Tuple[bytes, int]:
     """
+    Sintetiza fala com Coqui TTS, retornando (PCM 16-bit, taxa de amostragem)
+
+    Função síncrona: deve ser executada fora do event loop.
+    """
+    # Verificar se a voz existe
+    if voice not in COQUI_VOICE_MODELS:
+        logging.warning(f"Voz {voice} não encontrada, usando pt_br_female como padrão")
+        model_name = COQUI_VOICE_MODELS["pt_br_female"]
+    else:
+        model_name = COQUI_VOICE_MODELS[voice]
+
+    logging.info(f"Iniciando geração de TTS com o modelo Coqui: {model_name}")
+
     try:
-        # Garantir que o diretório de saída existe
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        
-        # Importar TTS apenas quando necessário para evitar carregar modelos em memória desnecessariamente
-        from TTS.api import TTS
-        
-        # Mapeamento de vozes para modelos (simplificado)
-        voice_models = {
-            "pt_br_female": "tts_models/pt/cv/vits",   # Modelo português - mesmo para masculino e feminino
-            "pt_br_male": "tts_models/pt/cv/vits",     # Vamos diferenciar no frontend apenas
-            "en_us_female": "tts_models/en/ljspeech/tacotron2-DDC",
-            "en_us_male": "tts_models/en/vctk/vits"
-        }
-        
-        # Verificar se a voz existe
-        if voice not in voice_models:
-            logging.warning(f"Voz {voice} não encontrada, usando pt_br_female como padrão")
-            model_name = voice_models["pt_br_female"]
-        else:
-            model_name = voice_models[voice]
-        
-        logging.info(f"Iniciando geração de TTS com o modelo Coqui: {model_name}")
-        
-        # Inicializar TTS em uma thread separada para não bloquear o event loop
-        def _generate():
-            try:
-                # Carregar o modelo de TTS
-                tts = TTS(model_name=model_name)
-                
-                # Verificar se o modelo suporta múltiplos speakers
-                if hasattr(tts, "speakers") and tts.speakers and "en/vctk" in model_name:
-                    logging.info(f"Modelo {model_name} suporta múltiplos speakers: {tts.speakers}")
-                    
-                    # Apenas para o modelo VCTK inglês
-                    if voice == "en_us_female" and "p282" in tts.speakers:
-                        selected_speaker = "p282"  # Feminino
-                    else:
-                        selected_speaker = "p299"  # Masculino
-                        
-                    logging.info(f"Usando speaker {selected_speaker} para {voice}")
-                    tts.tts_to_file(text=text, file_path=output_path, speed=speed, 
-                                    speaker=selected_speaker)
-                else:
-                    # Modelo sem múltiplos speakers ou não é VCTK
-                    logging.info(f"Modelo {model_name} não suporta múltiplos speakers ou não é VCTK")
-                    tts.tts_to_file(text=text, file_path=output_path, speed=speed)
-                
-                return True
-            except Exception as e:
-                logging.error(f"Erro interno ao gerar TTS com Coqui: {str(e)}")
-                
-                # Tentar com um modelo alternativo conhecido por ser estável
-                try:
-                    fallback_model = "tts_models/en/ljspeech/tacotron2-DDC"
-                    logging.info(f"Tentando gerar com modelo alternativo: {fallback_model}")
-                    fallback_tts = TTS(model_name=fallback_model)
-                    fallback_tts.tts_to_file(text=text, file_path=output_path, speed=speed)
-                    return True
-                except Exception as fallback_error:
-                    logging.error(f"Erro também com modelo alternativo: {str(fallback_error)}")
-                    return False
-        
-        # Executar em um ThreadPool pois TTS não é async-friendly
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(None, _generate)
-        
-        success = os.path.exists(output_path) and os.path.getsize(output_path) > 0
-        if success:
-            logging.info(f"Áudio TTS Coqui gerado com sucesso: {output_path}")
+        # Modelo de TTS residente
+        tts = _get_coqui(model_name)
+
+        # Verificar se o modelo suporta múltiplos speakers
+        if hasattr(tts, "speakers") and tts.speakers and "en/vctk" in model_name:
+            logging.info(f"Modelo {model_name} suporta múltiplos speakers: {tts.speakers}")
+
+            # Apenas para o modelo VCTK inglês
+            if voice == "en_us_female" and "p282" in tts.speakers:
+                selected_speaker = "p282"  # Feminino
+            else:
+                selected_speaker = "p299"  # Masculino
+
+            logging.info(f"Usando speaker {selected_speaker} para {voice}")
+            samples = tts.tts(text=text, speed=speed, speaker=selected_speaker)
         else:
-            logging.error(f"Falha ao gerar áudio TTS Coqui: arquivo não existe ou está vazio - {output_path}")
-            
-        return success
+            # Modelo sem múltiplos speakers ou não é VCTK
+            logging.info(f"Modelo {model_name} não suporta múltiplos speakers ou não é VCTK")
+            samples = tts.tts(text=text, speed=speed)
     except Exception as e:
-        logging.error(f"Erro ao gerar TTS com Coqui: {str(e)}")
-        return False
+        logging.error(f"Erro interno ao gerar TTS com Coqui: {str(e)}")
+
+        # Tentar com um modelo alternativo conhecido por ser estável
+        logging.info(f"Tentando gerar com modelo alternativo: {COQUI_FALLBACK_MODEL}")
+        tts = _get_coqui(COQUI_FALLBACK_MODEL)
+        samples = tts.tts(text=text, speed=speed)
+
+    return _float_to_pcm16(samples), tts.synthesizer.output_sample_rate
+
+def _synthesize_piper(text: str, model_path: str) -> Tuple[bytes, int]:
+    """
+    Sintetiza fala com Piper, retornando (PCM 16-bit, taxa de amostragem)
+
+    Função síncrona: deve ser executada fora do event loop.
+    """
+    # Voz residente do modelo
+    voice = _get_piper_voice(model_path)
+
+    # Gerar áudio diretamente em memória, frase a frase; entre as frases o
+    # trabalho é interrompido se a requisição for abandonada
+    chunks = []
+    for chunk in voice.synthesize_stream_raw(text):
+        chunks.append(chunk)
+        check_deadline("piper_synthesis")
+    return b"".join(chunks), voice.config.sample_rate
+
+async def _resolve_piper_model(voice: str) -> str:
+    """Retorna o caminho do modelo Piper para a voz, baixando-o se necessário"""
+    # Verificar se a voz existe
+    if voice not in PIPER_VOICE_MODELS:
+        logging.warning(f"Voz {voice} não encontrada, usando pt_BR-16000 como padrão")
+        voice_model = PIPER_VOICE_MODELS["pt_BR-16000"]
+    else:
+        voice_model = PIPER_VOICE_MODELS[voice]
+
+    # Configurar caminho para modelo
+    model_path = os.path.join(PIPER_MODELS_DIR, voice_model)
+
+    # Os artefatos só aparecem no destino depois de verificados, então existir basta
+    if not (os.path.exists(model_path) and os.path.exists(model_path + ".json")):
+        await ensure_artifacts(names=[voice_model, voice_model + ".json"])
+
+    return model_path
 
-async def generate_tts_piper(text: str, voice: str, output_path: str, speed: float = 1.0) -> bool:
+def _synthesize_encoded(engine: str, text: str, voice: str, speed: float, audio_format: str) -> bytes:
     """
-    Gera áudio a partir de texto usando Piper TTS
-    
+    Síntese e codificação no mesmo job; para o Piper, `voice` é o caminho do modelo
+
+    Função síncrona de módulo (serializável), executada no executor "tts",
+    que pode ser um pool de threads ou de processos.
+    """
+    with span(f"{engine}_synthesis"):
+        if engine == "coqui":
+            pcm, sample_rate = _synthesize_coqui(text, voice, speed)
+        else:
+            pcm, sample_rate = _synthesize_piper(text, voice)
+    with span("encode"):
+        return encode_audio(pcm, sample_rate, audio_format)
+
+async def synthesize_speech(
+    text: str,
+    voice: str,
+    engine: str = "coqui",
+    speed: float = 1.0,
+    audio_format: str = "wav"
+) -> Optional[bytes]:
+    """
+    Gera áudio a partir de texto e o codifica no formato solicitado, sem tocar o disco
+
     Args:
         text: Texto para conversão
         voice: Modelo de voz a ser usado
-        output_path: Caminho para salvar o arquivo de áudio
+        engine: Engine TTS (coqui ou piper)
         speed: Velocidade da fala (1.0 é normal)
-    
+        audio_format: wav, ogg (Opus), mp3 ou pcm
+
     Returns:
-        bool: True se gerado com sucesso, False caso contrário
+        bytes com o áudio codificado, ou None em caso de erro
+
+    Raises:
+        ExecutorSaturated: Se a fila do executor de TTS estiver cheia
+        RequestCancelled: Se a requisição for abandonada (prazo esgotado ou cliente desconectado)
     """
     try:
-        # Garantir que o diretório de saída existe
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        
-        # Mapeamento de vozes para modelos do Piper (simplificado)
-        voice_models = {
-            "pt_BR-16000": "pt_BR-edresson-low.onnx",
-            "en_US-22050": "en_US-lessac-medium.onnx"
-        }
-        
-        # Verificar se a voz existe
-        if voice not in voice_models:
-            logging.warning(f"Voz {voice} não encontrada, usando pt_BR-16000 como padrão")
-            voice_model = voice_models["pt_BR-16000"]
-        else:
-            voice_model = voice_models[voice]
-        
-        # Garantir que o diretório de modelos existe
-        ensure_directories()
-        
-        # Configurar caminho para modelo
-        model_path = f"/app/app/models/piper/{voice_model}"
-        
-        # Verificar se o modelo existe
-        if not os.path.exists(model_path):
-            download_piper_models()
-            
-            # Verificar novamente após tentativa de download
-            if not os.path.exists(model_path):
-                raise FileNotFoundError(f"Modelo {voice_model} não encontrado após tentativa de download")
-        
-        logging.info(f"Gerando áudio com Piper TTS usando modelo: {model_path}")
-        
-        # Usar a biblioteca Python piper-tts em vez do comando de linha
-        def _generate():
-            try:
-                # Importar apenas quando necessário para evitar sobrecarga
-                import wave
-                from piper.voice import PiperVoice
-                
-                # Carregar voz do modelo
-                voice = PiperVoice.load(model_path)
-                
-                # Abrir arquivo WAV para escrita
-                wav_file = wave.open(output_path, "w")
-                wav_file.setnchannels(1)  # Mono
-                wav_file.setsampwidth(2)  # 16-bit
-                wav_file.setframerate(voice.config.sample_rate)  # Taxa de amostragem do modelo
-                
-                # Gerar áudio
-                voice.synthesize(text, wav_file)
-                
-                # Fechar o arquivo
-                wav_file.close()
-                
-                return True
-            except Exception as e:
-                logging.error(f"Erro interno na geração TTS com Piper: {str(e)}")
-                return False
-        
-        # Executar em um ThreadPool pois pode não ser async-friendly
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(None, _generate)
-        
-        success = os.path.exists(output_path)
-        if success:
-            logging.info(f"Áudio TTS Piper gerado com sucesso: {output_path}")
-        else:
-            logging.error(f"Falha ao gerar áudio TTS Piper: arquivo não existe - {output_path}")
-            
-        return success
+        target_format = normalize_audio_format(audio_format)
+        if target_format is None:
+            raise ValueError(f"Formato de áudio não suportado: {audio_format}")
+
+        engine = engine.lower()
+        if engine == "piper":
+            voice = await _resolve_piper_model(voice)
+            logging.info(f"Gerando áudio com Piper TTS usando modelo: {voice}")
+        elif engine != "coqui":
+            raise ValueError(f"Engine TTS não suportada: {engine}")
+
+        # Síntese e codificação no executor dedicado ao TTS
+        audio = await run_inference("tts", _synthesize_encoded, engine, text, voice, speed, target_format)
+
+        if not audio:
+            logging.error(f"Falha ao gerar áudio TTS {engine}: nenhum dado gerado")
+            return None
+
+        logging.info(f"Áudio TTS {engine} gerado com sucesso ({target_format}, {len(audio)} bytes)")
+        return audio
+    except (ExecutorSaturated, RequestCancelled):
+        raise
     except Exception as e:
-        logging.error(f"Erro ao gerar TTS com Piper: {str(e)}")
-        return False 
\ No newline at end of file
+        logging.error(f"Erro ao gerar TTS com {engine}: {str(e)}")
+        return None
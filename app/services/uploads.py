@@ -0,0 +1,315 @@
+import io
+import os
+import json
+import tempfile
+from typing import BinaryIO, Iterable, Optional
+
+import aiofiles
+
+from app.services.metrics import route_modality, track_temp_file, release_temp_file
+from app.services.tracing import span
+
+# Tamanho máximo de cada arquivo enviado, por tipo de conteúdo
+UPLOAD_MAX_AUDIO_BYTES = int(os.environ.get("UPLOAD_MAX_AUDIO_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_MAX_IMAGE_BYTES = int(os.environ.get("UPLOAD_MAX_IMAGE_BYTES", str(20 * 1024 * 1024)))
+UPLOAD_MAX_ARCHIVE_BYTES = int(os.environ.get("UPLOAD_MAX_ARCHIVE_BYTES", str(512 * 1024 * 1024)))
+UPLOAD_MAX_TEXT_BYTES = int(os.environ.get("UPLOAD_MAX_TEXT_BYTES", str(32 * 1024 * 1024)))
+
+# Uploads até este tamanho ficam na memória; acima dele são gravados em arquivo temporário
+UPLOAD_SPOOL_BYTES = int(os.environ.get("UPLOAD_SPOOL_BYTES", str(1024 * 1024)))
+
+# Tamanho de cada leitura do upload
+UPLOAD_CHUNK_BYTES = 256 * 1024
+
+# Limite do corpo da requisição por modalidade, verificado durante a recepção por UploadLimitMiddleware
+# (um arquivo no maior tamanho permitido, mais os campos do formulário)
+UPLOAD_BODY_LIMITS = {
+    "stt": UPLOAD_MAX_AUDIO_BYTES + 1024 * 1024,
+    "vision": max(UPLOAD_MAX_ARCHIVE_BYTES, UPLOAD_MAX_IMAGE_BYTES) + 1024 * 1024,
+    "rag": UPLOAD_MAX_TEXT_BYTES + 1024 * 1024,
+}
+
+# Tipos reconhecidos (extensão canônica) e seus media types
+MEDIA_TYPES = {
+    "jpg": "image/jpeg",
+    "png": "image/png",
+    "webp": "image/webp",
+    "wav": "audio/wav",
+    "mp3": "audio/mpeg",
+    "ogg": "audio/ogg",
+    "flac": "audio/flac",
+    "m4a": "audio/mp4",
+    "webm": "audio/webm",
+    "zip": "application/zip",
+    "tar": "application/x-tar",
+    "gz": "application/gzip",
+    "txt": "text/plain",
+    "md": "text/markdown",
+}
+
+IMAGE_TYPES = ("jpg", "png", "webp")
+AUDIO_TYPES = ("wav", "mp3", "ogg", "flac", "m4a", "webm")
+ARCHIVE_TYPES = ("zip", "tar", "gz")
+TEXT_TYPES = ("txt", "md")  # Sem assinatura: reconhecidos pela extensão
+
+# Extensões de nome de arquivo aceitas para cada tipo
+EXTENSION_TYPES = {
+    ".jpg": "jpg", ".jpeg": "jpg", ".png": "png", ".webp": "webp",
+    ".wav": "wav", ".mp3": "mp3", ".ogg": "ogg", ".flac": "flac", ".m4a": "m4a", ".webm": "webm",
+    ".zip": "zip", ".tar": "tar", ".tar.gz": "gz", ".tgz": "gz",
+    ".txt": "txt", ".md": "md", ".markdown": "md",
+}
+
+# Bytes necessários para reconhecer todos os tipos (o tar é identificado no offset 257)
+_SNIFF_BYTES = 512
+
+class UploadRejected(Exception):
+    """Upload recusado (tamanho ou tipo); `status_code` é o status HTTP da resposta"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+def sniff_type(header: bytes) -> Optional[str]:
+    """
+    Identifica o tipo do conteúdo pelos bytes iniciais (assinaturas dos formatos)
+
+    Returns:
+        Tipo de MEDIA_TYPES, ou None se não reconhecido
+    """
+    if header.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    if header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+        return "wav"
+    if header.startswith(b"ID3") or (len(header) > 1 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0):
+        return "mp3"
+    if header.startswith(b"OggS"):
+        return "ogg"
+    if header.startswith(b"fLaC"):
+        return "flac"
+    if header[4:8] == b"ftyp":
+        return "m4a"
+    if header.startswith(b"\x1a\x45\xdf\xa3"):
+        return "webm"
+    if header.startswith((b"PK\x03\x04", b"PK\x05\x06")):
+        return "zip"
+    if header.startswith(b"\x1f\x8b"):
+        return "gz"
+    if header[257:262] == b"ustar":
+        return "tar"
+    return None
+
+def extension_type(filename: Optional[str]) -> Optional[str]:
+    """Tipo indicado pela extensão do nome do arquivo (ex.: "foto.JPEG" → "jpg")"""
+    name = (filename or "").lower()
+    for extension, kind in sorted(EXTENSION_TYPES.items(), key=lambda item: -len(item[0])):
+        if name.endswith(extension):
+            return kind
+    return None
+
+def upload_body_limit(path: str) -> Optional[int]:
+    """Limite do corpo da requisição para a rota, ou None se não houver"""
+    return UPLOAD_BODY_LIMITS.get(route_modality(path))
+
+def _extensions_for(types: Iterable[str]) -> str:
+    return ", ".join(extension for extension, kind in EXTENSION_TYPES.items() if kind in types)
+
+def _spool_file(kind: str, modality: str) -> str:
+    handle, path = tempfile.mkstemp(prefix=f"upload-{modality}-", suffix=f".{kind}")
+    os.close(handle)
+    return path
+
+class StoredUpload:
+    """
+    Upload já recebido: bytes na memória (pequenos) ou no arquivo temporário do Starlette (grandes)
+
+    Os serviços recebem os bytes (read), um arquivo aberto para leitura (open,
+    ex.: zip/tar) ou um caminho no disco (as_path, ex.: ffmpeg/Whisper), sem
+    precisar saber onde o conteúdo está. O arquivo temporário do Starlette não
+    tem nome, então as_path grava uma cópia nomeada na primeira chamada.
+    close() remove a cópia e libera o arquivo do upload.
+    """
+
+    def __init__(self, filename: str, kind: str, modality: str, size: int,
+                 data: Optional[bytes] = None, upload=None):
+        self.filename = filename
+        self.kind = kind
+        self.media_type = MEDIA_TYPES.get(kind, "application/octet-stream")
+        self.modality = modality
+        self.size = size
+        self._data = data
+        self._upload = upload
+        self._path: Optional[str] = None
+        if upload is not None:
+            track_temp_file(modality, size)
+
+    @property
+    def in_memory(self) -> bool:
+        return self._data is not None
+
+    async def read(self) -> bytes:
+        if self._data is not None:
+            return self._data
+        await self._upload.seek(0)
+        return await self._upload.read()
+
+    def open(self) -> BinaryIO:
+        """Arquivo para leitura síncrona (fora do event loop, ou em leituras curtas)"""
+        if self._data is not None:
+            return io.BytesIO(self._data)
+        # Descritor duplicado: fechar o arquivo retornado não fecha o do upload
+        f = os.fdopen(os.dup(self._upload.file.fileno()), "rb")
+        f.seek(0)
+        return f
+
+    async def as_path(self) -> str:
+        """Caminho do conteúdo no disco, gravando-o na primeira chamada"""
+        if self._path is None:
+            self._path = _spool_file(self.kind, self.modality)
+            async with aiofiles.open(self._path, "wb") as f:
+                if self._data is not None:
+                    await f.write(self._data)
+                else:
+                    await self._upload.seek(0)
+                    while chunk := await self._upload.read(UPLOAD_CHUNK_BYTES):
+                        await f.write(chunk)
+            track_temp_file(self.modality, self.size)
+        return self._path
+
+    def close(self):
+        if self._path is not None:
+            release_temp_file(self.modality, self.size)
+            try:
+                os.remove(self._path)
+            except OSError:
+                pass
+            self._path = None
+        if self._upload is not None:
+            release_temp_file(self.modality, self.size)
+            self._upload.file.close()
+            self._upload = None
+        self._data = None
+
+async def ingest_upload(
+    upload,
+    modality: str,
+    allowed_types: Iterable[str],
+    max_bytes: int,
+    spool_bytes: Optional[int] = UPLOAD_SPOOL_BYTES
+) -> StoredUpload:
+    """
+    Valida tipo e tamanho de um upload já recebido, sem copiar o conteúdo grande
+
+    O Starlette já gravou o arquivo durante o parsing do formulário (na memória
+    ou, acima de 1 MB, em arquivo temporário), com o corpo limitado durante a
+    recepção por UploadLimitMiddleware. O tipo vem dos bytes iniciais; a
+    extensão do nome só é usada quando o conteúdo não é reconhecido.
+
+    Args:
+        upload: UploadFile recebido pela rota
+        modality: Modalidade da rota (stt, vision, rag), usada nas métricas de arquivos temporários
+        allowed_types: Tipos aceitos (ex.: IMAGE_TYPES)
+        max_bytes: Tamanho máximo do arquivo
+        spool_bytes: Acima deste tamanho, o conteúdo fica no arquivo do upload em vez de ser lido
+            para a memória; None mantém tudo na memória
+
+    Returns:
+        StoredUpload com o conteúdo; o chamador deve chamar close()
+
+    Raises:
+        UploadRejected: 413 se exceder max_bytes, 415 se o conteúdo não for de um tipo aceito
+    """
+    allowed_types = tuple(allowed_types)
+    filename = upload.filename or ""
+
+    with span("upload"):
+        await upload.seek(0)
+        header = await upload.read(_SNIFF_BYTES)
+        kind = sniff_type(header) or extension_type(filename)
+        if kind not in allowed_types:
+            raise UploadRejected(
+                415,
+                f"Tipo de arquivo não suportado: {filename or 'sem nome'}. Use: {_extensions_for(allowed_types)}"
+            )
+
+        size = upload.size
+        if size is None:
+            await upload.seek(0)
+            size = 0
+            while chunk := await upload.read(UPLOAD_CHUNK_BYTES):
+                size += len(chunk)
+        if size > max_bytes:
+            raise UploadRejected(413, f"Arquivo maior que o limite de {max_bytes} bytes: {filename}")
+
+        if spool_bytes is not None and size > spool_bytes:
+            return StoredUpload(filename, kind, modality, size, upload=upload)
+        await upload.seek(0)
+        return StoredUpload(filename, kind, modality, size, data=await upload.read())
+
+class UploadLimitMiddleware:
+    """
+    Middleware ASGI que limita o corpo das rotas de upload (UPLOAD_BODY_LIMITS)
+
+    O Content-Length, quando presente, é verificado antes da leitura; os bytes
+    recebidos são contados durante a recepção, então corpos sem Content-Length
+    (chunked) ou que mentem o tamanho também param no limite, com 413.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        limit = upload_body_limit(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        rejected = UploadRejected(413, f"Requisição maior que o limite de {limit} bytes")
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > limit:
+            await _send_rejection(send, rejected)
+            return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def _receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    raise rejected
+            return message
+
+        async def _send(message):
+            nonlocal response_started
+            # A resposta da aplicação ao erro de leitura (ex.: 400 do parsing) é substituída pelo 413
+            if exceeded and not response_started:
+                return
+            response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, _receive, _send)
+        except UploadRejected as e:
+            if e is not rejected:
+                raise
+        if exceeded and not response_started:
+            await _send_rejection(send, rejected)
+
+async def _send_rejection(send, rejected: UploadRejected):
+    body = json.dumps({"detail": rejected.detail}, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": rejected.status_code,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
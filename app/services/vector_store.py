@@ -0,0 +1,349 @@
+import os
+import json
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+
+from app.services.file_lock import FileLock, claim
+
+# Linhas processadas por bloco na busca exata (limita memória temporária)
+SEARCH_BLOCK_ROWS = 65536
+
+class VectorStore:
+    """
+    Armazenamento append-only de vetores normalizados em uma única matriz memory-mapped
+
+    Arquivos no diretório:
+        store.json      dimensão, dtype e número de linhas confirmadas
+        vectors.bin     matriz (count, dim) em float32 ou float16, linha a linha
+        ids.txt         um id por linha (opcionalmente "id<TAB>chave"), na ordem das linhas
+        metadata.jsonl  metadados em JSON, uma linha por vetor
+        offsets.bin     pares int64 (offset, tamanho) de cada linha em metadata.jsonl
+        store.lock      trava de escrita entre processos
+        store.owner     trava mantida pelos processos com o armazenamento aberto
+
+    O contador em store.json é gravado por último, então linhas parcialmente
+    escritas por uma interrupção são descartadas pelo próximo escritor.
+
+    Vários processos (ex.: os workers de app.serve) podem abrir o mesmo
+    diretório: as escritas são serializadas pela trava de escrita e cada
+    processo carrega as linhas confirmadas pelos demais antes de buscar ou
+    inserir. Com `exclusive=True` a abertura falha se outro processo estiver
+    com o armazenamento aberto.
+    """
+
+    def __init__(self, directory: str, dtype: str = "float32", exclusive: bool = False):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._info_path = os.path.join(directory, "store.json")
+        self._vectors_path = os.path.join(directory, "vectors.bin")
+        self._ids_path = os.path.join(directory, "ids.txt")
+        self._metadata_path = os.path.join(directory, "metadata.jsonl")
+        self._offsets_path = os.path.join(directory, "offsets.bin")
+        self._write_lock = FileLock(os.path.join(directory, "store.lock"))
+        self._owner = claim(os.path.join(directory, "store.owner"), exclusive)
+
+        for path in (self._vectors_path, self._ids_path, self._metadata_path, self._offsets_path):
+            open(path, "ab").close()
+
+        self.dim: Optional[int] = None
+        self.dtype = np.dtype(dtype)
+        self._count = 0
+        self._ids_end = 0  # Bytes de ids.txt correspondentes às linhas carregadas
+        self._matrix: Optional[np.memmap] = None
+        self._offsets: Optional[np.memmap] = None
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._keys: Dict[str, int] = {}
+
+        # Carregar as linhas confirmadas e descartar escritas interrompidas
+        with self.locked():
+            pass
+
+    def __len__(self) -> int:
+        self.refresh()
+        return self._count
+
+    def __contains__(self, feature_id: str) -> bool:
+        self.refresh()
+        return feature_id in self._rows
+
+    def _row_bytes(self) -> int:
+        return (self.dim or 0) * self.dtype.itemsize
+
+    def refresh(self):
+        """
+        Carrega as linhas confirmadas por outros processos desde a última leitura
+
+        Custa um stat quando nada mudou: ids.txt é escrito antes do contador,
+        então só há linhas novas se ele cresceu.
+        """
+        if os.path.getsize(self._ids_path) <= self._ids_end:
+            return
+        with self._lock:
+            if not os.path.exists(self._info_path):
+                return
+            with open(self._info_path, "r") as f:
+                info = json.load(f)
+            if info["count"] <= self._count:
+                return
+            if self.dim is None:
+                self.dim = info["dim"]
+                self.dtype = np.dtype(info["dtype"])
+
+            with open(self._ids_path, "rb") as f:
+                f.seek(self._ids_end)
+                for row in range(self._count, info["count"]):
+                    feature_id, _, key = f.readline().decode("utf-8").rstrip("\n").partition("\t")
+                    self._ids.append(feature_id)
+                    self._rows[feature_id] = row
+                    if key:
+                        self._keys[key] = row
+                self._ids_end = f.tell()
+            self._count = info["count"]
+
+    @contextmanager
+    def locked(self) -> Iterator["VectorStore"]:
+        """
+        Trava de escrita (entre threads e processos), com o estado recarregado do disco
+
+        Use para checar e inserir de forma atômica (ex.: deduplicação por chave);
+        add e add_many já a tomam.
+        """
+        with self._write_lock:
+            self.refresh()
+            self._discard_uncommitted()
+            yield self
+
+    def _discard_uncommitted(self):
+        """Descarta dados além do último contador confirmado (escrita interrompida)"""
+        metadata_end = 0
+        if self._count:
+            offset, length = self._get_offsets()[self._count - 1]
+            metadata_end = int(offset + length)
+
+        for path, end in (
+            (self._vectors_path, self._count * self._row_bytes()),
+            (self._offsets_path, self._count * 16),
+            (self._metadata_path, metadata_end),
+            (self._ids_path, self._ids_end)
+        ):
+            if os.path.getsize(path) > end:
+                os.truncate(path, end)
+
+    def _write_info(self):
+        tmp_path = self._info_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"dim": self.dim, "dtype": self.dtype.name, "count": self._count}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._info_path)
+
+    def _get_matrix(self, count: int) -> Optional[np.ndarray]:
+        """Retorna a matriz mapeada com pelo menos `count` linhas"""
+        if count == 0:
+            return None
+        matrix = self._matrix
+        if matrix is None or matrix.shape[0] < count:
+            matrix = np.memmap(self._vectors_path, dtype=self.dtype, mode="r", shape=(count, self.dim))
+            self._matrix = matrix
+        return matrix[:count]
+
+    def _get_offsets(self) -> np.ndarray:
+        offsets = self._offsets
+        if offsets is None or offsets.shape[0] < self._count:
+            offsets = np.memmap(self._offsets_path, dtype=np.int64, mode="r", shape=(self._count, 2))
+            self._offsets = offsets
+        return offsets
+
+    def add(
+        self,
+        feature_id: str,
+        vector: np.ndarray,
+        metadata: Optional[Dict[str, Any]] = None,
+        key: Optional[str] = None
+    ) -> int:
+        """Adiciona um vetor e retorna o número da sua linha"""
+        keys = [key] if key else None
+        return self.add_many([feature_id], np.asarray(vector)[None, :], [metadata or {}], keys)[0]
+
+    def add_many(
+        self,
+        feature_ids: Sequence[str],
+        vectors: np.ndarray,
+        metadatas: Optional[Sequence[Dict[str, Any]]] = None,
+        keys: Optional[Sequence[Optional[str]]] = None
+    ) -> List[int]:
+        """
+        Adiciona vários vetores de uma vez, confirmando o contador uma única vez
+
+        Args:
+            feature_ids: Id de cada vetor
+            vectors: Matriz (n, dim)
+            metadatas: Metadados de cada vetor
+            keys: Chave de deduplicação opcional de cada vetor (ex.: hash do conteúdo)
+
+        Returns:
+            Lista com o número da linha de cada vetor adicionado
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[0] != len(feature_ids):
+            raise ValueError("vectors deve ter formato (n, dim) com um id por linha")
+        if metadatas is None:
+            metadatas = [{} for _ in feature_ids]
+        if keys is None:
+            keys = [None for _ in feature_ids]
+
+        with self.locked():
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Dimensão {vectors.shape[1]} incompatível com o armazenamento ({self.dim})")
+
+            for feature_id in feature_ids:
+                if feature_id in self._rows or "\n" in feature_id or "\t" in feature_id:
+                    raise ValueError(f"Id inválido ou duplicado: {feature_id}")
+            for key in keys:
+                if key and (key in self._keys or "\n" in key or "\t" in key):
+                    raise ValueError(f"Chave inválida ou duplicada: {key}")
+
+            with open(self._vectors_path, "ab") as f:
+                f.write(vectors.astype(self.dtype).tobytes())
+
+            offsets = []
+            with open(self._metadata_path, "ab") as f:
+                position = f.tell()
+                for metadata in metadatas:
+                    line = (json.dumps(metadata, ensure_ascii=False) + "\n").encode("utf-8")
+                    f.write(line)
+                    offsets.append((position, len(line)))
+                    position += len(line)
+
+            with open(self._offsets_path, "ab") as f:
+                f.write(np.asarray(offsets, dtype=np.int64).tobytes())
+
+            ids_data = "".join(
+                f"{feature_id}\t{key}\n" if key else f"{feature_id}\n"
+                for feature_id, key in zip(feature_ids, keys)
+            ).encode("utf-8")
+            with open(self._ids_path, "ab") as f:
+                f.write(ids_data)
+
+            first_row = self._count
+            with self._lock:
+                for offset, (feature_id, key) in enumerate(zip(feature_ids, keys)):
+                    self._ids.append(feature_id)
+                    self._rows[feature_id] = first_row + offset
+                    if key:
+                        self._keys[key] = first_row + offset
+                self._ids_end += len(ids_data)
+                self._count += len(feature_ids)
+            self._write_info()
+
+            return list(range(first_row, self._count))
+
+    def get_id(self, row: int) -> str:
+        return self._ids[row]
+
+    def get_row(self, feature_id: str) -> Optional[int]:
+        self.refresh()
+        return self._rows.get(feature_id)
+
+    def find_key(self, key: str) -> Optional[str]:
+        """Retorna o id do vetor armazenado com a chave de deduplicação, se houver"""
+        self.refresh()
+        row = self._keys.get(key)
+        return None if row is None else self._ids[row]
+
+    def get_vectors(self, rows: Sequence[int]) -> np.ndarray:
+        """Retorna os vetores (float32) das linhas indicadas"""
+        matrix = self._get_matrix(self._count)
+        if matrix is None:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.asarray(matrix[np.asarray(rows, dtype=np.int64)], dtype=np.float32)
+
+    def get_metadata(self, rows: Iterable[int]) -> List[Dict[str, Any]]:
+        """Lê do disco apenas os metadados das linhas indicadas"""
+        rows = list(rows)
+        if not rows:
+            return []
+        offsets = self._get_offsets()
+        results = []
+        with open(self._metadata_path, "rb") as f:
+            for row in rows:
+                offset, length = offsets[row]
+                f.seek(int(offset))
+                results.append(json.loads(f.read(int(length))))
+        return results
+
+    def scores(self, query: np.ndarray, count: Optional[int] = None) -> np.ndarray:
+        """Similaridade (produto interno) da consulta com todas as linhas"""
+        count = self._count if count is None else count
+        matrix = self._get_matrix(count)
+        if matrix is None:
+            return np.zeros(0, dtype=np.float32)
+
+        query = np.asarray(query, dtype=np.float32)
+        scores = np.empty(count, dtype=np.float32)
+        for start in range(0, count, SEARCH_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + block.shape[0]] = block @ query
+        return scores
+
+    def search(
+        self,
+        query: np.ndarray,
+        top_k: int = 5,
+        exclude: Optional[Iterable[str]] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Busca exata: um produto matriz-vetor seguido de seleção top-k
+
+        Returns:
+            Lista de (linha, similaridade) em ordem decrescente de similaridade
+        """
+        self.refresh()
+        count = self._count
+        if count == 0 or top_k <= 0:
+            return []
+
+        scores = self.scores(query, count)
+        for feature_id in exclude or ():
+            row = self._rows.get(feature_id)
+            if row is not None and row < count:
+                scores[row] = -np.inf
+
+        return top_k_rows(scores, top_k)
+
+def top_k_rows(scores: np.ndarray, top_k: int, rows: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+    """
+    Seleciona os top_k maiores scores com argpartition
+
+    Args:
+        scores: Scores dos candidatos
+        top_k: Número de resultados
+        rows: Linha correspondente a cada score (padrão: a própria posição)
+
+    Returns:
+        Lista de (linha, score) em ordem decrescente, sem candidatos excluídos (-inf)
+    """
+    top_k = min(top_k, scores.shape[0])
+    if top_k <= 0:
+        return []
+    if top_k < scores.shape[0]:
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        candidates = np.arange(scores.shape[0])
+    candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+
+    results = []
+    for position in candidates:
+        score = float(scores[position])
+        if score == -np.inf:
+            continue
+        row = int(rows[position]) if rows is not None else int(position)
+        results.append((row, score))
+    return results
@@ -5,293 +5,1182 @@ import uuid
 import json
 import datetime
 from pathlib import Path
-from typing import List, Dict, Optional, Any, Union
+from typing import List, Dict, Optional, Any, Union, Iterator, AsyncIterator, Tuple
 import numpy as np
+import hashlib
+import threading
+import itertools
+from collections import OrderedDict
+
+from app.services.model_registry import registry
+from app.services.vector_store import VectorStore
+from app.services.file_lock import FileLock
+from app.services.ann_index import IVFPQIndex, ANN_ENABLED, ANN_MIN_TRAIN_SIZE, ANN_RERANK, ensure_trained
+from app.services.batching import MicroBatcher
+from app.services.image_preprocessing import decode_image, preprocess_blip, preprocess_clip
+from app.services.vision_onnx import get_blip_onnx, get_clip_onnx
+from app.services.executors import ExecutorSaturated, run_inference
+from app.services.deadlines import RequestCancelled, check_deadline
+from app.services.tracing import span, traced
 
 # Diretório para armazenar features extraídas
 FEATURES_DIR = "app/models/features"
 os.makedirs(FEATURES_DIR, exist_ok=True)
 
+# Precisão da matriz de features (float32 ou float16)
+FEATURES_DTYPE = os.environ.get("FEATURES_DTYPE", "float32")
+
+_feature_store: Optional[VectorStore] = None
+_feature_store_lock = threading.Lock()
+
+def get_feature_store() -> VectorStore:
+    """Retorna o armazenamento consolidado de features, abrindo-o na primeira chamada"""
+    global _feature_store
+    if _feature_store is None:
+        with _feature_store_lock:
+            if _feature_store is None:
+                _feature_store = VectorStore(FEATURES_DIR, dtype=FEATURES_DTYPE)
+    return _feature_store
+
+_ann_index: Optional[IVFPQIndex] = None
+_ann_training = threading.Lock()
+
+def get_ann_index() -> Optional[IVFPQIndex]:
+    """Retorna o índice aproximado das features, ou None se ANN_ENABLED estiver desligado"""
+    global _ann_index
+    if not ANN_ENABLED:
+        return None
+    if _ann_index is None:
+        with _feature_store_lock:
+            if _ann_index is None:
+                _ann_index = IVFPQIndex(FEATURES_DIR)
+    return _ann_index
+
+def _train_ann_index():
+    try:
+        ensure_trained(get_ann_index(), get_feature_store())
+    except Exception as e:
+        print(f"Erro ao treinar índice ANN: {str(e)}")
+    finally:
+        _ann_training.release()
+
+def update_ann_index():
+    """
+    Mantém o índice aproximado em dia com o armazenamento
+
+    Vetores novos são indexados incrementalmente; o treino inicial, quando o
+    armazenamento atinge ANN_MIN_TRAIN_SIZE, roda em uma thread separada.
+    """
+    index = get_ann_index()
+    if index is None:
+        return
+    store = get_feature_store()
+    if index.trained:
+        index.sync(store)
+    elif len(store) >= ANN_MIN_TRAIN_SIZE and _ann_training.acquire(blocking=False):
+        threading.Thread(target=_train_ann_index, name="ann-train", daemon=True).start()
+
+def _matches_filters(metadata: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+    """Igualdade por chave de metadado; valores em lista aceitam qualquer um dos itens"""
+    for key, expected in filters.items():
+        value = metadata.get(key)
+        if isinstance(expected, list):
+            if value not in expected:
+                return False
+        elif value != expected:
+            return False
+    return True
+
+@traced("search")
+def search_features(
+    query: np.ndarray,
+    top_k: int,
+    exclude: Optional[List[str]] = None,
+    nprobe: Optional[int] = None,
+    exact: bool = False,
+    filters: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Busca os vetores armazenados mais similares à consulta
+
+    Usa o índice aproximado quando disponível e treinado (a menos que `exact`
+    seja True); caso contrário, faz a busca exata vetorizada. Com `filters`,
+    candidatos extras são buscados até haver `top_k` resultados que satisfaçam
+    os filtros de metadados (ou a coleção se esgotar).
+
+    Returns:
+        Lista de dicionários com id, similarity e metadata, apenas dos vencedores
+    """
+    store = get_feature_store()
+    exclude = exclude or []
+    index = None if exact else get_ann_index()
+    if index is not None:
+        index.refresh()  # Treino e linhas indexadas por outros workers
+    total = len(store)
+
+    fetch = top_k * 4 if filters else top_k
+    while True:
+        if index is not None and index.trained:
+            kwargs = {"nprobe": nprobe} if nprobe else {}
+            matches = index.search(query, fetch + len(exclude), store, rerank=max(fetch, ANN_RERANK), **kwargs)
+            excluded_rows = {store.get_row(feature_id) for feature_id in exclude}
+            matches = [match for match in matches if match[0] not in excluded_rows][:fetch]
+        else:
+            matches = store.search(query, top_k=fetch, exclude=exclude)
+
+        # Carregar metadados apenas dos candidatos
+        metadatas = store.get_metadata(row for row, _ in matches)
+        results = [
+            {
+                "id": store.get_id(row),
+                "similarity": similarity,
+                "metadata": metadata
+            }
+            for (row, similarity), metadata in zip(matches, metadatas)
+            if not filters or _matches_filters(metadata, filters)
+        ]
+
+        if len(results) >= top_k or not filters or fetch >= total:
+            return results[:top_k]
+        fetch = min(fetch * 4, total)
+
+# Checkpoints usados pelos serviços de visão
+BLIP_MODEL_ID = os.environ.get("BLIP_MODEL_ID", "Salesforce/blip-image-captioning-large")
+CLIP_MODEL_ID = os.environ.get("CLIP_MODEL_ID", "openai/clip-vit-base-patch32")
+
+# Arquivo com os conjuntos de rótulos registrados pelos usuários
+LABEL_SETS_PATH = "app/models/label_sets.json"
+
+# Embeddings de texto dos conjuntos registrados, persistidos junto a LABEL_SETS_PATH
+LABEL_EMBEDDINGS_DIR = "app/models/label_embeddings"
+
+# Número máximo de listas de rótulos com embeddings em cache
+TEXT_EMBEDDING_CACHE_SIZE = int(os.environ.get("TEXT_EMBEDDING_CACHE_SIZE", "64"))
+
+# Número máximo de consultas de texto com embeddings em cache
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+
+# Rótulos codificados por passagem do CLIP de texto
+TEXT_EMBEDDING_BATCH_SIZE = 256
+
+# Lista básica de categorias em português, usada quando nenhuma é fornecida
+DEFAULT_CATEGORIES = [
+    "foto", "desenho", "paisagem", "retrato", "animal", 
+    "comida", "prédio", "planta", "veículo", "pessoa",
+    "esporte", "arte", "tecnologia", "natureza", "urbano",
+    "interior", "exterior", "dia", "noite", "água",
+    "montanha", "praia", "floresta", "deserto", "neve"
+]
+
+# Micro-batching das requisições concorrentes ao CLIP de imagem
+VISION_MICROBATCH = os.environ.get("VISION_MICROBATCH", "1") == "1"
+VISION_MICROBATCH_MAX_SIZE = int(os.environ.get("VISION_MICROBATCH_MAX_SIZE", "16"))
+VISION_MICROBATCH_WAIT_MS = float(os.environ.get("VISION_MICROBATCH_WAIT_MS", "5"))
+
+# Menor lado da entrada de cada modelo (decodificação reduzida até esse tamanho)
+CLIP_INPUT_SIZE = int(os.environ.get("CLIP_INPUT_SIZE", "224"))
+BLIP_INPUT_SIZE = int(os.environ.get("BLIP_INPUT_SIZE", "384"))
+
+# Execução dos modelos: "torch" (PyTorch) ou "onnx" (ONNX Runtime, grafos de scripts/export_onnx.py)
+VISION_BACKEND = os.environ.get("VISION_BACKEND", "torch")
+
+# Modelos de visão aquecidos na inicialização, além de WARMUP_COMPONENTS (ex.: "blip")
+VISION_PRELOAD = os.environ.get("VISION_PRELOAD", "")
+
+def _get_device() -> str:
+    """Retorna o dispositivo de inferência (GPU se disponível)"""
+    if VISION_BACKEND == "onnx":
+        return "cpu"
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+def _prepare_for_inference(model, device: str):
+    """Move o modelo para o dispositivo e o configura apenas para inferência"""
+    model = model.to(device)
+    model.eval()
+    model.requires_grad_(False)
+    return model
+
+def get_blip(device: Optional[str] = None):
+    """
+    Retorna o par (processor, model) do BLIP residente para o dispositivo
+    """
+    device = device or _get_device()
+
+    def _load():
+        from transformers import BlipProcessor, BlipForConditionalGeneration
+        processor = BlipProcessor.from_pretrained(BLIP_MODEL_ID)
+        model = BlipForConditionalGeneration.from_pretrained(BLIP_MODEL_ID)
+        return processor, _prepare_for_inference(model, device)
+
+    return registry.get(("blip", BLIP_MODEL_ID, device), _load)
+
+def get_clip(device: Optional[str] = None):
+    """
+    Retorna o par (processor, model) do CLIP residente para o dispositivo
+    """
+    device = device or _get_device()
+
+    def _load():
+        from transformers import CLIPProcessor, CLIPModel
+        processor = CLIPProcessor.from_pretrained(CLIP_MODEL_ID)
+        model = CLIPModel.from_pretrained(CLIP_MODEL_ID)
+        return processor, _prepare_for_inference(model, device)
+
+    return registry.get(("clip", CLIP_MODEL_ID, device), _load)
+
+def preload_vision_models(names: Optional[List[str]] = None):
+    """
+    Carrega antecipadamente os modelos de visão indicados (clip, blip)
+
+    Função síncrona: deve ser executada fora do event loop.
+    """
+    if names is None:
+        names = [name.strip() for name in VISION_PRELOAD.split(",") if name.strip()]
+    if VISION_BACKEND == "onnx":
+        loaders = {"clip": get_clip_onnx, "blip": get_blip_onnx}
+    else:
+        loaders = {"clip": get_clip, "blip": get_blip}
+    for name in names:
+        if name in loaders:
+            loaders[name]()
+        else:
+            print(f"Modelo de visão desconhecido para pré-carga: {name}")
+
+@traced("decode")
+def _open_image(source: Union[str, bytes], target_size: Optional[int] = None):
+    """
+    Decodifica uma imagem (caminho ou bytes) em RGB, reduzida até `target_size`
+
+    Sem `target_size`, usa o maior tamanho de entrada entre CLIP e BLIP, de
+    modo que a mesma imagem decodificada sirva para ambos.
+    """
+    return decode_image(source, target_size or max(CLIP_INPUT_SIZE, BLIP_INPUT_SIZE))
+
+def _generate_captions(
+    images: List[Any],
+    prompt: Optional[str] = None,
+    backend: Optional[str] = None
+) -> List[str]:
+    """
+    Gera descrições para um lote de imagens em uma única chamada ao BLIP
+
+    Com `prompt`, a descrição é condicionada ao texto (que o BLIP continua).
+
+    Função síncrona: deve ser executada fora do event loop.
+    """
+    if (backend or VISION_BACKEND) == "onnx":
+        blip = get_blip_onnx()
+        with span("blip_preprocess"):
+            pixel_values = preprocess_blip(images, blip.processor.image_processor)
+        with span("blip_inference"):
+            return blip.generate(pixel_values, prompt, max_new_tokens=100)
+
+    import torch
+
+    # Obter modelo e processador do registro
+    device = _get_device()
+    processor, model = get_blip(device)
+
+    # Redimensionar e normalizar o lote de uma vez (NumPy)
+    with span("blip_preprocess"):
+        pixel_values = torch.from_numpy(preprocess_blip(images, processor.image_processor)).to(device)
+
+    # Texto inicial opcional, repetido para cada imagem do lote
+    text_inputs = {}
+    if prompt:
+        text_inputs = processor(text=[prompt] * len(images), return_tensors="pt").to(device)
+        text_inputs = {"input_ids": text_inputs["input_ids"], "attention_mask": text_inputs["attention_mask"]}
+
+    # Gerar descrições
+    with span("blip_inference"), torch.inference_mode():
+        output = model.generate(pixel_values=pixel_values, max_new_tokens=100, **text_inputs)
+    return processor.batch_decode(output, skip_special_tokens=True)
+
 async def generate_image_caption(
-    image_path: str, 
+    image: Union[str, bytes], 
     model_name: str = "blip2"
 ) -> Optional[str]:
     """
     Gera uma descrição para a imagem usando BLIP-2
     
     Args:
-        image_path: Caminho para o arquivo de imagem
+        image: Caminho para o arquivo de imagem ou seus bytes
         model_name: Nome do modelo (blip2)
     
     Returns:
         String com a descrição da imagem ou None se falhar
     """
     try:
-        # Importar bibliotecas apenas quando necessário
-        from transformers import BlipProcessor, BlipForConditionalGeneration
-        from PIL import Image
-        import torch
-        
-        # Função para carregar modelo e gerar caption (não assíncrona)
+        # Função para gerar caption com o modelo residente (não assíncrona)
         def _generate_caption():
-            # Carregar modelo e processador
-            processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-large")
-            model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-large")
-            
-            # Mover para GPU se disponível
-            device = "cuda" if torch.cuda.is_available() else "cpu"
-            model = model.to(device)
-            
-            # Carregar e processar imagem
-            image = Image.open(image_path).convert('RGB')
-            inputs = processor(image, return_tensors="pt").to(device)
-            
-            # Gerar descrição
-            output = model.generate(**inputs, max_new_tokens=100)
-            caption = processor.decode(output[0], skip_special_tokens=True)
-            
-            return caption
+            return _generate_captions([_open_image(image, BLIP_INPUT_SIZE)])[0]
         
-        # Executar em um ThreadPool pois os modelos PyTorch não são async-friendly
-        loop = asyncio.get_event_loop()
-        caption = await loop.run_in_executor(None, _generate_caption)
+        # Executar no executor do BLIP, pois os modelos PyTorch não são async-friendly
+        caption = await run_inference("caption", _generate_caption)
         
         return caption
+    except (ExecutorSaturated, RequestCancelled):
+        raise
     except Exception as e:
         print(f"Erro ao gerar caption: {str(e)}")
         return None
 
+_text_embedding_cache: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+_text_embedding_lock = threading.Lock()
+
+def _labels_hash(labels: List[str]) -> str:
+    return hashlib.sha1("\n".join(labels).encode("utf-8")).hexdigest()
+
+def _encode_texts(texts: List[str], device: str, backend: Optional[str] = None) -> np.ndarray:
+    """Embeddings CLIP de texto normalizados, em lotes de TEXT_EMBEDDING_BATCH_SIZE"""
+    chunks = []
+    if (backend or VISION_BACKEND) == "onnx":
+        clip = get_clip_onnx()
+        for start in range(0, len(texts), TEXT_EMBEDDING_BATCH_SIZE):
+            text_inputs = clip.processor(
+                text=texts[start:start + TEXT_EMBEDDING_BATCH_SIZE],
+                return_tensors="np",
+                padding=True
+            )
+            chunks.append(clip.text_features(text_inputs["input_ids"], text_inputs["attention_mask"]))
+        embeddings = np.concatenate(chunks).astype(np.float32)
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    import torch
+
+    processor, model = get_clip(device)
+    for start in range(0, len(texts), TEXT_EMBEDDING_BATCH_SIZE):
+        text_inputs = processor(
+            text=texts[start:start + TEXT_EMBEDDING_BATCH_SIZE],
+            return_tensors="pt",
+            padding=True
+        ).to(device)
+        with torch.inference_mode():
+            chunks.append(model.get_text_features(**text_inputs).cpu().numpy())
+    embeddings = np.concatenate(chunks).astype(np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+def _label_embeddings_path(labels: List[str]) -> str:
+    """Arquivo .npy com os embeddings persistidos de uma lista de rótulos (por modelo)"""
+    return os.path.join(LABEL_EMBEDDINGS_DIR, f"{_labels_hash([CLIP_MODEL_ID, *labels])}.npy")
+
+def _save_label_embeddings(labels: List[str], embeddings: np.ndarray):
+    """Grava os embeddings de forma atômica (arquivo temporário + replace)"""
+    os.makedirs(LABEL_EMBEDDINGS_DIR, exist_ok=True)
+    path = _label_embeddings_path(labels)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, embeddings)
+    os.replace(tmp_path, path)
+
+def get_text_embeddings(labels: List[str], persist: bool = False) -> np.ndarray:
+    """
+    Retorna os embeddings CLIP normalizados dos rótulos, com cache LRU
+
+    O cache é indexado por (modelo, dispositivo, hash da lista). Fora dele, os
+    embeddings persistidos dos conjuntos registrados são lidos do disco, então
+    a torre de texto roda apenas uma vez por conjunto (mesmo após reinícios);
+    listas avulsas são recalculadas quando saem do cache.
+
+    Função síncrona: deve ser executada fora do event loop.
+
+    Args:
+        labels: Rótulos
+        persist: Gravar os embeddings em LABEL_EMBEDDINGS_DIR (conjuntos registrados)
+
+    Returns:
+        Matriz (len(labels), d) em float32
+    """
+    device = _get_device()
+    key = (CLIP_MODEL_ID, device, _labels_hash(labels))
+    path = _label_embeddings_path(labels)
+    with _text_embedding_lock:
+        embeddings = _text_embedding_cache.get(key)
+        if embeddings is not None:
+            _text_embedding_cache.move_to_end(key)
+    if embeddings is not None:
+        if persist and not os.path.exists(path):
+            _save_label_embeddings(labels, embeddings)
+        return embeddings
+
+    if os.path.exists(path):
+        try:
+            embeddings = np.load(path)
+        except (OSError, ValueError) as e:
+            print(f"Erro ao ler embeddings de rótulos em {path}: {str(e)}")
+    if embeddings is None or embeddings.shape[0] != len(labels):
+        with span("clip_text"):
+            embeddings = _encode_texts(labels, device)
+        if persist:
+            _save_label_embeddings(labels, embeddings)
+
+    with _text_embedding_lock:
+        _text_embedding_cache[key] = embeddings
+        while len(_text_embedding_cache) > TEXT_EMBEDDING_CACHE_SIZE:
+            _text_embedding_cache.popitem(last=False)
+    return embeddings
+
+_query_embedding_cache: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+
+def get_query_embedding(text: str) -> np.ndarray:
+    """
+    Embedding CLIP normalizado de uma consulta de texto, com cache LRU
+
+    Função síncrona: deve ser executada fora do event loop.
+    """
+    device = _get_device()
+    key = (CLIP_MODEL_ID, device, " ".join(text.split()).lower())
+    with _text_embedding_lock:
+        embedding = _query_embedding_cache.get(key)
+        if embedding is not None:
+            _query_embedding_cache.move_to_end(key)
+            return embedding
+
+    with span("clip_text"):
+        embedding = _encode_texts([text], device)[0]
+
+    with _text_embedding_lock:
+        _query_embedding_cache[key] = embedding
+        while len(_query_embedding_cache) > QUERY_EMBEDDING_CACHE_SIZE:
+            _query_embedding_cache.popitem(last=False)
+    return embedding
+
+def _clip_logit_scale() -> float:
+    """Temperatura aprendida do CLIP, aplicada antes do softmax"""
+    if VISION_BACKEND == "onnx":
+        return get_clip_onnx().logit_scale
+    _, model = get_clip()
+    return float(model.logit_scale.exp().item())
+
+def _label_sets_file_lock() -> FileLock:
+    """Trava entre processos da leitura-modificação-escrita de LABEL_SETS_PATH"""
+    os.makedirs(os.path.dirname(LABEL_SETS_PATH) or ".", exist_ok=True)
+    return FileLock(LABEL_SETS_PATH + ".lock")
+
+def load_label_sets() -> Dict[str, List[str]]:
+    """Lê os conjuntos de rótulos registrados"""
+    if not os.path.exists(LABEL_SETS_PATH):
+        return {}
+    with open(LABEL_SETS_PATH, "r") as f:
+        return json.load(f)
+
+_label_sets_lock = threading.Lock()
+
+async def register_label_set(name: str, labels: List[str]) -> bool:
+    """
+    Registra um conjunto nomeado de rótulos e persiste seus embeddings em LABEL_EMBEDDINGS_DIR
+    
+    Args:
+        name: Nome do conjunto
+        labels: Rótulos do conjunto
+    
+    Returns:
+        True se registrado com sucesso, False caso contrário
+    """
+    try:
+        def _register():
+            get_text_embeddings(labels, persist=True)
+            with _label_sets_lock, _label_sets_file_lock():
+                label_sets = load_label_sets()
+                previous = label_sets.get(name)
+                label_sets[name] = labels
+                tmp_path = LABEL_SETS_PATH + ".tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(label_sets, f, ensure_ascii=False)
+                os.replace(tmp_path, LABEL_SETS_PATH)
+                # Remover os embeddings da versão anterior, se nenhum outro conjunto os usa
+                if previous and previous not in label_sets.values():
+                    try:
+                        os.remove(_label_embeddings_path(previous))
+                    except FileNotFoundError:
+                        pass
+            return True
+
+        return await run_inference("clip", _register)
+    except (ExecutorSaturated, RequestCancelled):
+        raise
+    except Exception as e:
+        print(f"Erro ao registrar conjunto de rótulos: {str(e)}")
+        return False
+
+@traced("rank")
+def _rank_labels(
+    image_embedding: np.ndarray,
+    labels: List[str],
+    top_k: int
+) -> List[Dict[str, Union[str, float]]]:
+    """Classifica um embedding de imagem contra os embeddings em cache dos rótulos"""
+    text_embeddings = get_text_embeddings(labels)
+    logits = _clip_logit_scale() * (text_embeddings @ image_embedding)
+
+    # Softmax numericamente estável
+    probs = np.exp(logits - logits.max())
+    probs /= probs.sum()
+
+    top_k = min(top_k, len(labels))
+    best = np.argpartition(-probs, top_k - 1)[:top_k]
+    best = best[np.argsort(-probs[best])]
+    return [{"category": labels[i], "score": float(probs[i])} for i in best]
+
 async def classify_image(
-    image_path: str, 
+    image: Union[str, bytes], 
     model_name: str = "clip",
     top_k: int = 5,
-    categories: Optional[List[str]] = None
+    categories: Optional[List[str]] = None,
+    label_set: Optional[str] = None
 ) -> Optional[List[Dict[str, Union[str, float]]]]:
     """
     Classifica uma imagem em categorias usando CLIP
     
     Args:
-        image_path: Caminho para o arquivo de imagem
+        image: Caminho para o arquivo de imagem ou seus bytes
         model_name: Nome do modelo (clip)
         top_k: Número de categorias para retornar
         categories: Lista opcional de categorias para classificação
                    Se None, usa categorias predefinidas
+        label_set: Nome de um conjunto de rótulos registrado (tem precedência sobre categories)
     
     Returns:
         Lista de dicionários com categorias e scores ou None se falhar
     """
     try:
-        # Importar bibliotecas apenas quando necessário
-        import torch
-        from transformers import CLIPProcessor, CLIPModel
-        from PIL import Image
+        if label_set:
+            label_sets = load_label_sets()
+            if label_set not in label_sets:
+                raise ValueError(f"Conjunto de rótulos não encontrado: {label_set}")
+            categories = label_sets[label_set]
         
-        # Se não foram fornecidas categorias, usar algumas predefinidas
-        if categories is None:
-            # Lista básica de categorias em português
-            categories = [
-                "foto", "desenho", "paisagem", "retrato", "animal", 
-                "comida", "prédio", "planta", "veículo", "pessoa",
-                "esporte", "arte", "tecnologia", "natureza", "urbano",
-                "interior", "exterior", "dia", "noite", "água",
-                "montanha", "praia", "floresta", "deserto", "neve"
-            ]
+        # Se não foram fornecidas categorias, usar as predefinidas
+        if not categories:
+            categories = DEFAULT_CATEGORIES
         
-        # Função para classificar imagem (não assíncrona)
-        def _classify():
-            # Carregar modelo e processador
-            model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-            processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
-            
-            # Mover para GPU se disponível
-            device = "cuda" if torch.cuda.is_available() else "cpu"
-            model = model.to(device)
-            
-            # Carregar e processar imagem
-            image = Image.open(image_path).convert('RGB')
-            
-            # Preparar texto com as categorias
-            text_inputs = processor(
-                text=categories, 
-                images=image, 
-                return_tensors="pt", 
-                padding=True
-            ).to(device)
-            
-            # Calcular similaridade
-            with torch.no_grad():
-                outputs = model(**text_inputs)
-                logits_per_image = outputs.logits_per_image
-                probs = logits_per_image.softmax(dim=1)[0].cpu().numpy()
-            
-            # Organizar resultados
-            results = []
-            for category, score in zip(categories, probs):
-                results.append({
-                    "category": category,
-                    "score": float(score)
-                })
-            
-            # Ordenar por score e pegar os top_k
-            results = sorted(results, key=lambda x: x["score"], reverse=True)[:top_k]
-            
-            return results
+        decoded = await run_inference("vision", _open_image, image, CLIP_INPUT_SIZE)
         
-        # Executar em um ThreadPool
-        loop = asyncio.get_event_loop()
-        results = await loop.run_in_executor(None, _classify)
+        # Um único embedding de imagem comparado com os embeddings de texto em cache
+        image_embedding = await _embed_decoded_image(decoded)
+        results = await run_inference("clip", _rank_labels, image_embedding, categories, top_k)
         
         return results
+    except (ExecutorSaturated, RequestCancelled):
+        raise
     except Exception as e:
         print(f"Erro ao classificar imagem: {str(e)}")
         return None
 
-async def extract_image_features(
-    image_path: str, 
+def _compute_image_embeddings(images: List[Any], backend: Optional[str] = None) -> np.ndarray:
+    """
+    Calcula os embeddings CLIP normalizados de um lote de imagens
+
+    Função síncrona: deve ser executada fora do event loop.
+
+    Returns:
+        Matriz (len(images), d) em float32
+    """
+    if (backend or VISION_BACKEND) == "onnx":
+        clip = get_clip_onnx()
+        with span("clip_preprocess"):
+            pixel_values = preprocess_clip(images, clip.processor.image_processor)
+        with span("clip_inference"):
+            features = clip.image_features(pixel_values).astype(np.float32)
+        return features / np.linalg.norm(features, axis=1, keepdims=True)
+
+    import torch
+
+    # Obter modelo e processador do registro
+    device = _get_device()
+    processor, model = get_clip(device)
+
+    # Redimensionar, recortar e normalizar o lote de uma vez (NumPy)
+    with span("clip_preprocess"):
+        pixel_values = torch.from_numpy(preprocess_clip(images, processor.image_processor)).to(device)
+
+    # Extrair características
+    with span("clip_inference"), torch.inference_mode():
+        image_features = model.get_image_features(pixel_values=pixel_values)
+
+    # Converter para numpy e normalizar
+    features = image_features.cpu().numpy().astype(np.float32)
+    return features / np.linalg.norm(features, axis=1, keepdims=True)
+
+_clip_image_batcher = MicroBatcher(
+    "clip_image",
+    lambda images: list(_compute_image_embeddings(images)),
+    max_batch_size=VISION_MICROBATCH_MAX_SIZE,
+    max_wait_ms=VISION_MICROBATCH_WAIT_MS,
+    executor="clip"
+)
+
+async def _embed_decoded_image(image) -> np.ndarray:
+    """
+    Embedding CLIP normalizado de uma imagem já decodificada
+
+    Com VISION_MICROBATCH ativo, requisições concorrentes são agrupadas em uma
+    única passagem do modelo.
+    """
+    if VISION_MICROBATCH:
+        # Espera do lote e execução, medidas do lado da requisição
+        with span("clip_batch"):
+            return await _clip_image_batcher.submit(image)
+    embeddings = await run_inference("clip", _compute_image_embeddings, [image])
+    return embeddings[0]
+
+def get_batching_stats() -> Dict[str, Any]:
+    """Métricas do micro-batching (tamanhos de lote e esperas na fila)"""
+    return {"enabled": VISION_MICROBATCH, "backend": VISION_BACKEND, "clip_image": _clip_image_batcher.stats()}
+
+@traced("hash")
+def _content_hash(image: Union[str, bytes]) -> str:
+    """Hash SHA-256 dos bytes da imagem (caminho ou bytes)"""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(image).hexdigest()
+    digest = hashlib.sha256()
+    with open(image, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _find_stored(image: Union[str, bytes]) -> Tuple[str, Optional[str]]:
+    """
+    Calcula o hash do conteúdo e procura uma imagem já armazenada com ele
+
+    Função síncrona: deve ser executada fora do event loop.
+
+    Returns:
+        (hash do conteúdo, id das características armazenadas ou None)
+    """
+    content_hash = _content_hash(image)
+    return content_hash, get_feature_store().find_key(content_hash)
+
+@traced("store")
+def _store_features(
+    embedding: np.ndarray,
+    content_hash: str,
+    model_name: str,
+    original_image: str
+) -> Tuple[str, bool]:
+    """
+    Armazena o embedding de uma imagem, a menos que o mesmo conteúdo já exista
+
+    Função síncrona: deve ser executada fora do event loop.
+
+    Returns:
+        (id das características, True se a imagem já estava armazenada)
+    """
+    store = get_feature_store()
+    with store.locked():
+        # Outra requisição (ou worker) pode ter inserido a mesma imagem enquanto o modelo rodava
+        existing_id = store.find_key(content_hash)
+        if existing_id:
+            return existing_id, True
+        
+        # Gerar ID único
+        feature_id = str(uuid.uuid4())
+        
+        # Salvar características e metadados no armazenamento consolidado
+        metadata = {
+            "id": feature_id,
+            "model": model_name,
+            "created_at": str(datetime.datetime.now()),
+            "original_image": original_image,
+            "content_hash": content_hash
+        }
+        store.add(feature_id, embedding, metadata, key=content_hash)
+    
+    update_ann_index()
+    
+    return feature_id, False
+
+async def embed_image(
+    image: Union[str, bytes],
     model_name: str = "clip"
+) -> Optional[np.ndarray]:
+    """
+    Calcula o embedding CLIP normalizado de uma imagem sem armazená-lo
+
+    Usado para consultas, que não devem crescer o armazenamento de features.
+    
+    Args:
+        image: Caminho para o arquivo de imagem ou seus bytes
+        model_name: Nome do modelo (clip)
+    
+    Returns:
+        Vetor normalizado ou None se falhar
+    """
+    try:
+        decoded = await run_inference("vision", _open_image, image, CLIP_INPUT_SIZE)
+        return await _embed_decoded_image(decoded)
+    except (ExecutorSaturated, RequestCancelled):
+        raise
+    except Exception as e:
+        print(f"Erro ao calcular embedding: {str(e)}")
+        return None
+
+async def extract_image_features(
+    image: Union[str, bytes], 
+    model_name: str = "clip",
+    filename: Optional[str] = None
 ) -> Optional[str]:
     """
     Extrai características de uma imagem usando CLIP e armazena para uso posterior
+
+    Imagens com conteúdo idêntico (mesmo hash dos bytes) não são processadas
+    novamente: o ID já armazenado é retornado sem executar o CLIP.
     
     Args:
-        image_path: Caminho para o arquivo de imagem
+        image: Caminho para o arquivo de imagem ou seus bytes
         model_name: Nome do modelo (clip)
+        filename: Nome original do arquivo, guardado nos metadados
     
     Returns:
         ID único para as características extraídas ou None se falhar
     """
     try:
-        # Importar bibliotecas apenas quando necessário
-        import torch
-        from transformers import CLIPProcessor, CLIPModel
-        from PIL import Image
+        # Deduplicar pelo conteúdo antes de executar o modelo
+        content_hash, existing_id = await run_inference("vision", _find_stored, image)
+        if existing_id:
+            return existing_id
         
-        # Função para extrair características (não assíncrona)
-        def _extract_features():
-            # Carregar modelo e processador
-            model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-            processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
-            
-            # Mover para GPU se disponível
-            device = "cuda" if torch.cuda.is_available() else "cpu"
-            model = model.to(device)
-            
-            # Carregar e processar imagem
-            image = Image.open(image_path).convert('RGB')
-            inputs = processor(images=image, return_tensors="pt").to(device)
-            
-            # Extrair características
-            with torch.no_grad():
-                image_features = model.get_image_features(**inputs)
-                
-            # Converter para numpy e normalizar
-            features = image_features[0].cpu().numpy()
-            normalized_features = features / np.linalg.norm(features)
-            
-            # Gerar ID único
-            feature_id = str(uuid.uuid4())
-            
-            # Salvar características como arquivo numpy
-            feature_path = os.path.join(FEATURES_DIR, f"{feature_id}.npz")
-            np.savez_compressed(feature_path, features=normalized_features)
-            
-            # Salvar metadados básicos
-            metadata_path = os.path.join(FEATURES_DIR, f"{feature_id}.json")
-            metadata = {
-                "id": feature_id,
-                "model": model_name,
-                "created_at": str(datetime.datetime.now()),
-                "original_image": os.path.basename(image_path)
-            }
-            
-            with open(metadata_path, 'w') as f:
-                json.dump(metadata, f)
-            
-            return feature_id
+        decoded = await run_inference("vision", _open_image, image, CLIP_INPUT_SIZE)
+        normalized_features = await _embed_decoded_image(decoded)
         
-        # Executar em um ThreadPool
-        loop = asyncio.get_event_loop()
-        feature_id = await loop.run_in_executor(None, _extract_features)
+        # Armazenar no executor de CPU da visão
+        original_image = os.path.basename(filename or (image if isinstance(image, str) else ""))
+        feature_id, _ = await run_inference(
+            "vision",
+            _store_features, normalized_features, content_hash, model_name, original_image
+        )
         
         return feature_id
+    except (ExecutorSaturated, RequestCancelled):
+        raise
     except Exception as e:
         print(f"Erro ao extrair características: {str(e)}")
         return None
 
 async def search_similar_images(
-    query_image_path: str, 
+    query_image: Union[str, bytes], 
     model_name: str = "clip",
-    top_k: int = 5
+    top_k: int = 5,
+    nprobe: Optional[int] = None,
+    exact: bool = False,
+    filters: Optional[Dict[str, Any]] = None
 ) -> Optional[List[Dict[str, Any]]]:
     """
     Busca imagens similares com base em características extraídas
+
+    A imagem de consulta não é armazenada.
     
     Args:
-        query_image_path: Caminho para a imagem de consulta
+        query_image: Caminho para a imagem de consulta ou seus bytes
         model_name: Nome do modelo (clip)
         top_k: Número máximo de resultados
+        nprobe: Listas visitadas pelo índice aproximado (maior = mais recall, mais lento)
+        exact: Forçar a busca exata mesmo com o índice aproximado ativo
+        filters: Filtros de igualdade sobre os metadados (ex.: {"model": "clip"})
     
     Returns:
         Lista de resultados ou None se falhar
     """
     try:
-        # Primeiro, extrair características da imagem de consulta
-        query_feature_id = await extract_image_features(query_image_path, model_name)
+        # Primeiro, calcular o embedding da imagem de consulta (sem persistir)
+        query_features = await embed_image(query_image, model_name)
         
-        if not query_feature_id:
+        if query_features is None:
             return None
         
-        # Importar bibliotecas
-        import numpy as np
-        from glob import glob
-        
-        # Função para buscar imagens similares (não assíncrona)
+        # Buscar os vizinhos (não assíncrono)
         def _search_similar():
-            # Carregar características da consulta
-            query_feature_path = os.path.join(FEATURES_DIR, f"{query_feature_id}.npz")
-            query_features = np.load(query_feature_path)["features"]
-            
-            # Listar todos os arquivos de características
-            feature_files = glob(os.path.join(FEATURES_DIR, "*.npz"))
-            
-            # Calcular similaridade com todas as características armazenadas
-            results = []
-            
-            for feature_file in feature_files:
-                # Pular a própria imagem de consulta
-                feature_id = os.path.basename(feature_file).replace(".npz", "")
-                if feature_id == query_feature_id:
-                    continue
-                
-                # Carregar características e calcular similaridade
-                features = np.load(feature_file)["features"]
-                similarity = np.dot(query_features, features)
-                
-                # Carregar metadados, se disponíveis
-                metadata_file = feature_file.replace(".npz", ".json")
-                metadata = {}
-                
-                if os.path.exists(metadata_file):
-                    with open(metadata_file, 'r') as f:
-                        metadata = json.load(f)
-                
-                # Adicionar à lista de resultados
-                results.append({
-                    "id": feature_id,
-                    "similarity": float(similarity),
-                    "metadata": metadata
-                })
-            
-            # Ordenar por similaridade e retornar os top_k
-            results = sorted(results, key=lambda x: x["similarity"], reverse=True)[:top_k]
-            
-            return results
+            return search_features(query_features, top_k=top_k, nprobe=nprobe, exact=exact, filters=filters)
         
-        # Executar em um ThreadPool
-        loop = asyncio.get_event_loop()
-        results = await loop.run_in_executor(None, _search_similar)
+        # Executar no executor de CPU da visão
+        results = await run_inference("vision", _search_similar)
         
         return results
+    except (ExecutorSaturated, RequestCancelled):
+        raise
     except Exception as e:
         print(f"Erro ao buscar imagens similares: {str(e)}")
-        return None 
\ No newline at end of file
+        return None
+
+async def search_images_by_text(
+    query: str,
+    model_name: str = "clip",
+    top_k: int = 5,
+    nprobe: Optional[int] = None,
+    exact: bool = False,
+    filters: Optional[Dict[str, Any]] = None
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Busca imagens armazenadas a partir de uma descrição em texto (CLIP texto → imagem)
+    
+    Args:
+        query: Texto de consulta
+        model_name: Nome do modelo (clip)
+        top_k: Número máximo de resultados
+        nprobe: Listas visitadas pelo índice aproximado (maior = mais recall, mais lento)
+        exact: Forçar a busca exata mesmo com o índice aproximado ativo
+        filters: Filtros de igualdade sobre os metadados (ex.: {"model": "clip"})
+    
+    Returns:
+        Lista de resultados ou None se falhar
+    """
+    try:
+        # Função para buscar imagens (não assíncrona)
+        def _search_by_text():
+            query_features = get_query_embedding(query)
+            return search_features(query_features, top_k=top_k, nprobe=nprobe, exact=exact, filters=filters)
+        
+        # Executar no executor do CLIP (torre de texto)
+        results = await run_inference("clip", _search_by_text)
+        
+        return results
+    except (ExecutorSaturated, RequestCancelled):
+        raise
+    except Exception as e:
+        print(f"Erro ao buscar imagens por texto: {str(e)}")
+        return None
+
+# Análises disponíveis em analyze_image
+ANALYSES = ["caption", "classify", "features", "similar"]
+
+async def analyze_image(
+    image: Union[str, bytes],
+    analyses: Optional[List[str]] = None,
+    prompt: Optional[str] = None,
+    top_k: int = 5,
+    categories: Optional[List[str]] = None,
+    label_set: Optional[str] = None,
+    filename: Optional[str] = None,
+    model_name: str = "clip"
+) -> Optional[Dict[str, Any]]:
+    """
+    Executa várias análises sobre uma imagem com uma única decodificação
+
+    O embedding CLIP é calculado uma vez e reutilizado pela classificação, pelo
+    armazenamento e pela busca de similares; a descrição do BLIP roda em
+    paralelo com o CLIP. Imagens já armazenadas não passam pelo CLIP quando
+    apenas "features" é pedido.
+    
+    Args:
+        image: Caminho para o arquivo de imagem ou seus bytes
+        analyses: Subconjunto de ANALYSES (padrão: caption e classify)
+        prompt: Texto inicial opcional para a descrição
+        top_k: Número de categorias e de imagens similares
+        categories: Lista opcional de categorias (padrão: DEFAULT_CATEGORIES)
+        label_set: Nome de um conjunto de rótulos registrado
+        filename: Nome original do arquivo, guardado nos metadados
+        model_name: Nome do modelo (clip)
+    
+    Returns:
+        Dicionário com description e o resultado de cada análise (erros
+        individuais em "errors"), ou None se a imagem não puder ser processada
+    """
+    try:
+        analyses = analyses or ["caption", "classify"]
+        unknown = [name for name in analyses if name not in ANALYSES]
+        if unknown:
+            raise ValueError(f"Análises desconhecidas: {', '.join(unknown)}")
+        
+        if label_set:
+            label_sets = load_label_sets()
+            if label_set not in label_sets:
+                raise ValueError(f"Conjunto de rótulos não encontrado: {label_set}")
+            categories = label_sets[label_set]
+        if not categories:
+            categories = DEFAULT_CATEGORIES
+        
+        # Hash do conteúdo primeiro: uma imagem já armazenada dispensa o CLIP para "features"
+        content_hash = None
+        existing_id = None
+        if "features" in analyses:
+            content_hash, existing_id = await run_inference("vision", _find_stored, image)
+        needs_embedding = (
+            "classify" in analyses
+            or "similar" in analyses
+            or ("features" in analyses and existing_id is None)
+        )
+        
+        # Decodificar uma única vez, no maior tamanho de entrada entre os modelos usados
+        target_size = max(
+            CLIP_INPUT_SIZE if needs_embedding else 0,
+            BLIP_INPUT_SIZE if "caption" in analyses else 0
+        )
+        decoded = None
+        if target_size:
+            decoded = await run_inference("vision", _open_image, image, target_size)
+        check_deadline("analyze_decode")
+        
+        async def _caption():
+            captions = await run_inference("caption", _generate_captions, [decoded], prompt)
+            return captions[0]
+        
+        # BLIP e CLIP em paralelo
+        jobs = {}
+        if "caption" in analyses:
+            jobs["caption"] = _caption()
+        if needs_embedding:
+            jobs["embedding"] = _embed_decoded_image(decoded)
+        outcomes = dict(zip(jobs, await asyncio.gather(*jobs.values(), return_exceptions=True)))
+        for outcome in outcomes.values():
+            if isinstance(outcome, (ExecutorSaturated, RequestCancelled)):
+                raise outcome
+        
+        result: Dict[str, Any] = {}
+        errors: Dict[str, str] = {}
+        if "caption" in outcomes:
+            if isinstance(outcomes["caption"], Exception):
+                errors["caption"] = str(outcomes["caption"])
+            else:
+                result["caption"] = outcomes["caption"]
+        
+        embedding = outcomes.get("embedding")
+        if isinstance(embedding, Exception):
+            for name in ("classify", "features", "similar"):
+                if name in analyses and not (name == "features" and existing_id):
+                    errors[name] = str(embedding)
+            embedding = None
+        
+        # Etapas que reutilizam o embedding, fora do event loop
+        def _use_embedding():
+            outputs = {}
+            if embedding is not None and "classify" in analyses:
+                try:
+                    outputs["categories"] = _rank_labels(embedding, categories, top_k)
+                except Exception as e:
+                    errors["classify"] = str(e)
+            if embedding is not None and "similar" in analyses:
+                try:
+                    # Busca antes de armazenar, para não retornar a própria imagem
+                    outputs["similar"] = search_features(embedding, top_k=top_k)
+                except Exception as e:
+                    errors["similar"] = str(e)
+            if "features" in analyses:
+                if existing_id:
+                    outputs["feature_id"], outputs["duplicate"] = existing_id, True
+                elif embedding is not None:
+                    try:
+                        original_image = os.path.basename(filename or (image if isinstance(image, str) else ""))
+                        outputs["feature_id"], outputs["duplicate"] = _store_features(
+                            embedding, content_hash, model_name, original_image
+                        )
+                    except Exception as e:
+                        errors["features"] = str(e)
+            return outputs
+        
+        check_deadline("analyze_models")
+        result.update(await run_inference("clip", _use_embedding))
+        
+        # Texto resumido para exibição (descrição ou categorias principais)
+        if "caption" in result:
+            result["description"] = result["caption"]
+        elif result.get("categories"):
+            result["description"] = ", ".join(item["category"] for item in result["categories"])
+        if errors:
+            result["errors"] = errors
+        return result
+    except (ExecutorSaturated, RequestCancelled):
+        raise
+    except Exception as e:
+        print(f"Erro ao analisar imagem: {str(e)}")
+        return None
+
+# Tamanho padrão dos lotes nos endpoints de processamento em lote
+VISION_BATCH_SIZE = int(os.environ.get("VISION_BATCH_SIZE", "8"))
+
+# Maior lote aceito dos clientes (limita a memória de uma passagem do CLIP/BLIP)
+VISION_MAX_BATCH_SIZE = int(os.environ.get("VISION_MAX_BATCH_SIZE", "64"))
+
+async def _iterate_batches(
+    items: Iterator[Tuple[str, bytes]],
+    batch_size: int
+) -> AsyncIterator[List[Tuple[str, bytes]]]:
+    """
+    Agrupa (nome, bytes) em lotes, lendo o iterador fora do event loop
+
+    Raises:
+        RequestCancelled: Se a requisição for abandonada; os lotes restantes não são lidos
+    """
+    batch_size = max(1, batch_size)
+    while True:
+        check_deadline("vision_batch")
+        batch = await run_inference("vision", lambda: list(itertools.islice(items, batch_size)))
+        if not batch:
+            break
+        yield batch
+
+def _decode_batch(
+    batch: List[Tuple[Any, ...]],
+    target_size: Optional[int] = None
+) -> Tuple[List[Tuple[Any, ...]], List[Dict[str, Any]]]:
+    """
+    Decodifica as imagens de tuplas (nome, bytes, *extras), separando as que falharam
+
+    No lugar dos bytes pode vir uma exceção (ex.: membro de arquivo compactado
+    acima do limite), reportada como erro do item.
+
+    Returns:
+        ([(nome, imagem, *extras)], [erros])
+    """
+    decoded = []
+    errors = []
+    for name, data, *extra in batch:
+        if isinstance(data, Exception):
+            errors.append({"name": name, "error": str(data)})
+            continue
+        try:
+            decoded.append((name, _open_image(data, target_size), *extra))
+        except Exception as e:
+            errors.append({"name": name, "error": f"Imagem inválida: {str(e)}"})
+    return decoded, errors
+
+async def caption_images_batch(
+    items: Iterator[Tuple[str, bytes]],
+    batch_size: int = VISION_BATCH_SIZE
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Gera descrições para muitas imagens, em lotes, produzindo um resultado por imagem
+    
+    Args:
+        items: Iterador de (nome, bytes da imagem)
+        batch_size: Imagens por passagem do BLIP
+    
+    Yields:
+        Dicionários com name e caption, ou name e error
+    """
+    def _process(batch):
+        decoded, results = _decode_batch(batch, BLIP_INPUT_SIZE)
+        if decoded:
+            try:
+                captions = _generate_captions([image for _, image in decoded])
+                results += [{"name": name, "caption": caption} for (name, _), caption in zip(decoded, captions)]
+            except Exception as e:
+                results += [{"name": name, "error": str(e)} for name, _ in decoded]
+        return results
+
+    async for batch in _iterate_batches(items, batch_size):
+        for result in await run_inference("caption", _process, batch):
+            yield result
+
+async def classify_images_batch(
+    items: Iterator[Tuple[str, bytes]],
+    batch_size: int = VISION_BATCH_SIZE,
+    top_k: int = 5,
+    categories: Optional[List[str]] = None,
+    label_set: Optional[str] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Classifica muitas imagens, em lotes, produzindo um resultado por imagem
+    
+    Args:
+        items: Iterador de (nome, bytes da imagem)
+        batch_size: Imagens por passagem do CLIP
+        top_k: Número de categorias por imagem
+        categories: Lista opcional de categorias (padrão: DEFAULT_CATEGORIES)
+        label_set: Nome de um conjunto de rótulos registrado
+    
+    Yields:
+        Dicionários com name e categories, ou name e error
+    """
+    if label_set:
+        label_sets = load_label_sets()
+        if label_set not in label_sets:
+            raise ValueError(f"Conjunto de rótulos não encontrado: {label_set}")
+        categories = label_sets[label_set]
+    if not categories:
+        categories = DEFAULT_CATEGORIES
+
+    def _process(batch):
+        decoded, results = _decode_batch(batch, CLIP_INPUT_SIZE)
+        if decoded:
+            try:
+                embeddings = _compute_image_embeddings([image for _, image in decoded])
+                results += [
+                    {"name": name, "categories": _rank_labels(embedding, categories, top_k)}
+                    for (name, _), embedding in zip(decoded, embeddings)
+                ]
+            except Exception as e:
+                results += [{"name": name, "error": str(e)} for name, _ in decoded]
+        return results
+
+    async for batch in _iterate_batches(items, batch_size):
+        for result in await run_inference("clip", _process, batch):
+            yield result
+
+async def extract_features_batch(
+    items: Iterator[Tuple[str, bytes]],
+    batch_size: int = VISION_BATCH_SIZE,
+    model_name: str = "clip"
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Extrai e armazena características de muitas imagens, em lotes
+
+    Imagens já armazenadas (mesmo hash de conteúdo) retornam o ID existente
+    sem passar pelo CLIP.
+    
+    Args:
+        items: Iterador de (nome, bytes da imagem)
+        batch_size: Imagens por passagem do CLIP
+        model_name: Nome do modelo (clip)
+    
+    Yields:
+        Dicionários com name, feature_id e duplicate, ou name e error
+    """
+    def _process(batch):
+        store = get_feature_store()
+        results = []
+        pending = []
+        for name, data in batch:
+            if isinstance(data, Exception):
+                pending.append((name, data, None))  # Reportado por _decode_batch
+                continue
+            content_hash = _content_hash(data)
+            existing_id = store.find_key(content_hash)
+            if existing_id:
+                results.append({"name": name, "feature_id": existing_id, "duplicate": True})
+            else:
+                pending.append((name, data, content_hash))
+
+        decoded, errors = _decode_batch(pending, CLIP_INPUT_SIZE)
+        results += errors
+        if not decoded:
+            return results
+
+        try:
+            embeddings = _compute_image_embeddings([image for _, image, _ in decoded])
+        except Exception as e:
+            return results + [{"name": name, "error": str(e)} for name, _, _ in decoded]
+
+        feature_ids, vectors, metadatas, keys = [], [], [], []
+        with store.locked():
+            for (name, _, content_hash), embedding in zip(decoded, embeddings):
+                # Duplicatas inseridas por outra requisição (ou worker) ou repetidas dentro do lote
+                existing_id = store.find_key(content_hash)
+                if existing_id is None and content_hash in keys:
+                    existing_id = feature_ids[keys.index(content_hash)]
+                if existing_id:
+                    results.append({"name": name, "feature_id": existing_id, "duplicate": True})
+                    continue
+                
+                feature_id = str(uuid.uuid4())
+                feature_ids.append(feature_id)
+                vectors.append(embedding)
+                keys.append(content_hash)
+                metadatas.append({
+                    "id": feature_id,
+                    "model": model_name,
+                    "created_at": str(datetime.datetime.now()),
+                    "original_image": os.path.basename(name),
+                    "content_hash": content_hash
+                })
+                results.append({"name": name, "feature_id": feature_id, "duplicate": False})
+            if feature_ids:
+                store.add_many(feature_ids, np.stack(vectors), metadatas, keys)
+
+        if feature_ids:
+            update_ann_index()
+        return results
+
+    async for batch in _iterate_batches(items, batch_size):
+        for result in await run_inference("clip", _process, batch):
+            yield result
@@ -0,0 +1,133 @@
+import os
+import json
+from typing import List, Optional
+import numpy as np
+
+from app.services.model_registry import registry
+
+# Diretório com os grafos exportados por scripts/export_onnx.py
+ONNX_MODELS_DIR = os.environ.get("ONNX_MODELS_DIR", "app/models/onnx")
+
+# Usar os grafos quantizados em int8 quando existirem
+VISION_ONNX_QUANTIZED = os.environ.get("VISION_ONNX_QUANTIZED", "1") == "1"
+
+# Threads por sessão do ONNX Runtime (0 = padrão do runtime)
+ONNX_NUM_THREADS = int(os.environ.get("ONNX_NUM_THREADS", "0"))
+
+def model_path(model_dir: str, name: str, quantized: bool = VISION_ONNX_QUANTIZED) -> str:
+    """Caminho do grafo `name`, preferindo a versão int8 quando disponível"""
+    if quantized:
+        int8_path = os.path.join(model_dir, f"{name}.int8.onnx")
+        if os.path.exists(int8_path):
+            return int8_path
+    path = os.path.join(model_dir, f"{name}.onnx")
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Grafo ONNX não encontrado: {path}. Execute python -m scripts.export_onnx")
+    return path
+
+def create_session(path: str):
+    """Abre uma sessão do ONNX Runtime na CPU com otimizações de grafo"""
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if ONNX_NUM_THREADS > 0:
+        options.intra_op_num_threads = ONNX_NUM_THREADS
+    return ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+def _load_export_info(model_dir: str) -> dict:
+    with open(os.path.join(model_dir, "export.json"), "r") as f:
+        return json.load(f)
+
+class OnnxClip:
+    """Torres de imagem e de texto do CLIP executadas pelo ONNX Runtime"""
+
+    def __init__(self, model_dir: str, quantized: bool = VISION_ONNX_QUANTIZED):
+        from transformers import CLIPProcessor
+
+        info = _load_export_info(model_dir)
+        self.model_id = info["model_id"]
+        self.logit_scale = float(info["logit_scale"])
+        self.processor = CLIPProcessor.from_pretrained(model_dir)
+        self.vision = create_session(model_path(model_dir, "vision", quantized))
+        self.text = create_session(model_path(model_dir, "text", quantized))
+
+    def image_features(self, pixel_values: np.ndarray) -> np.ndarray:
+        """Embeddings (não normalizados) de um lote (n, 3, h, w) já pré-processado"""
+        return self.vision.run(None, {"pixel_values": pixel_values.astype(np.float32)})[0]
+
+    def text_features(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        """Embeddings (não normalizados) de um lote de textos tokenizados"""
+        return self.text.run(None, {
+            "input_ids": input_ids.astype(np.int64),
+            "attention_mask": attention_mask.astype(np.int64)
+        })[0]
+
+class OnnxBlip:
+    """
+    BLIP de legendas executado pelo ONNX Runtime
+
+    O codificador de imagem roda uma vez por lote; o decodificador é chamado a
+    cada token (decodificação gulosa, sem cache de chaves/valores no grafo).
+    """
+
+    def __init__(self, model_dir: str, quantized: bool = VISION_ONNX_QUANTIZED):
+        from transformers import BlipProcessor
+
+        info = _load_export_info(model_dir)
+        self.model_id = info["model_id"]
+        self.bos_token_id = int(info["bos_token_id"])
+        self.sep_token_id = int(info["sep_token_id"])
+        self.pad_token_id = int(info["pad_token_id"])
+        self.processor = BlipProcessor.from_pretrained(model_dir)
+        self.vision = create_session(model_path(model_dir, "vision", quantized))
+        self.decoder = create_session(model_path(model_dir, "decoder", quantized))
+
+    def generate(
+        self,
+        pixel_values: np.ndarray,
+        prompt: Optional[str] = None,
+        max_new_tokens: int = 100
+    ) -> List[str]:
+        """
+        Gera uma legenda por imagem de um lote (n, 3, h, w) já pré-processado
+
+        Segue a mesma convenção do BLIP no transformers: o prompt é tokenizado,
+        o [SEP] final é removido e o primeiro token é trocado pelo BOS.
+        """
+        batch_size = pixel_values.shape[0]
+        image_embeds = self.vision.run(None, {"pixel_values": pixel_values.astype(np.float32)})[0]
+
+        if prompt:
+            tokens = self.processor.tokenizer([prompt] * batch_size, return_tensors="np")["input_ids"][:, :-1]
+        else:
+            tokens = np.zeros((batch_size, 1), dtype=np.int64)
+        input_ids = tokens.astype(np.int64)
+        input_ids[:, 0] = self.bos_token_id
+
+        finished = np.zeros(batch_size, dtype=bool)
+        for _ in range(max_new_tokens):
+            logits = self.decoder.run(None, {
+                "input_ids": input_ids,
+                "attention_mask": np.ones_like(input_ids),
+                "encoder_hidden_states": image_embeds
+            })[0]
+            next_tokens = logits.argmax(axis=-1).astype(np.int64)
+            next_tokens[finished] = self.pad_token_id
+            input_ids = np.concatenate([input_ids, next_tokens[:, None]], axis=1)
+            finished |= next_tokens == self.sep_token_id
+            if finished.all():
+                break
+
+        # O prompt faz parte da legenda, como no caminho PyTorch
+        return self.processor.batch_decode(input_ids, skip_special_tokens=True)
+
+def get_clip_onnx(quantized: bool = VISION_ONNX_QUANTIZED) -> OnnxClip:
+    """Retorna o CLIP em ONNX residente"""
+    model_dir = os.path.join(ONNX_MODELS_DIR, "clip")
+    return registry.get(("clip-onnx", model_dir, quantized), lambda: OnnxClip(model_dir, quantized))
+
+def get_blip_onnx(quantized: bool = VISION_ONNX_QUANTIZED) -> OnnxBlip:
+    """Retorna o BLIP em ONNX residente"""
+    model_dir = os.path.join(ONNX_MODELS_DIR, "blip")
+    return registry.get(("blip-onnx", model_dir, quantized), lambda: OnnxBlip(model_dir, quantized))
@@ -0,0 +1,176 @@
+import os
+import re
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.services.executors import ExecutorSaturated
+from app.services.llm import stream_generate
+from app.services.metrics import metrics
+from app.services.tts import synthesize_speech
+
+# Tamanho mínimo de uma frase sintetizada (frases menores são unidas à seguinte)
+# e máximo antes de cortar no último espaço, para não esperar o fim de frases longas
+VOICE_MIN_SENTENCE_CHARS = int(os.environ.get("VOICE_MIN_SENTENCE_CHARS", "10"))
+VOICE_MAX_SENTENCE_CHARS = int(os.environ.get("VOICE_MAX_SENTENCE_CHARS", "200"))
+
+# Máximo da primeira frase, menor para começar a falar mais cedo
+VOICE_FIRST_SENTENCE_MAX_CHARS = int(os.environ.get("VOICE_FIRST_SENTENCE_MAX_CHARS", "80"))
+
+# Frases sintetizadas ao mesmo tempo enquanto o LLM continua gerando
+VOICE_TTS_AHEAD = int(os.environ.get("VOICE_TTS_AHEAD", "2"))
+
+VOICE_FIRST_AUDIO_SECONDS = metrics.histogram(
+    "voice_first_audio_seconds", "Tempo do fim da fala do usuário até o primeiro áudio da resposta"
+)
+VOICE_STAGE_SECONDS = metrics.histogram(
+    "voice_stage_duration_seconds", "Duração das etapas de um turno de voz", ("stage",)
+)
+
+# Fim de frase: pontuação seguida de espaço (o espaço evita cortar "3.5" ou "Sr.Silva"), ou quebra de linha
+_SENTENCE_END = re.compile(r"[.!?…;:]+[\"')\]]*\s+|\n+")
+
+# Callback de envio: evento JSON e, opcionalmente, os bytes de áudio que o seguem
+Emit = Callable[[Dict[str, Any], Optional[bytes]], Awaitable[None]]
+
+class SentenceBuffer:
+    """
+    Acumula os tokens do LLM e libera frases completas para a síntese
+    """
+
+    def __init__(
+        self,
+        min_chars: int = VOICE_MIN_SENTENCE_CHARS,
+        max_chars: int = VOICE_MAX_SENTENCE_CHARS,
+        first_max_chars: int = VOICE_FIRST_SENTENCE_MAX_CHARS
+    ):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.first_max_chars = first_max_chars
+        self.emitted = 0
+        self.buffer = ""
+
+    def _cut(self) -> Optional[int]:
+        for match in _SENTENCE_END.finditer(self.buffer):
+            if len(self.buffer[:match.end()].strip()) >= self.min_chars:
+                return match.end()
+        max_chars = self.max_chars if self.emitted else min(self.first_max_chars, self.max_chars)
+        if len(self.buffer) > max_chars:
+            space = self.buffer.rfind(" ", 0, max_chars)
+            return space + 1 if space > 0 else max_chars
+        return None
+
+    def feed(self, text: str) -> List[str]:
+        """Adiciona texto e retorna as frases que se completaram"""
+        self.buffer += text
+        sentences = []
+        cut = self._cut()
+        while cut is not None:
+            sentence = self.buffer[:cut].strip()
+            self.buffer = self.buffer[cut:]
+            if sentence:
+                sentences.append(sentence)
+                self.emitted += 1
+            cut = self._cut()
+        return sentences
+
+    def flush(self) -> Optional[str]:
+        """Retorna o texto restante (fim da geração)"""
+        sentence = self.buffer.strip()
+        self.buffer = ""
+        return sentence or None
+
+async def speak_response(
+    prompt: str,
+    emit: Emit,
+    model: str = "tinyllama",
+    system_prompt: Optional[str] = None,
+    temperature: float = 0.7,
+    max_tokens: int = 1000,
+    voice: str = "pt_BR-16000",
+    engine: str = "piper",
+    speed: float = 1.0,
+    audio_format: str = "wav"
+) -> str:
+    """
+    Gera a resposta do LLM em streaming e sintetiza cada frase assim que ela se completa
+
+    Os tokens são enviados como eventos "token" e o áudio de cada frase como um
+    evento "audio" seguido dos bytes, na ordem das frases. A síntese da
+    primeira frase começa enquanto o LLM ainda gera as seguintes.
+
+    Args:
+        prompt: Texto do usuário (ex.: a transcrição)
+        emit: Callback de envio dos eventos
+        model, system_prompt, temperature, max_tokens: Parâmetros do Ollama
+        voice, engine, speed, audio_format: Parâmetros do TTS
+
+    Returns:
+        O texto completo da resposta
+
+    Raises:
+        OllamaError: Se o Ollama responder com erro
+    """
+    limit = asyncio.Semaphore(max(VOICE_TTS_AHEAD, 1))
+    pending: asyncio.Queue = asyncio.Queue()
+    tasks: List[asyncio.Task] = []
+
+    async def _synthesize(sentence: str) -> Optional[bytes]:
+        async with limit:
+            return await synthesize_speech(sentence, voice, engine=engine, speed=speed, audio_format=audio_format)
+
+    async def _speaker():
+        # Envia o áudio das frases na ordem em que foram geradas
+        while True:
+            item = await pending.get()
+            if item is None:
+                return
+            index, sentence, task = item
+            try:
+                audio = await task
+                detail = "Falha ao gerar áudio"
+            except ExecutorSaturated as e:
+                audio, detail = None, str(e)
+            if not audio:
+                await emit({"type": "error", "index": index, "detail": detail}, None)
+                continue
+            await emit({"type": "audio", "index": index, "text": sentence, "format": audio_format}, audio)
+
+    def _enqueue(sentence: str):
+        task = asyncio.create_task(_synthesize(sentence))
+        tasks.append(task)
+        pending.put_nowait((len(tasks) - 1, sentence, task))
+
+    speaker = asyncio.create_task(_speaker())
+    splitter = SentenceBuffer()
+    parts = []
+    try:
+        async for data in stream_generate(
+            prompt=prompt,
+            model=model,
+            system_prompt=system_prompt,
+            temperature=temperature,
+            max_tokens=max_tokens
+        ):
+            token = data.get("response", "")
+            if not token:
+                continue
+            parts.append(token)
+            await emit({"type": "token", "text": token}, None)
+            for sentence in splitter.feed(token):
+                _enqueue(sentence)
+
+        rest = splitter.flush()
+        if rest:
+            _enqueue(rest)
+        pending.put_nowait(None)
+        await speaker
+    except BaseException:
+        speaker.cancel()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(speaker, *tasks, return_exceptions=True)
+        raise
+
+    logging.info(f"Turno de voz: {len(tasks)} frases sintetizadas")
+    return "".join(parts)
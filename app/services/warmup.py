@@ -0,0 +1,148 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+from app.services.executors import run_inference
+
+# Componentes aquecidos em segundo plano na inicialização
+WARMUP_COMPONENTS = os.environ.get("WARMUP_COMPONENTS", "piper,whisper,clip,ollama")
+
+# Componentes cuja falha não impede a prontidão (ex.: Ollama em outro host)
+WARMUP_OPTIONAL = os.environ.get("WARMUP_OPTIONAL", "ollama")
+
+# Modelo Whisper pré-carregado
+WHISPER_PRELOAD_MODEL = os.environ.get("WHISPER_PRELOAD_MODEL", "base")
+
+# Modelos do Ollama carregados na memória do servidor Ollama
+OLLAMA_PRELOAD_MODELS = os.environ.get("OLLAMA_PRELOAD_MODELS", "tinyllama")
+
+class ReadinessTracker:
+    """
+    Estado de aquecimento de cada componente (pending, running, ready, failed, skipped)
+    """
+
+    def __init__(self, components: List[str], optional: Optional[List[str]] = None):
+        self.started_at = time.time()
+        self.optional = set(optional or [])
+        self.components: Dict[str, Dict[str, Any]] = {
+            name: {"status": "pending", "optional": name in self.optional} for name in components
+        }
+
+    def start(self, name: str):
+        self.components[name].update(status="running", started_at=time.time())
+
+    def finish(self, name: str, status: str, error: Optional[str] = None, **details):
+        component = self.components[name]
+        component.update(status=status, **details)
+        if "started_at" in component:
+            component["seconds"] = time.time() - component["started_at"]
+        if error:
+            component["error"] = error
+
+    def is_ready(self) -> bool:
+        """Pronto quando todo componente obrigatório está ready ou skipped"""
+        for component in self.components.values():
+            if component["status"] in ("pending", "running"):
+                return False
+            if component["status"] == "failed" and not component["optional"]:
+                return False
+        return True
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "ready": self.is_ready(),
+            "uptime_seconds": time.time() - self.started_at,
+            "components": self.components,
+        }
+
+async def _warm_piper():
+    """Baixa e verifica os modelos Piper (fora do executor de TTS) e carrega a voz padrão"""
+    from app.services.artifacts import ensure_artifacts
+    from app.services.tts import ensure_directories, _resolve_piper_model, _synthesize_piper
+
+    ensure_directories()
+    await ensure_artifacts(group="piper")
+    await run_inference("tts", _synthesize_piper, "ok", await _resolve_piper_model("pt_BR-16000"))
+
+def _warm_whisper(model_name: str):
+    """Carrega o Whisper e transcreve um segundo de silêncio"""
+    from app.services.stt import get_whisper
+
+    get_whisper(model_name).transcribe(np.zeros(16000, dtype=np.float32))
+
+def _warm_vision(name: str):
+    """Carrega o modelo de visão e executa uma inferência com uma imagem vazia"""
+    from PIL import Image
+    from app.services.vision import _compute_image_embeddings, _generate_captions, preload_vision_models
+
+    preload_vision_models([name])
+    image = Image.new("RGB", (224, 224))
+    if name == "clip":
+        _compute_image_embeddings([image])
+    else:
+        _generate_captions([image])
+
+async def _warm_ollama(models: List[str]):
+    """Pede ao Ollama para carregar os modelos na memória (requisição sem prompt)"""
+    ollama_host = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+    async with httpx.AsyncClient(timeout=300.0) as client:
+        for model in models:
+            response = await client.post(f"{ollama_host}/api/generate", json={"model": model})
+            response.raise_for_status()
+
+def _split(value: str) -> List[str]:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+def create_readiness_tracker() -> ReadinessTracker:
+    """Cria o rastreador com os componentes de WARMUP_COMPONENTS (e de VISION_PRELOAD)"""
+    from app.services.vision import VISION_PRELOAD
+
+    components = _split(WARMUP_COMPONENTS)
+    for name in _split(VISION_PRELOAD):
+        if name not in components:
+            components.append(name)
+    return ReadinessTracker(components, _split(WARMUP_OPTIONAL))
+
+def _warmup_job(name: str) -> Optional[Callable[[], Awaitable[Any]]]:
+    """Corrotina de aquecimento do componente, executada no executor da sua modalidade"""
+    if name == "piper":
+        return _warm_piper
+    if name == "whisper":
+        return lambda: run_inference("stt", _warm_whisper, WHISPER_PRELOAD_MODEL)
+    if name == "clip":
+        return lambda: run_inference("clip", _warm_vision, "clip")
+    if name == "blip":
+        return lambda: run_inference("caption", _warm_vision, "blip")
+    if name == "ollama":
+        return lambda: _warm_ollama(_split(OLLAMA_PRELOAD_MODELS))
+    return None
+
+async def _warm_component(tracker: ReadinessTracker, name: str):
+    job = _warmup_job(name)
+    if job is None:
+        tracker.finish(name, "skipped", error="Componente desconhecido")
+        return
+
+    tracker.start(name)
+    logging.info(f"Aquecendo {name}...")
+    try:
+        await job()
+        tracker.finish(name, "ready")
+        logging.info(f"{name} pronto em {tracker.components[name]['seconds']:.2f}s")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        tracker.finish(name, "failed", error=str(e))
+        logging.error(f"Falha ao aquecer {name}: {str(e)}")
+
+async def run_warmup(tracker: ReadinessTracker):
+    """
+    Aquece todos os componentes em paralelo, cada um no executor da sua modalidade
+    """
+    await asyncio.gather(*(_warm_component(tracker, name) for name in tracker.components))
+    logging.info(f"Aquecimento concluído (pronto: {tracker.is_ready()})")
@@ -0,0 +1,208 @@
+"""
+Estado compartilhado entre os workers de app.serve: métricas, prontidão e executores
+
+Os workers atendem no mesmo socket, então cada leitura de /metrics, /ready ou
+/api/executors cai em um worker qualquer. Cada worker publica o próprio estado
+em <diretório>/<pid>-<início>.json (periodicamente e a cada leitura), e as
+rotas combinam os arquivos de todos os workers vivos, como o modo
+multiprocesso do prometheus_client:
+
+- contadores e histogramas são somados; ao recolher um worker encerrado, o
+  mestre soma os contadores dele em retired.json, para que os totais não
+  diminuam quando um worker é reciclado;
+- gauges são combinados entre os workers vivos pelo `aggregate` da métrica
+  ("sum", "max" ou "min");
+- a aplicação está pronta quando todos os workers esperados estão prontos.
+
+Sem enable() (uvicorn direto, um processo), as rotas usam apenas o estado local.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.services.metrics import format_snapshot, metrics
+
+# Intervalo (segundos) entre as publicações periódicas do estado de cada worker
+WORKER_STATE_INTERVAL_SECONDS = float(os.environ.get("WORKER_STATE_INTERVAL_SECONDS", "1"))
+
+_RETIRED = "retired.json"
+
+_directory: Optional[str] = None
+_expected_workers = 1
+_worker_id: Optional[Tuple[int, str]] = None
+_sections: Dict[str, Callable[[], Any]] = {}
+
+def enable(directory: str, workers: int):
+    """Ativa o estado compartilhado (chamado pelo mestre antes de criar os workers)"""
+    global _directory, _expected_workers
+    os.makedirs(directory, exist_ok=True)
+    _directory = directory
+    _expected_workers = workers
+
+def is_enabled() -> bool:
+    return _directory is not None
+
+def register_section(name: str, provider: Callable[[], Any]):
+    """Inclui no estado publicado o valor de `provider()` (ex.: relatório de prontidão)"""
+    _sections[name] = provider
+
+def _current_worker_id() -> str:
+    # Pid e instante de início: um pid reutilizado por outro worker não herda o estado anterior
+    global _worker_id
+    pid = os.getpid()
+    if _worker_id is None or _worker_id[0] != pid:
+        _worker_id = (pid, f"{pid}-{time.time_ns()}")
+    return _worker_id[1]
+
+def _write_json(path: str, content: Dict[str, Any]):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(content, f)
+    os.replace(temp_path, path)
+
+def _read_json(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def local_state() -> Dict[str, Any]:
+    """Estado deste processo: métricas e seções registradas"""
+    state = {"worker": _current_worker_id(), "pid": os.getpid(), "metrics": metrics.snapshot()}
+    for name, provider in list(_sections.items()):
+        try:
+            state[name] = provider()
+        except Exception as e:
+            logging.error(f"Erro ao coletar o estado '{name}' do worker: {str(e)}")
+    return state
+
+def publish() -> Dict[str, Any]:
+    """Grava o estado deste worker no diretório compartilhado; retorna o estado gravado"""
+    state = local_state()
+    if _directory is not None:
+        _write_json(os.path.join(_directory, f"{state['worker']}.json"), state)
+    return state
+
+def read_states() -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Publica o estado deste worker e lê o de todos os workers vivos
+
+    Função síncrona: deve ser executada fora do event loop.
+
+    Returns:
+        (estados dos workers vivos, contadores acumulados dos workers encerrados)
+    """
+    own = publish()
+    if _directory is None:
+        return [own], {}
+
+    states = []
+    for name in os.listdir(_directory):
+        if name.endswith(".json") and name != _RETIRED:
+            state = _read_json(os.path.join(_directory, name))
+            if state is not None:
+                states.append(state)
+    # Lido por último: o mestre grava retired.json antes de remover o arquivo do worker
+    retired = _read_json(os.path.join(_directory, _RETIRED)) or {}
+    merged = set(retired.get("workers", ()))
+    return [state for state in states if state["worker"] not in merged], retired
+
+def retire_worker(pid: int):
+    """
+    Soma os contadores de um worker encerrado em retired.json e remove o seu estado
+
+    Chamado apenas pelo mestre, ao recolher o worker.
+    """
+    if _directory is None:
+        return
+    prefix = f"{pid}-"
+    for name in os.listdir(_directory):
+        if not (name.startswith(prefix) and name.endswith(".json")):
+            continue
+        path = os.path.join(_directory, name)
+        state = _read_json(path)
+        if state is not None:
+            retired_path = os.path.join(_directory, _RETIRED)
+            retired = _read_json(retired_path) or {"workers": [], "metrics": []}
+            counters = [family for family in state["metrics"] if family["kind"] != "gauge"]
+            retired["metrics"] = merge_metrics([retired["metrics"], counters])
+            retired["workers"].append(state["worker"])
+            _write_json(retired_path, retired)
+        os.remove(path)
+
+def merge_metrics(snapshots: List[List[Dict[str, Any]]], retired: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """
+    Combina as métricas de vários workers (MetricsRegistry.snapshot())
+
+    Args:
+        snapshots: Métricas de cada worker vivo
+        retired: Contadores e histogramas acumulados dos workers encerrados
+
+    Returns:
+        Métricas no formato de snapshot(), uma família por nome
+    """
+    families: Dict[str, Dict[str, Any]] = {}
+    values: Dict[str, Dict[Tuple, List[Any]]] = {}
+    for family in [family for snapshot in snapshots for family in snapshot] + list(retired or ()):
+        merged = families.setdefault(family["name"], dict(family, samples=[]))
+        series = values.setdefault(family["name"], {})
+        for suffix, labels, value in family["samples"]:
+            key = (suffix, tuple(sorted(labels.items())))
+            series.setdefault(key, [suffix, labels, []])[2].append(value)
+
+    for name, merged in families.items():
+        combine = sum
+        if merged["kind"] == "gauge" and merged.get("aggregate") in ("max", "min"):
+            combine = max if merged["aggregate"] == "max" else min
+        merged["samples"] = [(suffix, labels, combine(found)) for suffix, labels, found in values[name].values()]
+    return list(families.values())
+
+def render_metrics() -> str:
+    """Métricas de todos os workers no formato de exposição do Prometheus"""
+    states, retired = read_states()
+    return format_snapshot(merge_metrics([state["metrics"] for state in states], retired.get("metrics")))
+
+def readiness_report() -> Dict[str, Any]:
+    """
+    Prontidão da aplicação: pronta quando todos os workers esperados estão prontos
+
+    Com um único processo, é o relatório do próprio worker.
+    """
+    if _directory is None:
+        return _sections["readiness"]()
+    states, _ = read_states()
+    reports = {str(state["pid"]): state["readiness"] for state in states if "readiness" in state}
+    ready = len(reports) >= _expected_workers and all(report["ready"] for report in reports.values())
+    return {"ready": ready, "expected_workers": _expected_workers, "workers": reports}
+
+def executor_stats() -> Dict[str, Any]:
+    """Estatísticas dos executores somadas entre os workers vivos (máximos combinados pelo maior valor)"""
+    if _directory is None:
+        return _sections["executors"]()
+    states, _ = read_states()
+    totals: Dict[str, Dict[str, Any]] = {}
+    for state in states:
+        for name, stats in state.get("executors", {}).items():
+            total = totals.get(name)
+            if total is None:
+                totals[name] = dict(stats, processes=1)
+                continue
+            total["processes"] += 1
+            for key, value in stats.items():
+                if key in ("name", "kind", "torch_threads"):
+                    continue
+                total[key] = max(total[key], value) if key.endswith("_max") else total[key] + value
+    return totals
+
+async def run_state_publisher(interval: float = WORKER_STATE_INTERVAL_SECONDS):
+    """Publica periodicamente o estado deste worker até ser cancelado"""
+    while True:
+        try:
+            await asyncio.to_thread(publish)
+        except Exception as e:
+            logging.error(f"Erro ao publicar o estado do worker: {str(e)}")
+        await asyncio.sleep(interval)
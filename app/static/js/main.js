@@ -171,7 +171,9 @@ document.addEventListener('DOMContentLoaded', function() {
                         text: text,
                         voice: ttsVoice ? ttsVoice.value : undefined,
                         engine: ttsEngine ? ttsEngine.value : 'coqui',
-                        speed: document.getElementById('tts-speed') ? parseFloat(document.getElementById('tts-speed').value) : 1.0
+                        speed: document.getElementById('tts-speed') ? parseFloat(document.getElementById('tts-speed').value) : 1.0,
+                        format: 'mp3',  // Áudio comprimido para reduzir o download
+                        inline: true    // Receber os bytes diretamente na resposta
                     })
                 });
                 
@@ -0,0 +1,118 @@
+"""
+Benchmark de recall × latência do índice IVF-PQ contra a busca exata
+
+Gera vetores sintéticos normalizados (agrupados, como embeddings CLIP),
+constrói um VectorStore e um IVFPQIndex temporários e mede recall@k e
+latência para cada valor de nprobe. A saída é JSON.
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.ann_benchmark --size 200000 --nprobe 1,4,16,64
+"""
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+
+from app.services.vector_store import VectorStore
+from app.services.ann_index import IVFPQIndex, ANN_PQ_M, ANN_RERANK
+
+def synthetic_vectors(n: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    """Mistura de gaussianas normalizada para a esfera unitária"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, n)
+    vectors = centers[labels] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def latency_summary(samples):
+    samples = np.asarray(samples) * 1000
+    return {
+        "mean_ms": float(samples.mean()),
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "p99_ms": float(np.percentile(samples, 99)),
+    }
+
+def run(args) -> dict:
+    # Consultas vêm da mesma distribuição, mas não fazem parte da coleção
+    vectors = synthetic_vectors(args.size + args.queries, args.dim, args.clusters)
+    data, queries = vectors[:args.size], vectors[args.size:]
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = VectorStore(directory, dtype=args.dtype)
+        ids = [str(i) for i in range(args.size)]
+        for start in range(0, args.size, 65536):
+            store.add_many(ids[start:start + 65536], data[start:start + 65536])
+
+        # Busca exata (referência)
+        exact_results = []
+        exact_times = []
+        for query in queries:
+            started = time.perf_counter()
+            matches = store.search(query, args.top_k)
+            exact_times.append(time.perf_counter() - started)
+            exact_results.append({row for row, _ in matches})
+
+        # Construção do índice
+        index = IVFPQIndex(directory)
+        started = time.perf_counter()
+        sample = data[np.random.default_rng(0).choice(args.size, min(args.size, args.train_sample), replace=False)]
+        index.train(sample, nlist=args.nlist, m=args.m)
+        train_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        index.sync(store)
+        add_seconds = time.perf_counter() - started
+
+        report = {
+            "size": args.size,
+            "dim": args.dim,
+            "dtype": args.dtype,
+            "top_k": args.top_k,
+            "nlist": index.nlist,
+            "m": index.m,
+            "rerank": args.rerank,
+            "train_seconds": train_seconds,
+            "add_seconds": add_seconds,
+            "exact": latency_summary(exact_times),
+            "ann": [],
+        }
+
+        for nprobe in args.nprobe:
+            times = []
+            recalls = []
+            for query, expected in zip(queries, exact_results):
+                started = time.perf_counter()
+                matches = index.search(query, args.top_k, store, nprobe=nprobe, rerank=args.rerank)
+                times.append(time.perf_counter() - started)
+                recalls.append(len(expected & {row for row, _ in matches}) / max(1, len(expected)))
+            report["ann"].append(dict(
+                latency_summary(times),
+                nprobe=nprobe,
+                recall=float(np.mean(recalls)),
+            ))
+
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16"])
+    parser.add_argument("--nlist", type=int, default=0)
+    parser.add_argument("--m", type=int, default=ANN_PQ_M)
+    parser.add_argument("--rerank", type=int, default=ANN_RERANK)
+    parser.add_argument("--train-sample", type=int, default=100000)
+    parser.add_argument("--nprobe", type=lambda value: [int(v) for v in value.split(",")], default=[1, 4, 16, 64])
+    parser.add_argument("--output", help="Arquivo para gravar o relatório JSON")
+    args = parser.parse_args()
+
+    report = run(args)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
@@ -0,0 +1,118 @@
+"""
+Servidor local que imita a API do Ollama, para benchmarks sem rede nem GPU
+
+Responde /api/generate com streams NDJSON de tokens numa taxa configurável
+(atraso até o primeiro token e tokens por segundo), além de /api/tags,
+/api/pull e embeddings determinísticos em /api/embed e /api/embeddings.
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.fake_ollama --port 11500 --tokens-per-second 40 --first-token-ms 150
+"""
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = (
+    "o agente responde com frases curtas e claras sobre o assunto pedido "
+    "usando exemplos simples e linguagem direta para facilitar a leitura"
+).split()
+
+def create_app(
+    tokens_per_second: float = 50.0,
+    first_token_ms: float = 100.0,
+    max_tokens: int = 64,
+    embedding_dim: int = 384
+) -> FastAPI:
+    app = FastAPI(title="Fake Ollama")
+    interval = 1.0 / tokens_per_second if tokens_per_second > 0 else 0.0
+
+    def _token_count(body: dict) -> int:
+        requested = (body.get("options") or {}).get("num_predict")
+        return max(1, min(max_tokens, requested or max_tokens))
+
+    def _embedding(text: str) -> list:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(embedding_dim).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        model = body.get("model", "tinyllama")
+
+        # Requisição sem prompt: apenas carrega o modelo (usada no aquecimento)
+        if not body.get("prompt"):
+            return JSONResponse({"model": model, "response": "", "done": True})
+
+        count = _token_count(body)
+        started = time.perf_counter()
+
+        async def _tokens():
+            await asyncio.sleep(first_token_ms / 1000.0)
+            for index in range(count):
+                if index:
+                    await asyncio.sleep(interval)
+                yield WORDS[index % len(WORDS)] + " "
+
+        if body.get("stream", True) is False:
+            text = "".join([token async for token in _tokens()])
+            return JSONResponse({"model": model, "response": text, "done": True, "eval_count": count})
+
+        async def _stream():
+            async for token in _tokens():
+                yield json.dumps({"model": model, "response": token, "done": False}) + "\n"
+            yield json.dumps({
+                "model": model,
+                "response": "",
+                "done": True,
+                "eval_count": count,
+                "total_duration": int((time.perf_counter() - started) * 1e9),
+            }) + "\n"
+
+        return StreamingResponse(_stream(), media_type="application/x-ndjson")
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [{"name": "tinyllama:latest", "size": 0}]}
+
+    @app.post("/api/pull")
+    async def pull(request: Request):
+        return {"status": "success"}
+
+    @app.post("/api/embed")
+    async def embed(request: Request):
+        body = await request.json()
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        return {"model": body.get("model"), "embeddings": [_embedding(text) for text in inputs]}
+
+    @app.post("/api/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        return {"embedding": _embedding(body.get("prompt", ""))}
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Imitação local da API do Ollama")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--first-token-ms", type=float, default=100.0)
+    parser.add_argument("--max-tokens", type=int, default=64, help="Tokens por resposta (limitado por num_predict)")
+    parser.add_argument("--embedding-dim", type=int, default=384)
+    args = parser.parse_args()
+
+    app = create_app(args.tokens_per_second, args.first_token_ms, args.max_tokens, args.embedding_dim)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
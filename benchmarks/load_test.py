@@ -0,0 +1,334 @@
+"""
+Carga e latência dos endpoints da API, offline e em CPU
+
+Sobe o imitador do Ollama (benchmarks.fake_ollama) e a aplicação com modelos
+substitutos (benchmarks.stub_server), espera o /ready e dispara cada cenário
+em cada nível de concorrência. Para cada combinação reporta vazão, latências
+p50/p95/p99, tempo até o primeiro token (streaming) e erros; ao final, o pico
+de RSS do processo da aplicação e as métricas dos executores. A saída é JSON,
+para comparar execuções.
+
+Com --app-url, usa uma aplicação já em execução (ex.: com os modelos reais).
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.load_test --concurrency 1,4,16 --requests 64 --output resultados.json
+"""
+import os
+import io
+import sys
+import json
+import time
+import wave
+import asyncio
+import argparse
+import subprocess
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+SCENARIOS = [
+    "llm_generate",
+    "llm_stream",
+    "stt_transcribe",
+    "tts_piper",
+    "vision_caption",
+    "vision_classify",
+    "vision_analyze",
+    "vision_features",
+]
+
+# Cenário: chamada que retorna (sucesso, tempo até o primeiro token ou None)
+Scenario = Callable[[httpx.AsyncClient], Awaitable[Tuple[bool, Optional[float]]]]
+
+def make_wav(seconds: float = 2.0, sample_rate: int = 16000) -> bytes:
+    t = np.arange(int(seconds * sample_rate), dtype=np.float32) / sample_rate
+    pcm = (np.sin(2 * np.pi * 440 * t) * 0.3 * 32767).astype("<i2").tobytes()
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm)
+    return buffer.getvalue()
+
+def make_jpeg(width: int = 1280, height: int = 960, seed: int = 0) -> bytes:
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)
+    pixels = np.stack([np.add.outer(y, x) / 2] * 3, axis=-1) * rng.uniform(0.3, 1.0, 3)
+    pixels += rng.normal(0, 15, pixels.shape)
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+def build_scenarios(max_tokens: int) -> Dict[str, Scenario]:
+    wav = make_wav()
+    jpeg = make_jpeg()
+    prompt = {"prompt": "Explique o que é um benchmark.", "model": "tinyllama", "max_tokens": max_tokens}
+
+    async def llm_generate(client):
+        response = await client.post("/api/llm/generate", json=prompt)
+        return response.status_code == 200, None
+
+    async def llm_stream(client):
+        started = time.perf_counter()
+        first_token = None
+        async with client.stream("POST", "/api/llm/stream", json=prompt) as response:
+            if response.status_code != 200:
+                return False, None
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                data = json.loads(line[6:])
+                if "error" in data:
+                    return False, first_token
+                if first_token is None and data.get("text"):
+                    first_token = time.perf_counter() - started
+        return True, first_token
+
+    async def stt_transcribe(client):
+        response = await client.post(
+            "/api/stt/transcribe",
+            files={"file": ("audio.wav", wav, "audio/wav")},
+            data={"model": "base", "language": "pt"}
+        )
+        return response.status_code == 200, None
+
+    async def tts_piper(client):
+        response = await client.post(
+            "/api/tts/generate",
+            json={"text": "Olá, este é um teste de síntese.", "engine": "piper", "voice": "pt_BR-16000", "inline": True}
+        )
+        return response.status_code == 200, None
+
+    def _image_post(path: str, data: Optional[dict] = None):
+        async def _scenario(client):
+            response = await client.post(path, files={"file": ("image.jpg", jpeg, "image/jpeg")}, data=data or {})
+            return response.status_code == 200, None
+        return _scenario
+
+    return {
+        "llm_generate": llm_generate,
+        "llm_stream": llm_stream,
+        "stt_transcribe": stt_transcribe,
+        "tts_piper": tts_piper,
+        "vision_caption": _image_post("/api/vision/caption"),
+        "vision_classify": _image_post("/api/vision/classify"),
+        "vision_analyze": _image_post("/api/vision/analyze", {"analyses": "caption,classify"}),
+        "vision_features": _image_post("/api/vision/extract-features"),
+    }
+
+def percentiles(samples: List[float]) -> Optional[Dict[str, float]]:
+    if not samples:
+        return None
+    values = np.asarray(samples) * 1000
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "mean_ms": float(values.mean()),
+        "max_ms": float(values.max()),
+    }
+
+async def run_level(client: httpx.AsyncClient, scenario: Scenario, concurrency: int, requests: int) -> Dict[str, Any]:
+    """Executa `requests` chamadas com no máximo `concurrency` simultâneas"""
+    latencies: List[float] = []
+    first_tokens: List[float] = []
+    errors: Dict[str, int] = {}
+    remaining = iter(range(requests))
+
+    async def _worker():
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                ok, first_token = await scenario(client)
+            except Exception as e:
+                ok, first_token = False, None
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            else:
+                if not ok:
+                    errors["http_error"] = errors.get("http_error", 0) + 1
+            if ok:
+                latencies.append(time.perf_counter() - started)
+                if first_token is not None:
+                    first_tokens.append(first_token)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "succeeded": len(latencies),
+        "errors": errors,
+        "seconds": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "latency": percentiles(latencies),
+        "time_to_first_token": percentiles(first_tokens),
+    }
+
+def _proc_status(pid: int, field: str) -> Optional[int]:
+    """Campo em kB de /proc/<pid>/status (Linux), em bytes"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+def _children(pid: int) -> List[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+def memory_report(pid: int) -> Dict[str, Any]:
+    """RSS atual e pico (VmHWM) do processo e dos filhos (pools de processos)"""
+    children = _children(pid)
+    return {
+        "rss_bytes": _proc_status(pid, "VmRSS"),
+        "peak_rss_bytes": _proc_status(pid, "VmHWM"),
+        "children_peak_rss_bytes": {str(child): _proc_status(child, "VmHWM") for child in children},
+    }
+
+async def wait_ready(base_url: str, timeout: float) -> Dict[str, Any]:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url, timeout=5.0) as client:
+        while time.monotonic() < deadline:
+            try:
+                response = await client.get("/ready")
+                if response.status_code == 200:
+                    return response.json()
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"{base_url} não ficou pronto em {timeout:.0f}s")
+
+def start_process(module: str, arguments: List[str]) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, "-m", module, *arguments], cwd=os.getcwd())
+
+async def run(args, app_pid: Optional[int]) -> Dict[str, Any]:
+    base_url = args.app_url or f"http://127.0.0.1:{args.port}"
+    ready_started = time.perf_counter()
+    readiness = await wait_ready(base_url, args.ready_timeout)
+
+    scenarios = build_scenarios(args.max_tokens)
+    selected = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    report: Dict[str, Any] = {
+        "base_url": base_url,
+        "ready_seconds": time.perf_counter() - ready_started,
+        "warmup": readiness.get("components"),
+        "config": {
+            "concurrency": levels,
+            "requests": args.requests,
+            "max_tokens": args.max_tokens,
+            "stubs": None if args.app_url else {
+                "tokens_per_second": args.tokens_per_second,
+                "first_token_ms": args.first_token_ms,
+                "whisper_ms": args.whisper_ms,
+                "piper_ms": args.piper_ms,
+                "clip_ms": args.clip_ms,
+                "blip_ms": args.blip_ms,
+                "work": args.work,
+            },
+        },
+        "scenarios": {},
+    }
+
+    limits = httpx.Limits(max_connections=max(levels) * 2, max_keepalive_connections=max(levels) * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.request_timeout, limits=limits) as client:
+        for name in selected:
+            if name not in scenarios:
+                raise ValueError(f"Cenário desconhecido: {name}. Use: {', '.join(SCENARIOS)}")
+            # Uma chamada de aquecimento por cenário (carga preguiçosa, caches)
+            await scenarios[name](client)
+            results = []
+            for concurrency in levels:
+                result = await run_level(client, scenarios[name], concurrency, max(args.requests, concurrency))
+                if app_pid:
+                    result["memory"] = memory_report(app_pid)
+                results.append(result)
+                print(
+                    f"{name} c={concurrency}: {result['throughput_rps']:.1f} req/s, "
+                    f"p95 {(result['latency'] or {}).get('p95_ms', float('nan')):.0f} ms, "
+                    f"erros {sum(result['errors'].values())}",
+                    file=sys.stderr
+                )
+            report["scenarios"][name] = results
+
+        report["executors"] = (await client.get("/api/executors")).json()
+
+    if app_pid:
+        report["memory"] = memory_report(app_pid)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga e latência dos endpoints da API")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,4,16", help="Níveis de concorrência separados por vírgula")
+    parser.add_argument("--requests", type=int, default=32, help="Requisições por nível")
+    parser.add_argument("--max-tokens", type=int, default=32)
+    parser.add_argument("--request-timeout", type=float, default=120.0)
+    parser.add_argument("--ready-timeout", type=float, default=120.0)
+    parser.add_argument("--app-url", default=None, help="Usar uma aplicação já em execução")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--ollama-port", type=int, default=11500)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--first-token-ms", type=float, default=100.0)
+    parser.add_argument("--whisper-ms", type=float, default=200.0)
+    parser.add_argument("--piper-ms", type=float, default=30.0)
+    parser.add_argument("--clip-ms", type=float, default=20.0)
+    parser.add_argument("--blip-ms", type=float, default=150.0)
+    parser.add_argument("--work", choices=["sleep", "spin"], default="sleep")
+    parser.add_argument("--output", default=None, help="Arquivo para gravar o JSON")
+    args = parser.parse_args()
+
+    processes: List[subprocess.Popen] = []
+    app_pid = None
+    try:
+        if not args.app_url:
+            processes.append(start_process("benchmarks.fake_ollama", [
+                "--port", str(args.ollama_port),
+                "--tokens-per-second", str(args.tokens_per_second),
+                "--first-token-ms", str(args.first_token_ms),
+                "--max-tokens", str(args.max_tokens),
+            ]))
+            app = start_process("benchmarks.stub_server", [
+                "--port", str(args.port),
+                "--ollama-host", f"http://127.0.0.1:{args.ollama_port}",
+                "--whisper-ms", str(args.whisper_ms),
+                "--piper-ms", str(args.piper_ms),
+                "--clip-ms", str(args.clip_ms),
+                "--blip-ms", str(args.blip_ms),
+                "--work", args.work,
+            ])
+            processes.append(app)
+            app_pid = app.pid
+
+        report = asyncio.run(run(args, app_pid))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Paridade e latência do backend ONNX (fp32 e int8) contra o PyTorch
+
+Usa as imagens de --images (ou imagens sintéticas) e as categorias padrão,
+mede a similaridade de cosseno entre os embeddings CLIP de cada backend e o
+PyTorch, a latência por lote e, com --captions, a concordância das legendas
+do BLIP. A saída é JSON.
+
+Requer os grafos de scripts/export_onnx.py.
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.onnx_parity --images caminho/para/imagens --batch-size 8 --captions
+"""
+import os
+import json
+import time
+import argparse
+from glob import glob
+import numpy as np
+
+from app.services.image_preprocessing import decode_image, preprocess_blip, preprocess_clip
+from app.services.vision import (
+    CLIP_INPUT_SIZE,
+    BLIP_INPUT_SIZE,
+    DEFAULT_CATEGORIES,
+    get_blip,
+    get_clip
+)
+from app.services.vision_onnx import ONNX_MODELS_DIR, OnnxBlip, OnnxClip
+
+def load_images(directory, count, size):
+    if directory:
+        paths = sorted(
+            path for path in glob(os.path.join(directory, "*"))
+            if os.path.splitext(path)[1].lower() in (".jpg", ".jpeg", ".png", ".webp")
+        )[:count]
+        return [decode_image(path, size) for path in paths]
+
+    from PIL import Image
+    rng = np.random.default_rng(0)
+    images = []
+    for _ in range(count):
+        # Gradientes com ruído: mais próximos de fotos que ruído puro
+        base = np.linspace(0, 255, 512, dtype=np.float32)
+        pixels = np.stack([np.add.outer(base, base) / 2] * 3, axis=-1) * rng.uniform(0.3, 1.0, 3)
+        pixels += rng.normal(0, 20, pixels.shape)
+        images.append(Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)))
+    return images
+
+def latency_summary(samples):
+    samples = np.asarray(samples) * 1000
+    return {
+        "mean_ms": float(samples.mean()),
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+    }
+
+def cosine_summary(reference, candidate):
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosines = np.sum(reference * candidate, axis=1)
+    return {"min": float(cosines.min()), "mean": float(cosines.mean())}
+
+def timed_batches(function, items, batch_size, repeats):
+    """Executa `function` por lote, `repeats` vezes; retorna (saídas da última, tempos)"""
+    times = []
+    outputs = []
+    for _ in range(repeats):
+        outputs = []
+        for start in range(0, len(items), batch_size):
+            started = time.perf_counter()
+            outputs.append(function(items[start:start + batch_size]))
+            times.append(time.perf_counter() - started)
+    return outputs, times
+
+def graph_size_mb(model_dir, name, quantized):
+    path = os.path.join(model_dir, f"{name}.int8.onnx" if quantized else f"{name}.onnx")
+    return os.path.getsize(path) / (1024 * 1024) if os.path.exists(path) else None
+
+def run(args) -> dict:
+    import torch
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    images = load_images(args.images, args.count, max(CLIP_INPUT_SIZE, BLIP_INPUT_SIZE))
+    clip_dir = os.path.join(ONNX_MODELS_DIR, "clip")
+    blip_dir = os.path.join(ONNX_MODELS_DIR, "blip")
+    variants = [False] + ([True] if os.path.exists(os.path.join(clip_dir, "vision.int8.onnx")) else [])
+
+    # Referência PyTorch (CPU)
+    processor, model = get_clip("cpu")
+    def _torch_images(batch):
+        pixel_values = torch.from_numpy(preprocess_clip(batch, processor.image_processor))
+        with torch.inference_mode():
+            return model.get_image_features(pixel_values=pixel_values).numpy()
+    def _torch_texts(batch):
+        inputs = processor(text=batch, return_tensors="pt", padding=True)
+        with torch.inference_mode():
+            return model.get_text_features(**inputs).numpy()
+
+    # Aquecimento
+    _torch_images(images[:1])
+    outputs, image_times = timed_batches(_torch_images, images, args.batch_size, args.repeats)
+    torch_images = np.concatenate(outputs)
+    outputs, text_times = timed_batches(_torch_texts, DEFAULT_CATEGORIES, len(DEFAULT_CATEGORIES), args.repeats)
+    torch_texts = np.concatenate(outputs)
+
+    report = {
+        "images": len(images),
+        "batch_size": args.batch_size,
+        "clip": {
+            "torch": {
+                "image_latency": latency_summary(image_times),
+                "text_latency": latency_summary(text_times),
+            }
+        },
+    }
+
+    for quantized in variants:
+        name = "onnx_int8" if quantized else "onnx_fp32"
+        clip = OnnxClip(clip_dir, quantized=quantized)
+        def _onnx_images(batch):
+            return clip.image_features(preprocess_clip(batch, clip.processor.image_processor))
+        def _onnx_texts(batch):
+            inputs = clip.processor(text=batch, return_tensors="np", padding=True)
+            return clip.text_features(inputs["input_ids"], inputs["attention_mask"])
+
+        _onnx_images(images[:1])
+        outputs, image_times = timed_batches(_onnx_images, images, args.batch_size, args.repeats)
+        onnx_images = np.concatenate(outputs)
+        outputs, text_times = timed_batches(_onnx_texts, DEFAULT_CATEGORIES, len(DEFAULT_CATEGORIES), args.repeats)
+        onnx_texts = np.concatenate(outputs)
+
+        report["clip"][name] = {
+            "image_latency": latency_summary(image_times),
+            "text_latency": latency_summary(text_times),
+            "image_cosine": cosine_summary(torch_images, onnx_images),
+            "text_cosine": cosine_summary(torch_texts, onnx_texts),
+            "graph_mb": {
+                "vision": graph_size_mb(clip_dir, "vision", quantized),
+                "text": graph_size_mb(clip_dir, "text", quantized),
+            },
+        }
+
+    if args.captions:
+        blip_processor, blip_model = get_blip("cpu")
+        def _torch_captions(batch):
+            pixel_values = torch.from_numpy(preprocess_blip(batch, blip_processor.image_processor))
+            with torch.inference_mode():
+                output = blip_model.generate(pixel_values=pixel_values, max_new_tokens=args.max_new_tokens)
+            return blip_processor.batch_decode(output, skip_special_tokens=True)
+
+        outputs, caption_times = timed_batches(_torch_captions, images, args.batch_size, 1)
+        torch_captions = [caption for batch in outputs for caption in batch]
+        report["blip"] = {"torch": {"latency": latency_summary(caption_times)}}
+
+        for quantized in variants:
+            name = "onnx_int8" if quantized else "onnx_fp32"
+            blip = OnnxBlip(blip_dir, quantized=quantized)
+            def _onnx_captions(batch):
+                pixel_values = preprocess_blip(batch, blip.processor.image_processor)
+                return blip.generate(pixel_values, max_new_tokens=args.max_new_tokens)
+
+            outputs, caption_times = timed_batches(_onnx_captions, images, args.batch_size, 1)
+            captions = [caption for batch in outputs for caption in batch]
+            report["blip"][name] = {
+                "latency": latency_summary(caption_times),
+                "exact_match": float(np.mean([a == b for a, b in zip(torch_captions, captions)])),
+                "examples": [
+                    {"torch": a, "onnx": b} for a, b in list(zip(torch_captions, captions))[:3]
+                ],
+                "graph_mb": {
+                    "vision": graph_size_mb(blip_dir, "vision", quantized),
+                    "decoder": graph_size_mb(blip_dir, "decoder", quantized),
+                },
+            }
+
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Paridade e latência ONNX × PyTorch")
+    parser.add_argument("--images", default=None, help="Diretório com imagens (padrão: sintéticas)")
+    parser.add_argument("--count", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=0, help="Threads do PyTorch (0 = padrão)")
+    parser.add_argument("--captions", action="store_true", help="Comparar também as legendas do BLIP")
+    parser.add_argument("--max-new-tokens", type=int, default=30)
+    parser.add_argument("--output", default=None, help="Arquivo para gravar o JSON")
+    args = parser.parse_args()
+
+    report = run(args)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
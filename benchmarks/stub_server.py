@@ -0,0 +1,216 @@
+"""
+Inicia a aplicação com modelos substitutos (stubs) para benchmarks offline em CPU
+
+Os carregadores dos serviços são trocados por fora da aplicação, antes de
+subir o uvicorn: Whisper, Piper/Coqui, CLIP e BLIP viram modelos mínimos em
+NumPy que passam pelo registro de modelos e pelos executores como os reais,
+com um custo por chamada configurável. O pré-processamento de imagem, a
+codificação de áudio, as filas e o restante da aplicação são os de verdade.
+
+O CLIP e o BLIP usam o caminho do backend ONNX (VISION_BACKEND=onnx), que
+dispensa o PyTorch. As features de imagem vão para um diretório temporário.
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.stub_server --port 8001 --ollama-host http://127.0.0.1:11500 --whisper-ms 200
+"""
+import os
+import sys
+import time
+import hashlib
+import argparse
+import tempfile
+
+import numpy as np
+
+# Custo simulado de cada chamada de modelo: sleep (libera o GIL) ou spin (segura o GIL, como CPU pura)
+STUB_WORK = "sleep"
+
+def _work(milliseconds: float):
+    if milliseconds <= 0:
+        return
+    if STUB_WORK == "spin":
+        deadline = time.perf_counter() + milliseconds / 1000.0
+        while time.perf_counter() < deadline:
+            pass
+    else:
+        time.sleep(milliseconds / 1000.0)
+
+class StubWhisper:
+    def __init__(self, milliseconds: float):
+        self.milliseconds = milliseconds
+
+    def transcribe(self, audio, language=None, **kwargs):
+        if isinstance(audio, str) and not os.path.exists(audio):
+            raise FileNotFoundError(audio)
+        _work(self.milliseconds)  # Por janela de STT_WINDOW_SECONDS
+        return {"text": " transcrição de teste", "language": language or "pt"}
+
+class _PiperConfig:
+    sample_rate = 16000
+
+class StubPiperVoice:
+    """Gera um tom de 60 ms por caractere, em blocos como o Piper"""
+
+    config = _PiperConfig()
+
+    def __init__(self, milliseconds: float):
+        self.milliseconds = milliseconds
+
+    def synthesize_stream_raw(self, text: str):
+        _work(self.milliseconds)
+        samples = int(self.config.sample_rate * 0.06 * max(1, len(text)))
+        t = np.arange(samples, dtype=np.float32) / self.config.sample_rate
+        pcm = (np.sin(2 * np.pi * 220 * t) * 0.2 * 32767).astype("<i2").tobytes()
+        for start in range(0, len(pcm), 8192):
+            yield pcm[start:start + 8192]
+
+class _Synthesizer:
+    output_sample_rate = 22050
+
+class StubCoqui:
+    speakers = None
+    synthesizer = _Synthesizer()
+
+    def __init__(self, milliseconds: float):
+        self.milliseconds = milliseconds
+
+    def tts(self, text: str, speed: float = 1.0, speaker=None):
+        _work(self.milliseconds)
+        samples = int(self.synthesizer.output_sample_rate * 0.06 * max(1, len(text)) / max(speed, 0.1))
+        t = np.arange(samples, dtype=np.float32) / self.synthesizer.output_sample_rate
+        return np.sin(2 * np.pi * 220 * t) * 0.2
+
+class _ImageProcessor:
+    image_mean = [0.48145466, 0.4578275, 0.40821073]
+    image_std = [0.26862954, 0.26130258, 0.27577711]
+
+    def __init__(self, size, crop_size=None):
+        self.size = size
+        self.crop_size = crop_size
+
+class _TextProcessor:
+    """Tokenizador mínimo (hash das palavras), com a interface do processor do Hugging Face"""
+
+    def __init__(self, image_processor: _ImageProcessor, vocab_size: int = 4096):
+        self.image_processor = image_processor
+        self.vocab_size = vocab_size
+
+    def __call__(self, text=None, return_tensors="np", padding=True, **kwargs):
+        tokenized = [
+            [int(hashlib.md5(word.encode("utf-8")).hexdigest()[:6], 16) % self.vocab_size for word in item.lower().split()] or [0]
+            for item in text
+        ]
+        length = max(len(tokens) for tokens in tokenized)
+        input_ids = np.zeros((len(tokenized), length), dtype=np.int64)
+        attention_mask = np.zeros((len(tokenized), length), dtype=np.int64)
+        for row, tokens in enumerate(tokenized):
+            input_ids[row, :len(tokens)] = tokens
+            attention_mask[row, :len(tokens)] = 1
+        return {"input_ids": input_ids, "attention_mask": attention_mask}
+
+class StubClip:
+    """Projeções aleatórias fixas no lugar das torres de imagem e texto do CLIP"""
+
+    logit_scale = 100.0
+
+    def __init__(self, milliseconds: float, dim: int = 512):
+        self.milliseconds = milliseconds
+        self.processor = _TextProcessor(
+            _ImageProcessor({"shortest_edge": 224}, {"height": 224, "width": 224})
+        )
+        rng = np.random.default_rng(0)
+        self.image_projection = rng.standard_normal((3 * 16 * 16, dim)).astype(np.float32)
+        self.text_table = rng.standard_normal((self.processor.vocab_size, dim)).astype(np.float32)
+
+    def image_features(self, pixel_values: np.ndarray) -> np.ndarray:
+        _work(self.milliseconds)
+        n, channels, height, width = pixel_values.shape
+        pooled = pixel_values.reshape(n, channels, 16, height // 16, 16, width // 16).mean(axis=(3, 5))
+        return pooled.reshape(n, -1) @ self.image_projection
+
+    def text_features(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        _work(self.milliseconds / 4)
+        embedded = self.text_table[input_ids] * attention_mask[..., None]
+        return embedded.sum(axis=1) / np.maximum(attention_mask.sum(axis=1, keepdims=True), 1)
+
+class StubBlip:
+    """Legenda derivada do brilho médio, com custo simulado por lote"""
+
+    def __init__(self, milliseconds: float):
+        self.milliseconds = milliseconds
+        self.processor = _TextProcessor(_ImageProcessor({"height": 384, "width": 384}))
+
+    def generate(self, pixel_values: np.ndarray, prompt=None, max_new_tokens: int = 30):
+        _work(self.milliseconds)
+        captions = []
+        for brightness in pixel_values.mean(axis=(1, 2, 3)):
+            caption = "uma imagem clara" if brightness > 0 else "uma imagem escura"
+            captions.append(f"{prompt} {caption}" if prompt else caption)
+        return captions
+
+def install_stubs(args):
+    """Substitui os carregadores de modelo dos serviços pelos stubs"""
+    from app.services import stt, tts, vision, warmup
+    from app.services.executors import run_inference
+    from app.services.model_registry import registry
+
+    # Áudio "decodificado" com a duração de um WAV PCM 16 bits a 16 kHz do mesmo tamanho
+    stt._load_audio = lambda path: np.zeros(max(0, os.path.getsize(path) - 44) // 2, dtype=np.float32)
+    stt.get_whisper = lambda model_name="base": registry.get(
+        ("whisper-stub", model_name), lambda: StubWhisper(args.whisper_ms)
+    )
+    tts._get_piper_voice = lambda model_path: registry.get(
+        ("piper-stub", model_path), lambda: StubPiperVoice(args.piper_ms)
+    )
+    tts._get_coqui = lambda model_name: registry.get(
+        ("coqui-stub", model_name), lambda: StubCoqui(args.coqui_ms)
+    )
+
+    async def _resolve_piper_model(voice: str) -> str:
+        return os.path.join(tts.PIPER_MODELS_DIR, f"{voice}-stub.onnx")
+    tts._resolve_piper_model = _resolve_piper_model
+
+    async def _warm_piper():
+        await run_inference("tts", tts._synthesize_piper, "ok", await _resolve_piper_model("pt_BR-16000"))
+    warmup._warm_piper = _warm_piper
+
+    vision.get_clip_onnx = lambda: registry.get(("clip-stub",), lambda: StubClip(args.clip_ms))
+    vision.get_blip_onnx = lambda: registry.get(("blip-stub",), lambda: StubBlip(args.blip_ms))
+    vision.FEATURES_DIR = args.data_dir
+    vision.LABEL_SETS_PATH = os.path.join(args.data_dir, "label_sets.json")
+    vision.LABEL_EMBEDDINGS_DIR = os.path.join(args.data_dir, "label_embeddings")
+
+def main():
+    global STUB_WORK
+
+    parser = argparse.ArgumentParser(description="Aplicação com modelos substitutos para benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--ollama-host", default="http://127.0.0.1:11500")
+    parser.add_argument("--whisper-ms", type=float, default=200.0, help="Custo por janela de transcrição")
+    parser.add_argument("--piper-ms", type=float, default=30.0, help="Custo por síntese Piper")
+    parser.add_argument("--coqui-ms", type=float, default=150.0, help="Custo por síntese Coqui")
+    parser.add_argument("--clip-ms", type=float, default=20.0, help="Custo por lote de imagens no CLIP")
+    parser.add_argument("--blip-ms", type=float, default=150.0, help="Custo por lote de legendas no BLIP")
+    parser.add_argument("--work", choices=["sleep", "spin"], default="sleep", help="Como simular o custo")
+    parser.add_argument("--data-dir", default=None, help="Diretório das features de imagem (padrão: temporário)")
+    args = parser.parse_args()
+
+    STUB_WORK = args.work
+    args.data_dir = args.data_dir or tempfile.mkdtemp(prefix="bench-features-")
+
+    # Antes de importar a aplicação: configuração lida na importação dos módulos
+    os.environ["OLLAMA_HOST"] = args.ollama_host
+    os.environ["VISION_BACKEND"] = "onnx"
+    os.environ.setdefault("WARMUP_COMPONENTS", "piper,whisper,clip,blip,ollama")
+
+    install_stubs(args)
+
+    import uvicorn
+    from app.main import app
+
+    print(f"Stubs instalados; features em {args.data_dir}", file=sys.stderr)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Exporta CLIP (torres de imagem e de texto) e BLIP (legendas) para ONNX
+
+Para cada modelo grava, em ONNX_MODELS_DIR/<modelo>/, os grafos .onnx, as
+versões quantizadas em int8 (quantização dinâmica dos pesos, com --int8),
+os arquivos do processador e um export.json com os parâmetros de que o
+backend ONNX precisa. Use VISION_BACKEND=onnx para executá-los.
+
+Uso (a partir da raiz do projeto):
+    python -m scripts.export_onnx [--models clip,blip] [--int8] [--opset 14]
+"""
+import os
+import json
+import argparse
+
+import torch
+
+from app.services.vision import BLIP_MODEL_ID, CLIP_MODEL_ID
+from app.services.vision_onnx import ONNX_MODELS_DIR
+
+class _ClipVision(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model.get_image_features(pixel_values=pixel_values)
+
+class _ClipText(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+class _BlipVision(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.vision_model = model.vision_model
+
+    def forward(self, pixel_values):
+        return self.vision_model(pixel_values=pixel_values, return_dict=False)[0]
+
+class _BlipDecoder(torch.nn.Module):
+    """Um passo do decodificador: retorna apenas os logits da última posição"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.text_decoder = model.text_decoder
+
+    def forward(self, input_ids, attention_mask, encoder_hidden_states):
+        logits = self.text_decoder(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            encoder_hidden_states=encoder_hidden_states,
+            return_dict=False
+        )[0]
+        return logits[:, -1, :]
+
+def _export(module, inputs, path, input_names, output_names, dynamic_axes, opset):
+    print(f"Exportando {path}...")
+    with torch.inference_mode():
+        torch.onnx.export(
+            module,
+            inputs,
+            path,
+            input_names=input_names,
+            output_names=output_names,
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True
+        )
+
+def quantize(path: str) -> str:
+    """Quantização dinâmica int8 dos pesos; retorna o caminho do grafo quantizado"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    output = path[:-len(".onnx")] + ".int8.onnx"
+    print(f"Quantizando {output}...")
+    quantize_dynamic(path, output, weight_type=QuantType.QInt8)
+    return output
+
+def export_clip(output_dir: str, opset: int, int8: bool):
+    from transformers import CLIPModel, CLIPProcessor
+
+    os.makedirs(output_dir, exist_ok=True)
+    processor = CLIPProcessor.from_pretrained(CLIP_MODEL_ID)
+    model = CLIPModel.from_pretrained(CLIP_MODEL_ID).eval()
+    processor.save_pretrained(output_dir)
+
+    crop = processor.image_processor.crop_size
+    pixel_values = torch.zeros(1, 3, crop["height"], crop["width"])
+    _export(
+        _ClipVision(model), (pixel_values,), os.path.join(output_dir, "vision.onnx"),
+        ["pixel_values"], ["image_embeds"],
+        {"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+        opset
+    )
+
+    text_inputs = processor(text=["uma foto", "um desenho de um gato"], return_tensors="pt", padding=True)
+    _export(
+        _ClipText(model), (text_inputs["input_ids"], text_inputs["attention_mask"]),
+        os.path.join(output_dir, "text.onnx"),
+        ["input_ids", "attention_mask"], ["text_embeds"],
+        {"input_ids": {0: "batch", 1: "sequence"}, "attention_mask": {0: "batch", 1: "sequence"},
+         "text_embeds": {0: "batch"}},
+        opset
+    )
+
+    with open(os.path.join(output_dir, "export.json"), "w") as f:
+        json.dump({
+            "model_id": CLIP_MODEL_ID,
+            "opset": opset,
+            "logit_scale": float(model.logit_scale.exp().item())
+        }, f, indent=2)
+
+    if int8:
+        for name in ("vision", "text"):
+            quantize(os.path.join(output_dir, f"{name}.onnx"))
+
+def export_blip(output_dir: str, opset: int, int8: bool):
+    from transformers import BlipForConditionalGeneration, BlipProcessor
+
+    os.makedirs(output_dir, exist_ok=True)
+    processor = BlipProcessor.from_pretrained(BLIP_MODEL_ID)
+    model = BlipForConditionalGeneration.from_pretrained(BLIP_MODEL_ID).eval()
+    processor.save_pretrained(output_dir)
+
+    size = processor.image_processor.size
+    pixel_values = torch.zeros(1, 3, size["height"], size["width"])
+    _export(
+        _BlipVision(model), (pixel_values,), os.path.join(output_dir, "vision.onnx"),
+        ["pixel_values"], ["image_embeds"],
+        {"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+        opset
+    )
+
+    with torch.inference_mode():
+        image_embeds = _BlipVision(model)(pixel_values)
+    input_ids = torch.tensor([[model.config.text_config.bos_token_id, 1037, 2158]])
+    _export(
+        _BlipDecoder(model), (input_ids, torch.ones_like(input_ids), image_embeds),
+        os.path.join(output_dir, "decoder.onnx"),
+        ["input_ids", "attention_mask", "encoder_hidden_states"], ["logits"],
+        {"input_ids": {0: "batch", 1: "sequence"}, "attention_mask": {0: "batch", 1: "sequence"},
+         "encoder_hidden_states": {0: "batch"}, "logits": {0: "batch"}},
+        opset
+    )
+
+    with open(os.path.join(output_dir, "export.json"), "w") as f:
+        json.dump({
+            "model_id": BLIP_MODEL_ID,
+            "opset": opset,
+            "bos_token_id": model.config.text_config.bos_token_id,
+            "sep_token_id": model.config.text_config.sep_token_id,
+            "pad_token_id": model.config.text_config.pad_token_id
+        }, f, indent=2)
+
+    if int8:
+        for name in ("vision", "decoder"):
+            quantize(os.path.join(output_dir, f"{name}.onnx"))
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta CLIP e BLIP para ONNX")
+    parser.add_argument("--models", default="clip,blip", help="Modelos a exportar, separados por vírgula")
+    parser.add_argument("--output", default=ONNX_MODELS_DIR)
+    parser.add_argument("--opset", type=int, default=14)
+    parser.add_argument("--int8", action="store_true", help="Gerar também as versões quantizadas em int8")
+    args = parser.parse_args()
+
+    exporters = {"clip": export_clip, "blip": export_blip}
+    for name in [name.strip() for name in args.models.split(",") if name.strip()]:
+        if name not in exporters:
+            parser.error(f"Modelo desconhecido: {name}")
+        exporters[name](os.path.join(args.output, name), args.opset, args.int8)
+    print("Exportação concluída")
+
+if __name__ == "__main__":
+    main()
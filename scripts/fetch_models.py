@@ -0,0 +1,70 @@
+"""
+Baixa (ou copia de um espelho local) e verifica os artefatos de modelo do manifesto
+
+Útil para provisionar imagens Docker e ambientes offline antes de iniciar a
+aplicação. Com --update-manifest, grava no manifesto o tamanho e o sha256 dos
+artefatos que ainda não os declaram (a partir dos arquivos obtidos).
+
+Uso (a partir da raiz do projeto):
+    python -m scripts.fetch_models [--group piper] [--mirror /caminho/espelho] [--update-manifest]
+"""
+import os
+import json
+import asyncio
+import argparse
+import hashlib
+
+from app.services.artifacts import MODEL_MANIFEST_PATH, MODEL_MIRROR_DIR, ensure_artifacts, load_manifest
+
+def update_manifest(manifest_path: str, paths: dict) -> int:
+    """Preenche size/sha256 ausentes no manifesto; retorna quantas entradas mudaram"""
+    with open(manifest_path, "r") as f:
+        manifest = json.load(f)
+
+    updated = 0
+    for entry in manifest["artifacts"]:
+        path = paths.get(entry["name"])
+        if not path or (entry.get("size") is not None and entry.get("sha256")):
+            continue
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        entry["size"] = os.path.getsize(path)
+        entry["sha256"] = digest.hexdigest()
+        updated += 1
+
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.write("\n")
+    os.replace(manifest_path + ".tmp", manifest_path)
+    return updated
+
+def main():
+    parser = argparse.ArgumentParser(description="Obtém e verifica os artefatos de modelo")
+    parser.add_argument("--group", default=None, help="Apenas os artefatos deste grupo (ex.: piper)")
+    parser.add_argument("--mirror", default=MODEL_MIRROR_DIR, help="Diretório local consultado antes da rede")
+    parser.add_argument("--concurrency", type=int, default=None)
+    parser.add_argument("--update-manifest", action="store_true", help="Gravar size/sha256 ausentes no manifesto")
+    args = parser.parse_args()
+
+    kwargs = {"group": args.group, "mirror_dir": args.mirror}
+    if args.concurrency:
+        kwargs["concurrency"] = args.concurrency
+    paths = asyncio.run(ensure_artifacts(**kwargs))
+    for name, path in paths.items():
+        print(f"{name}: {path}")
+
+    if args.update_manifest:
+        updated = update_manifest(MODEL_MANIFEST_PATH, paths)
+        print(f"{updated} entradas atualizadas em {MODEL_MANIFEST_PATH}")
+
+    unverified = [artifact.name for artifact in load_manifest() if not artifact.sha256 and artifact.name in paths]
+    if unverified:
+        print(
+            f"Sem sha256 no manifesto (verificados pelo sha256 registrado no download): {', '.join(unverified)}; "
+            "use --update-manifest e versione o manifesto"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Migra features legadas (.npz + .json por imagem) para o armazenamento consolidado
+
+O armazenamento é aberto com acesso exclusivo: a migração se recusa a rodar
+enquanto o servidor (ou outro processo) estiver com ele aberto.
+
+Uso (a partir da raiz do projeto, com o servidor parado):
+    python -m scripts.migrate_features [--dir app/models/features] [--dtype float32] [--delete]
+"""
+import os
+import sys
+import json
+import argparse
+from glob import glob
+import numpy as np
+
+from app.services.vision import FEATURES_DIR, FEATURES_DTYPE
+from app.services.vector_store import VectorStore
+from app.services.file_lock import LockBusy
+
+def migrate(features_dir: str, dtype: str, batch_size: int = 1024, delete: bool = False) -> int:
+    """
+    Copia os pares .npz/.json para o VectorStore, ignorando ids já migrados
+
+    Raises:
+        LockBusy: Se outro processo (ex.: o servidor) estiver com o armazenamento aberto
+    """
+    store = VectorStore(features_dir, dtype=dtype, exclusive=True)
+
+    pending = []
+    for feature_file in sorted(glob(os.path.join(features_dir, "*.npz"))):
+        feature_id = os.path.basename(feature_file)[:-len(".npz")]
+        if feature_id not in store:
+            pending.append(feature_id)
+
+    migrated = 0
+    for start in range(0, len(pending), batch_size):
+        batch_ids = pending[start:start + batch_size]
+        vectors = []
+        metadatas = []
+        for feature_id in batch_ids:
+            features = np.load(os.path.join(features_dir, f"{feature_id}.npz"))["features"]
+            vectors.append(features / np.linalg.norm(features))
+
+            metadata = {"id": feature_id}
+            metadata_file = os.path.join(features_dir, f"{feature_id}.json")
+            if os.path.exists(metadata_file):
+                with open(metadata_file, "r") as f:
+                    metadata = json.load(f)
+            metadatas.append(metadata)
+
+        store.add_many(batch_ids, np.stack(vectors), metadatas)
+        migrated += len(batch_ids)
+        print(f"{migrated}/{len(pending)} features migradas")
+
+    if delete:
+        for row in range(len(store)):
+            feature_id = store.get_id(row)
+            for extension in (".npz", ".json"):
+                path = os.path.join(features_dir, f"{feature_id}{extension}")
+                if os.path.exists(path):
+                    os.remove(path)
+
+    return migrated
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=FEATURES_DIR, help="Diretório das features")
+    parser.add_argument("--dtype", default=FEATURES_DTYPE, choices=["float32", "float16"])
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--delete", action="store_true", help="Remover os arquivos legados após migrar")
+    args = parser.parse_args()
+
+    try:
+        total = migrate(args.dir, args.dtype, args.batch_size, args.delete)
+    except LockBusy:
+        print(f"Armazenamento em {args.dir} em uso por outro processo; pare o servidor antes de migrar", file=sys.stderr)
+        sys.exit(1)
+    print(f"Migração concluída: {total} features adicionadas")
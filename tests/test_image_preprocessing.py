@@ -0,0 +1,45 @@
+import io
+
+import pytest
+from PIL import Image
+
+from app.services.image_preprocessing import decode_image
+
+def _encode(image, format="PNG") -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=format)
+    return buffer.getvalue()
+
+@pytest.mark.parametrize("mode", ["P", "1", "I;16", "L", "RGBA", "RGB"])
+def test_decode_image_reduced_modes(mode):
+    image = Image.new("RGB", (1024, 768), (200, 30, 30))
+    if mode == "P":
+        image = image.convert("P", palette=Image.ADAPTIVE)
+    else:
+        image = image.convert(mode)
+
+    decoded = decode_image(_encode(image), target_size=224)
+
+    assert decoded.mode == "RGB"
+    assert min(decoded.size) >= 224
+    assert decoded.size == (-(-1024 // 3), 768 // 3)
+
+def test_decode_image_full_resolution():
+    image = Image.new("P", (64, 48))
+    decoded = decode_image(_encode(image))
+    assert decoded.mode == "RGB"
+    assert decoded.size == (64, 48)
+
+def test_decode_image_jpeg_draft():
+    image = Image.new("RGB", (2048, 1536), (10, 120, 240))
+    decoded = decode_image(_encode(image, "JPEG"), target_size=224)
+    assert decoded.mode == "RGB"
+    assert min(decoded.size) >= 224
+    assert decoded.size[0] < 2048
+
+def test_decode_image_rejects_oversized(monkeypatch):
+    import app.services.image_preprocessing as image_preprocessing
+
+    monkeypatch.setattr(image_preprocessing, "VISION_MAX_IMAGE_PIXELS", 100)
+    with pytest.raises(ValueError):
+        decode_image(_encode(Image.new("RGB", (20, 20))))